@@ -51,12 +51,16 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt', # ★追加
     'reservations',  # この行が追加されているか確認！
     'corsheaders',
+    'django_celery_beat',
     # あなたのカスタムアプリなど
     # 'your_app_name',
 ]
 
 MIDDLEWARE = [
+    'reservations.middleware.RequestIdMiddleware', # リクエストの相関IDを発行しログに付与
     'corsheaders.middleware.CorsMiddleware',
+    'reservations.middleware.RequestTimingMiddleware', # DB・外部API等の所要時間を計測しServer-Timingヘッダーに出力
+    'reservations.middleware.CompressionMiddleware', # Accept-Encodingに応じてbrotli/gzipで圧縮
     'django.middleware.security.SecurityMiddleware', # ここに厳密に配置
     'whitenoise.middleware.WhiteNoiseMiddleware', # このミドルウェアはDjangoアプリが静的ファイルを配信する時に使われます
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -64,6 +68,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware', # CORSがCSRFより前にあることを確認
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'reservations.middleware.RequestProfilingMiddleware', # 管理者がフラグを付けたリクエストだけプロファイルを取得
+    'reservations.middleware.TrafficCaptureMiddleware', # TRAFFIC_CAPTURE_PATH 設定時のみ /api/ のリクエストを記録
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -102,8 +108,59 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'reservations.renderers.FastJSONRenderer', # シリアライズ時間を計測するJSONレンダラー（一覧はorjsonで出力）
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# パフォーマンス計測（Server-Timingヘッダーとメトリクス）
+# 内訳は内部情報のため、既定では DEBUG 時と職員のリクエストにだけ付ける（True で全リクエストに付ける。リプレイ先の環境など）
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'False') == 'True'
+# /api/metrics/ にアクセスするためのBearerトークン（未設定ならメトリクスは公開しない）
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# 全Webワーカーの計測値を合算するRedis（未設定ならワーカーごとの値になるため、ワーカーが1つの構成でのみ使う）
+METRICS_REDIS_URL = os.environ.get('METRICS_REDIS_URL', os.environ.get('REDIS_URL'))
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '5')) # 各ワーカーが計測値をRedisに書き込む間隔
+
+# オンデマンドプロファイラ（X-Profile: 1 または ?_profile=1 を付けた管理者のリクエストのみ）
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '1.0')) # フラグ付きリクエストのうち実際に取得する割合
+PROFILING_INTERVAL_SECONDS = float(os.environ.get('PROFILING_INTERVAL_SECONDS', '0.005')) # スタックのサンプリング間隔
+
+# ロギング（JSON形式。書き出しは別スレッドで行い、リクエストを待たせない）
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '0.1')) # DEBUGログを残す割合
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'reservations.structured_logging.RequestIdFilter'},
+        'debug_sampling': {
+            '()': 'reservations.structured_logging.DebugSamplingFilter',
+            'sample_rate': LOG_DEBUG_SAMPLE_RATE,
+        },
+    },
+    'handlers': {
+        'async_json': {
+            'class': 'reservations.structured_logging.AsyncQueueHandler',
+            'stream': 'ext://sys.stderr',
+            'filters': ['request_id', 'debug_sampling'],
+        },
+    },
+    'root': {'handlers': ['async_json'], 'level': 'WARNING'},
+    'loggers': {
+        'django': {'handlers': ['async_json'], 'level': 'INFO', 'propagate': False},
+        'reservations': {'handlers': ['async_json'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# 起動時（django.setup() とURL読み込み）のimport時間の上限。check_import_time コマンドで確認する
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', '400'))
+
+# トラフィックキャプチャ（個人情報を除いたリクエストログ。replay_traffic コマンドで再生する）
+TRAFFIC_CAPTURE_PATH = os.environ.get('TRAFFIC_CAPTURE_PATH', '') # 空なら記録しない
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', '1.0'))
+
 # Google Calendar API & LINE API Keys
 GOOGLE_CALENDAR_ID = os.environ.get('GOOGLE_CALENDAR_ID')
 ADMIN_LINE_CHANNEL_ACCESS_TOKEN = os.environ.get('ADMIN_LINE_CHANNEL_ACCESS_TOKEN')
@@ -126,12 +183,53 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),  # 15分に短縮
     'REFRESH_TOKEN_LIFETIME': timedelta(hours=1),    # 1時間に短縮
     'ROTATE_REFRESH_TOKENS': True,  # リフレッシュトークンを回転させる
-    'BLACKLIST_AFTER_ROTATION': True,  # 古いリフレッシュトークンをブラックリストに追加
+    'BLACKLIST_AFTER_ROTATION': True,  # 古いリフレッシュトークンを失効させる（reservations.revocation）
+    'AUTH_TOKEN_CLASSES': ('reservations.tokens.RevocableAccessToken',),  # 失効済みトークンを拒否する
+    'TOKEN_REFRESH_SERIALIZER': 'reservations.tokens.RevocableTokenRefreshSerializer',
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id', # ★ 'line_user_id' に変更していた場合は元に戻す！
     'USER_AUTHENTICATION_RULE': 'rest_framework_simplejwt.authentication.default_user_authentication_rule',
 }
 
+# キャッシュ（条件付きGET用のテーブルのバージョン、LINEの公開鍵など）
+# 複数プロセスで同じ値を参照する必要があるため、本番ではRedisを使う
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', os.environ.get('REDIS_URL'))
+if CACHE_REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+# 条件付きGET（ETag / 304）はテーブルのバージョンを全プロセス（複数のWebワーカー・Celery）で共有できる場合のみ有効にする
+# プロセスごとのキャッシュでは他のプロセスの更新が見えず、変更されたデータに304を返し続けてしまうため
+CONDITIONAL_GET_ENABLED = os.environ.get('CONDITIONAL_GET_ENABLED', 'True' if CACHE_REDIS_URL else 'False') == 'True'
+
+# JWTの失効管理（jtiをRedisに保存し、プロセス内のBloomフィルタで問い合わせを減らす）
+TOKEN_REVOCATION_REDIS_URL = os.environ.get('TOKEN_REVOCATION_REDIS_URL', os.environ.get('REDIS_URL')) # 未設定はDEBUG時のみ可（プロセス内メモリ）
+TOKEN_REVOCATION_REFRESH_SECONDS = float(os.environ.get('TOKEN_REVOCATION_REFRESH_SECONDS', '5')) # Bloomフィルタの再読み込み間隔
+TOKEN_REVOCATION_BLOOM_CAPACITY = int(os.environ.get('TOKEN_REVOCATION_BLOOM_CAPACITY', '100000'))
+
+# Celeryの設定（リマインダー等の定期実行）
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+CELERY_TIMEZONE = 'Asia/Tokyo'
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'send-due-reminders': {
+        'task': 'reservations.tasks.send_due_reminders',
+        'schedule': timedelta(minutes=5),
+    },
+    'drain-email-outbox': {
+        'task': 'reservations.tasks.drain_email_outbox',
+        'schedule': timedelta(seconds=30),
+    },
+    'flush-staff-alerts': {
+        'task': 'reservations.tasks.flush_staff_alerts',
+        'schedule': timedelta(minutes=1),
+    },
+    'refresh-elapsed-customer-stats': {
+        'task': 'reservations.tasks.refresh_elapsed_customer_stats',
+        'schedule': timedelta(minutes=10),
+    },
+}
+
 
 if os.environ.get('DEBUG') == 'True' :
     CORS_ALLOWED_ORIGINS = [
@@ -183,6 +281,13 @@ DEFAULT_FILE_STORAGE = 'storages.backends.gcloud.GoogleCloudStorage'
 GS_BUCKET_NAME = os.environ.get('GS_BUCKET_NAME')
 GS_PROJECT_ID = os.environ.get('GS_PROJECT_ID')
 GS_UNIFORM_BUCKET_LEVEL_ACCESS = True
+
+# 管理画面から送信する画像の直接アップロード先（'gcs' / 'local'。未設定ならGCSが使えればGCS、なければローカル）
+UPLOAD_STORAGE = os.environ.get('UPLOAD_STORAGE') or None
+# アップロードできる画像の最大サイズ（バイト）
+IMAGE_UPLOAD_MAX_BYTES = int(os.environ.get('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+# アップロード用の署名付きURLの有効期間（秒）
+UPLOAD_URL_EXPIRES_SECONDS = int(os.environ.get('UPLOAD_URL_EXPIRES_SECONDS', 300))
 AUTH_USER_MODEL = 'reservations.User'
 
 SESSION_COOKIE_AGE = 3600
@@ -10,6 +10,7 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
+from reservations.views import TokenRevokeView
 # ★ 1. 以下の3行を追加 ★
 
 class HealthCheckAPIView(APIView):
@@ -31,6 +32,7 @@ urlpatterns = [
     # 3. 認証トークン取得用のAPI
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
     # 顧客向けAPIのエンドポイント
     path('api/', include('reservations.urls')),
 ]
@@ -0,0 +1,21 @@
+# backend/reservations/adapters/__init__.py
+"""
+外部SDK（Google Cloud Storage・Google Calendar・LINE Bot）へのアダプタ。
+
+SDKのimportとクライアントの生成は初回利用時まで遅延させる。
+これにより django.setup() とURL読み込み（=プロセス起動・ワーカーのfork）が重いSDKの読み込みを待たず、
+SDKが入っていない開発環境でも is_available() で判定して処理を省略できる。
+"""
+import importlib.util
+
+
+def module_available(name):
+    """
+    モジュールがインストールされているかをimportせずに判定する。
+    'google.cloud.storage' のようなサブモジュールは、親パッケージがなければ find_spec が
+    ModuleNotFoundError を送出するため、その場合もインストールされていないとみなす。
+    """
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
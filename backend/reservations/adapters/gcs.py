@@ -0,0 +1,71 @@
+# backend/reservations/adapters/gcs.py
+"""Google Cloud Storage へのアップロード・署名付きURLの発行"""
+import os
+import uuid
+from datetime import timedelta
+from functools import lru_cache
+
+from . import module_available
+from ..instrumentation import track
+
+# LINEで送受信する画像を保存するバケット
+LINE_IMAGE_BUCKET = os.environ.get('GCS_LINE_IMAGE_BUCKET', 'JELLO-line-images')
+
+
+@lru_cache(maxsize=None)
+def is_available():
+    """google-cloud-storage がインストールされているか（importせずに判定する）"""
+    return module_available('google.cloud.storage')
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """storage.Client を初回呼び出し時に生成し、以降は使い回す"""
+    from google.cloud import storage
+    return storage.Client()
+
+
+def _blob(name, bucket_name=None):
+    return get_client().bucket(bucket_name or LINE_IMAGE_BUCKET).blob(name)
+
+
+def upload_file(prefix, fileobj, bucket_name=None):
+    """アップロードされたファイルを prefix/<uuid>_<ファイル名> に保存し、公開URLを返す"""
+    blob = _blob(f'{prefix}/{uuid.uuid4()}_{fileobj.name}', bucket_name)
+    with track('storage'):
+        blob.upload_from_file(fileobj)
+    return blob.public_url
+
+
+def upload_bytes(name, data, content_type, bucket_name=None):
+    """バイト列を name に保存し、公開URLを返す"""
+    blob = _blob(name, bucket_name)
+    with track('storage'):
+        blob.upload_from_string(data, content_type=content_type)
+    return blob.public_url
+
+
+def public_url(name, bucket_name=None):
+    return _blob(name, bucket_name).public_url
+
+
+def signed_upload_url(name, content_type, expires_seconds, max_bytes, bucket_name=None):
+    """
+    name へ直接PUTでアップロードするためのV4署名付きURLと、PUT時に付けるヘッダーを返す。
+    サイズの上限は x-goog-content-length-range で、署名に含めてGCS側で検証させる。
+    """
+    headers = {'x-goog-content-length-range': f'0,{max_bytes}'}
+    url = _blob(name, bucket_name).generate_signed_url(
+        version='v4', expiration=timedelta(seconds=expires_seconds), method='PUT',
+        content_type=content_type, headers=headers,
+    )
+    return url, {**headers, 'Content-Type': content_type}
+
+
+def object_metadata(name, bucket_name=None):
+    """オブジェクトのサイズとContent-Typeを返す（中身は取得しない）。存在しなければNone"""
+    with track('storage'):
+        blob = get_client().bucket(bucket_name or LINE_IMAGE_BUCKET).get_blob(name)
+    if blob is None:
+        return None
+    return {'size': blob.size, 'content_type': blob.content_type}
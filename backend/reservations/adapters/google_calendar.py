@@ -0,0 +1,60 @@
+# backend/reservations/adapters/google_calendar.py
+"""Google Calendar API"""
+import threading
+from functools import lru_cache
+
+from . import module_available
+from ..instrumentation import track
+
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+# バッチリクエスト1回にまとめられる最大件数
+BATCH_LIMIT = 50
+
+# APIクライアント（httplib2）はスレッドセーフではないため、スレッドごとに使い回す
+_local = threading.local()
+
+
+@lru_cache(maxsize=None)
+def is_available():
+    """google-auth と google-api-python-client がインストールされているか（importせずに判定する）"""
+    return all(module_available(name) for name in ('google.auth', 'googleapiclient'))
+
+
+def get_service():
+    """カレンダーAPIのクライアントを初回呼び出し時に生成する（認証とディスカバリー文書の読み込みは1回だけ）"""
+    service = getattr(_local, 'service', None)
+    if service is None:
+        from google.auth import default as google_auth_default
+        from googleapiclient.discovery import build
+
+        # 環境変数 GOOGLE_APPLICATION_CREDENTIALS などから認証情報を自動で取得する
+        credentials, _ = google_auth_default(scopes=SCOPES)
+        service = _local.service = build('calendar', 'v3', credentials=credentials, cache_discovery=False)
+    return service
+
+
+def insert_event(calendar_id, event):
+    """イベントを登録し、APIの応答を返す"""
+    with track('http-www.googleapis.com'):
+        return get_service().events().insert(calendarId=calendar_id, body=event).execute()
+
+
+def insert_events(calendar_id, events):
+    """
+    複数のイベントをバッチリクエスト（HTTPリクエスト1回につき最大 BATCH_LIMIT 件）で登録する。
+    失敗したイベントの (events 内の位置, 例外) のリストを返す。
+    """
+    service = get_service()
+    failures = []
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            failures.append((int(request_id), exception))
+
+    for start in range(0, len(events), BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=callback)
+        for index, event in enumerate(events[start:start + BATCH_LIMIT], start):
+            batch.add(service.events().insert(calendarId=calendar_id, body=event), request_id=str(index))
+        with track('http-www.googleapis.com'):
+            batch.execute()
+    return failures
@@ -0,0 +1,45 @@
+# backend/reservations/adapters/line_bot.py
+"""LINE Messaging API（line-bot-sdk）"""
+from functools import lru_cache
+
+from django.conf import settings
+
+from . import module_available
+
+
+@lru_cache(maxsize=None)
+def is_available():
+    """line-bot-sdk がインストールされているか（importせずに判定する）"""
+    return module_available('linebot')
+
+
+@lru_cache(maxsize=None)
+def admin_api():
+    """管理者（職員）向けチャネルの LineBotApi。初回呼び出し時に生成する"""
+    from linebot import LineBotApi
+    return LineBotApi(settings.ADMIN_LINE_CHANNEL_ACCESS_TOKEN)
+
+
+@lru_cache(maxsize=None)
+def customer_api():
+    """顧客向けチャネルの LineBotApi。初回呼び出し時に生成する"""
+    from linebot import LineBotApi
+    return LineBotApi(settings.CUSTOMER_LINE_CHANNEL_ACCESS_TOKEN)
+
+
+def text_message(text):
+    from linebot.models import TextSendMessage
+    return TextSendMessage(text=text)
+
+
+def image_message(image_url):
+    from linebot.models import ImageSendMessage
+    return ImageSendMessage(original_content_url=image_url, preview_image_url=image_url)
+
+
+def is_api_error(error):
+    """LINE APIがエラーを返したことを示す例外か"""
+    if not is_available():
+        return False
+    from linebot.exceptions import LineBotApiError
+    return isinstance(error, LineBotApiError)
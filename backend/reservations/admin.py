@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Salon, Service, Reservation, NotificationSetting, AvailableTimeSlot, Customer # ← Customerをインポート
+from .models import Salon, Service, Reservation, ReservationChange, NotificationSetting, AvailableTimeSlot, Customer, EmailOutbox # ← Customerをインポート
 
 admin.site.site_header = "JELLO管理画面 - デプロイテスト成功"
 # Salon, Service, Reservation, NotificationSetting の登録
@@ -18,4 +18,27 @@ class ReservationAdmin(admin.ModelAdmin):
     list_display = ('customer', 'service', 'start_time', 'status') # ← customer_nameからcustomerに変更
     list_filter = ('status', 'start_time', 'service')
     search_fields = ('customer__name', 'customer__email', 'reservation_number') # ← 顧客名やメールで検索できるように
-    readonly_fields = ('reservation_number',)
\ No newline at end of file
+    readonly_fields = ('reservation_number',)
+
+@admin.register(ReservationChange)
+class ReservationChangeAdmin(admin.ModelAdmin):
+    list_display = ('seq', 'reservation_number', 'kind', 'old_status', 'status', 'changed_at')
+    list_filter = ('kind', 'status')
+    search_fields = ('reservation_number',)
+
+    # 追記専用のログなので管理画面からは変更させない
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to_email', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
@@ -0,0 +1,74 @@
+# backend/reservations/calendar_events.py
+"""
+確定した予約のGoogleカレンダー（GOOGLE_CALENDAR_ID）への登録。
+
+予約1件の確定では AdminReservationViewSet から insert_event() で直接登録する。
+一括操作では、コミット後に予約IDをまとめて Celery タスク（tasks.add_calendar_events）に渡し、
+add_events() がバッチリクエストで登録する（APIリクエストの中でGoogleのAPIを呼ばない）。
+"""
+import logging
+import os
+
+from django.db import transaction
+
+from .adapters import google_calendar
+from .models import Reservation
+
+logger = logging.getLogger(__name__)
+
+
+def get_calendar_id():
+    """登録先のカレンダーID。SDKがない・未設定の場合は None"""
+    if not google_calendar.is_available():
+        logger.warning("Google Cloud SDKが利用できません。")
+        return None
+    calendar_id = os.environ.get('GOOGLE_CALENDAR_ID')
+    if not calendar_id:
+        logger.warning("環境変数 GOOGLE_CALENDAR_ID が設定されていません。")
+    return calendar_id or None
+
+
+def enqueue_add_events(reservation_ids):
+    """コミット後に、予約のカレンダー登録を1つのCeleryタスクとしてまとめて積む"""
+    if not reservation_ids or not (google_calendar.is_available() and os.environ.get('GOOGLE_CALENDAR_ID')):
+        return
+    # tasks はこのモジュールをimportするため、ここでimportする
+    from .tasks import add_calendar_events
+
+    def enqueue():
+        try:
+            add_calendar_events.delay(list(reservation_ids))
+        except Exception as e:
+            logger.error(f"Googleカレンダー登録タスクの登録に失敗しました: {e}")
+
+    transaction.on_commit(enqueue)
+
+
+def build_event(reservation, customer):
+    """予約のカレンダーイベント（サービス名は予約時点のもの）"""
+    return {
+        'summary': f"【予約】{customer.name}様 ({reservation.service_name})",
+        'description': f"予約番号: {reservation.reservation_number}\n連絡先: {customer.email or 'N/A'}",
+        'start': {'dateTime': reservation.start_time.isoformat(), 'timeZone': 'Asia/Tokyo'},
+        'end': {'dateTime': reservation.end_time.isoformat(), 'timeZone': 'Asia/Tokyo'},
+    }
+
+
+def add_events(reservation_ids):
+    """予約IDのリストのうち、確定済みで顧客のいる予約をまとめて登録し、登録した件数を返す"""
+    calendar_id = get_calendar_id()
+    if not calendar_id:
+        return 0
+    reservations = list(
+        Reservation.objects.filter(pk__in=reservation_ids, status='confirmed', customer__isnull=False)
+        .select_related('customer').order_by('start_time')
+    )
+    if not reservations:
+        return 0
+    failures = google_calendar.insert_events(
+        calendar_id, [build_event(reservation, reservation.customer) for reservation in reservations]
+    )
+    for index, error in failures:
+        logger.error(f"Googleカレンダーへの登録に失敗しました (予約番号: {reservations[index].reservation_number}): {error}")
+    logger.info(f"Googleカレンダーにイベントを {len(reservations) - len(failures)} 件登録しました")
+    return len(reservations) - len(failures)
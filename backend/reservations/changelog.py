@@ -0,0 +1,118 @@
+# backend/reservations/changelog.py
+"""
+予約の変更ログ（ReservationChange）の書き込みと読み出し。
+
+Reservation.save() / delete() の中では signals.py から record_change() が呼ばれ、保存と同じトランザクションで
+ログが書かれる。QuerySet.update() / bulk_create() などシグナルが発生しない一括更新では、
+同じトランザクションの中で record_changes() を呼ぶこと。
+
+seq は SequenceCounter の行を UPDATE して採番する。行ロックはコミットまで保持されるため、
+あるトランザクションが採番した番号より小さい番号が、後からコミットされて見えるようになることはない。
+そのため読み手は「最後に読んだ seq より大きいもの」を読むだけで、変更を取りこぼさずに追える。
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ReservationChange, SequenceCounter
+
+SEQUENCE_NAME = 'reservation_change'
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def _increment_returning(name, count):
+    """UPDATE ... RETURNING で、加算と加算後の値の取得を1回のクエリで行う（PostgreSQL / SQLite 3.35以降）"""
+    table = connection.ops.quote_name(SequenceCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {table} SET value = value + %s WHERE name = %s RETURNING value', [count, name])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def supports_update_returning():
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+    )
+
+
+def allocate(count, name=SEQUENCE_NAME):
+    """count 個の連番を確保し、その先頭の番号を返す（トランザクション内で呼ぶこと）"""
+    if supports_update_returning():
+        value = _increment_returning(name, count)
+    else:
+        value = None
+        if SequenceCounter.objects.filter(name=name).update(value=F('value') + count):
+            value = SequenceCounter.objects.get(name=name).value
+    if value is None:
+        # 採番用の行がまだない場合（マイグレーションを使わないテスト用DBなど）
+        SequenceCounter.objects.get_or_create(name=name)
+        SequenceCounter.objects.filter(name=name).update(value=F('value') + count)
+        value = SequenceCounter.objects.get(name=name).value
+    return value - count + 1
+
+
+def build_change(reservation, kind, old_status=''):
+    """予約の現在の内容から、保存前の ReservationChange を作る（seq は record_changes で採番する）"""
+    return ReservationChange(
+        reservation_id=reservation.pk,
+        reservation_number=reservation.reservation_number,
+        kind=kind,
+        old_status=old_status or '',
+        status=reservation.status,
+        start_time=reservation.start_time,
+        end_time=reservation.end_time,
+    )
+
+
+def record_changes(changes):
+    """ReservationChange のリストに連番を振ってまとめて保存する"""
+    if not changes:
+        return []
+    # 呼び出し元（Reservation.save() など）のトランザクションに含める。セーブポイントは作らない
+    with transaction.atomic(savepoint=False):
+        first = allocate(len(changes))
+        now = timezone.now()
+        for offset, change in enumerate(changes):
+            change.seq = first + offset
+            change.changed_at = now
+        return ReservationChange.objects.bulk_create(changes)
+
+
+def record_change(reservation, kind, old_status=''):
+    return record_changes([build_change(reservation, kind, old_status)])[0]
+
+
+def detect_change(reservation, created):
+    """保存された予約について、記録すべき変更の (種別, 変更前のステータス) を返す。記録不要なら None"""
+    if created:
+        return ReservationChange.KIND_CREATED, ''
+    loaded = getattr(reservation, '_loaded_values', None)
+    if loaded is None:
+        # DBから読み込んでいないインスタンスは変更内容が分からないため、ステータス変更として記録する
+        return ReservationChange.KIND_STATUS_CHANGED, ''
+    if 'status' in loaded and loaded['status'] != reservation.status:
+        return ReservationChange.KIND_STATUS_CHANGED, loaded['status']
+    if any(name in loaded and loaded[name] != getattr(reservation, name) for name in ('start_time', 'end_time')):
+        return ReservationChange.KIND_RESCHEDULED, reservation.status
+    return None
+
+
+def parse_since(value):
+    """?since= の値（最後に読んだ seq。未指定なら0）を返す。不正な値は ValueError"""
+    since = int(value or 0)
+    if since < 0:
+        raise ValueError(since)
+    return since
+
+
+def changes_since(since, limit=DEFAULT_LIMIT, queryset=None):
+    """
+    seq が since より大きい変更を古い順に最大 limit 件返す。
+    戻り値は (変更のリスト, 次に since に渡す値, まだ続きがあるか)。
+    """
+    queryset = ReservationChange.objects.all() if queryset is None else queryset
+    changes = list(queryset.filter(seq__gt=since).order_by('seq')[:limit + 1])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    return changes, (changes[-1].seq if changes else since), has_more
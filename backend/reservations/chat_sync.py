@@ -0,0 +1,137 @@
+# backend/reservations/chat_sync.py
+"""
+顧客ごとのLINEチャット履歴の差分同期。
+
+メッセージは (sent_at, id) の順に並べ、この組をカーソルとして使う（sent_at が同じでも id で順序が決まる）。
+- before: カーソルより古いメッセージのうち新しいものから limit 件（上方向の無限スクロール）
+- after:  カーソルより新しいメッセージのうち古いものから limit 件（下方向へのページ送り）
+- since:  前回の結果の sync_cursor（ウォーターマーク）。それより後にコミットされたものだけをコミット順に返す。
+          開いているチャット画面のポーリング用で、新着がなければ空の結果と同じウォーターマークを返す
+何も指定しない場合は最新の limit 件を返す。結果は常に古い順（since はコミット順）。
+
+sent_at は保存前にPythonで決まるため、後からコミットされたメッセージの sent_at が手元の最新より古いことがある。
+そのため新着の判定には sent_at ではなく、コミット順に採番される LineMessage.seq を使う。
+(customer, sent_at, id) と (customer, seq) の複合インデックスを範囲検索するため、
+履歴の長さによらず取得は limit 件分で済む。
+"""
+import base64
+import binascii
+import uuid
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .fast_serializers import serialize_list
+from .models import LineMessage
+from .serializers import LineMessageSerializer
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(sent_at, message_id):
+    raw = f'{sent_at.isoformat()}|{message_id.hex}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value, name):
+    """カーソル文字列を (sent_at, id) に戻す。不正な値は ValidationError（400）"""
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        sent_at, message_id = raw.split('|')
+        return datetime.fromisoformat(sent_at), uuid.UUID(hex=message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError({name: 'カーソルが不正です。'})
+
+
+def _older_than(cursor):
+    sent_at, message_id = cursor
+    # sent_at の範囲条件を単独でも持たせ、インデックスの範囲検索にする
+    return Q(sent_at__lte=sent_at) & (Q(sent_at__lt=sent_at) | Q(id__lt=message_id))
+
+
+def _newer_than(cursor):
+    sent_at, message_id = cursor
+    return Q(sent_at__gte=sent_at) & (Q(sent_at__gt=sent_at) | Q(id__gt=message_id))
+
+
+def decode_sync_cursor(value):
+    """since のウォーターマーク（LineMessage.seq）を戻す。不正な値は ValidationError（400）"""
+    try:
+        seq = int(value)
+    except ValueError:
+        raise ValidationError({'since': 'カーソルが不正です。'})
+    if seq < 0:
+        raise ValidationError({'since': 'カーソルが不正です。'})
+    return seq
+
+
+def parse_limit(query_params):
+    value = query_params.get('limit')
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValidationError({'limit': '整数を指定してください。'})
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValidationError({'limit': f'1から{MAX_LIMIT}の範囲で指定してください。'})
+    return limit
+
+
+def sync_messages(customer, query_params, **serializer_options):
+    """
+    before / after / since / limit に従って顧客のメッセージを取得し、次のように返す。
+    {
+        'results': 古い順（since はコミット順）のメッセージ,
+        'has_more': before（と指定なし）ではさらに古いもの、after・since ではさらに新しいものがあるか,
+        'oldest_cursor': 結果の先頭のカーソル（次に before に渡す）,
+        'newest_cursor': 結果の末尾のカーソル。after で続きがなければ渡されたカーソルのまま（次に after に渡す）,
+        'sync_cursor': 指定なし・since のとき、結果に含まれる最後のコミット順（次に since に渡す）。
+                       新着がなければ渡されたウォーターマークのまま,
+    }
+    """
+    given = [name for name in ('before', 'after', 'since') if query_params.get(name)]
+    if len(given) > 1:
+        raise ValidationError({'detail': 'before・after・since は1つだけ指定してください。'})
+    direction = given[0] if given else None
+    limit = parse_limit(query_params)
+
+    queryset = LineMessage.objects.filter(customer=customer)
+    ordering = ('-sent_at', '-id')
+    if direction == 'since':
+        queryset = queryset.filter(seq__gt=decode_sync_cursor(query_params['since']))
+        ordering = ('seq',)
+    elif direction == 'after':
+        queryset = queryset.filter(_newer_than(decode_cursor(query_params['after'], 'after')))
+        ordering = ('sent_at', 'id')
+    elif direction == 'before':
+        queryset = queryset.filter(_older_than(decode_cursor(query_params['before'], 'before')))
+    forward = direction in ('after', 'since')
+
+    # 範囲に入るメッセージのキーだけをインデックスから取り、1件多く読んで続きがあるかを判定する
+    keys = list(queryset.order_by(*ordering).values_list('sent_at', 'id', 'seq')[:limit + 1])
+    has_more = len(keys) > limit
+    keys = keys[:limit]
+    if not forward:
+        keys.reverse()
+
+    results = []
+    if keys:
+        page = LineMessage.objects.filter(id__in=[message_id for _, message_id, _ in keys]) \
+            .order_by(*(ordering if direction == 'since' else ('sent_at', 'id')))
+        results = serialize_list(page.select_related('customer'), LineMessageSerializer, **serializer_options)
+    sync_cursor = None
+    if direction == 'since':
+        sync_cursor = str(keys[-1][2]) if keys else query_params['since']
+    elif direction is None:
+        # 最新のページより前にコミットされたメッセージは、すべてこのページか過去の履歴に含まれている
+        sync_cursor = str(max(seq for _, _, seq in keys)) if keys else '0'
+    return {
+        'results': results,
+        'has_more': has_more,
+        'oldest_cursor': encode_cursor(*keys[0][:2]) if keys else None,
+        'newest_cursor': encode_cursor(*keys[-1][:2]) if keys else (query_params[direction] if direction == 'after' else None),
+        'sync_cursor': sync_cursor,
+    }
@@ -0,0 +1,144 @@
+# backend/reservations/conditional.py
+"""
+テーブル単位の変更バージョンによる条件付きGET（ETag / Last-Modified → 304 Not Modified）。
+
+追跡するモデル（TRACKED_MODELS）が保存・削除されるたびに、そのテーブルのバージョンを
+キャッシュ（本番ではRedisで全プロセス共有）に書き込む。値は書き込んだ時刻（ナノ秒）なので、
+キャッシュから消えても以前と同じ値に戻ることはなく、古いデータに304を返すことはない。
+
+ビューは ConditionalGetMixin で依存するテーブルを宣言する。
+ETagは「依存テーブルのバージョン＋URL＋利用者」から計算するため、一覧のクエリやシリアライズを
+実行する前に If-None-Match / If-Modified-Since と比較して304を返せる。
+
+シグナルが発生しない一括更新（QuerySet.update / bulk_create など）の後は bump() を呼ぶこと。
+
+バージョンを全プロセスで共有できないキャッシュ（LocMemCache）では他のプロセスの更新が見えないため、
+settings.CONDITIONAL_GET_ENABLED が False（Redis未設定時の既定値）の間は ETag を付けず304も返さない。
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import APIException
+
+from .models import AvailableTimeSlot, Customer, LineMessage, Reservation, Salon, Service, User, UserProfile
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY_PREFIX = 'table_version:'
+# 変更を追跡するモデル（シグナルハンドラは signals.py で登録する）
+TRACKED_MODELS = (Salon, Service, Customer, Reservation, LineMessage, AvailableTimeSlot, User, UserProfile)
+# 管理者向けAPIは利用者の権限・LINE連携によって見える範囲が変わるため、これらにも依存させる
+ADMIN_SCOPE_MODELS = (User, UserProfile)
+
+
+def _key(model):
+    return VERSION_KEY_PREFIX + model._meta.label_lower
+
+
+def _write(models):
+    try:
+        cache.set_many({_key(model): time.time_ns() for model in models}, timeout=None)
+    except Exception:
+        logger.exception("テーブルのバージョン更新に失敗しました")
+
+
+def bump(*models):
+    """
+    テーブルのバージョンを進める。
+    コミット前に読まれた古い内容が新しいバージョンで記録されないよう、コミット後にもう一度進める。
+    """
+    _write(models)
+    transaction.on_commit(lambda: _write(models))
+
+
+def related_models(model):
+    """model の削除で一緒に変更される（CASCADE / SET_NULL で参照している）追跡対象のモデル"""
+    return tuple(
+        relation.related_model for relation in model._meta.related_objects
+        if relation.related_model in TRACKED_MODELS
+    )
+
+
+def get_versions(models):
+    """各テーブルのバージョンを返す。キャッシュにないものは今の時刻で登録する"""
+    keys = [_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+class NotModified(APIException):
+    """条件付きGETで内容が変わっていない場合に送出し、304レスポンスに置き換える"""
+    status_code = 304
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    GET/HEADで ETag・Last-Modified を返し、クライアントの持つ内容が最新なら本処理の前に304を返すミックスイン。
+    conditional_models（または get_conditional_models()）に、レスポンスの内容が依存するモデルを指定する。
+    URLとテーブル以外に内容が依存するもの（今日の日付など）は get_etag_context() で返す。
+    """
+    conditional_models = ()
+
+    def get_conditional_models(self):
+        return self.conditional_models
+
+    def get_etag_context(self, request):
+        return ''
+
+    def get_validators(self, request):
+        """(ETag, Last-Modified) を返す。計算できない場合は (None, None)"""
+        models = self.get_conditional_models()
+        if not settings.CONDITIONAL_GET_ENABLED or request.method not in ('GET', 'HEAD') or not models:
+            return None, None
+        try:
+            versions = get_versions(models)
+        except Exception:
+            logger.exception("テーブルのバージョン取得に失敗しました（条件付きGETを行いません）")
+            return None, None
+        user = request.user
+        scope = f'{type(user).__name__}:{getattr(user, "pk", None)}'
+        digest = hashlib.sha1(
+            f'{request.get_full_path()}|{request.META.get("HTTP_ACCEPT", "")}|{scope}|{",".join(map(str, versions))}'
+            f'|{self.get_etag_context(request)}'.encode()
+        ).hexdigest()
+        # 圧縮の有無で内容のバイト列が変わるため弱いETagにする
+        return 'W/' + quote_etag(digest), max(versions) // 1_000_000_000
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag, self.last_modified = self.get_validators(request)
+        if self.etag is not None:
+            response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+            if response is not None:
+                raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag = getattr(self, 'etag', None)
+        if etag is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(self.last_modified)
+            # 内容が変わっていないかを毎回確認させる（確認は304で済む）
+            response.setdefault('Cache-Control', 'private, no-cache')
+        return response
@@ -0,0 +1,108 @@
+# backend/reservations/customer_stats.py
+"""
+顧客ごとの来店集計（来店回数・最終来店日時・次回予約日時・累計利用金額）の非正規化。
+
+集計値は Customer の列に持ち、顧客一覧でインデックスを使って並べ替え・絞り込みができるようにする。
+- 予約の作成・ステータス変更・日時変更・削除では、signals.py から同じトランザクションで refresh_customers() を呼ぶ
+- 時間の経過で「次回予約」が「来店」に変わるため、refresh_elapsed() を定期実行して次回予約を過ぎた顧客を更新する
+- rebuild_customer_stats コマンド（refresh_all()）で全顧客を作り直せる
+
+更新は相関サブクエリを使ったUPDATE 1回で行い、予約を読み込んでPythonで集計することはしない。
+顧客一覧の絞り込みで使う列なので、集計の定義（来店・次回予約とみなすステータス）は下の定数にまとめる。
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import conditional
+from .models import Customer, Reservation
+
+# 来店として数えるステータス（開始日時を過ぎたもの）
+VISIT_STATUSES = ('confirmed', 'completed')
+# 次回予約として扱うステータス（開始日時が未来のもの）
+UPCOMING_STATUSES = ('pending', 'confirmed')
+
+_update_sql = None
+
+
+def _build_update_sql():
+    """
+    集計列を相関サブクエリで更新するUPDATE文（WHERE句は {where}）。
+    予約1件の保存ごとに実行されるため、ORMの式を毎回組み立てずにSQLを1度だけ作って使い回す。
+    """
+    qn = connection.ops.quote_name
+    customer = qn(Customer._meta.db_table)
+    reservation = qn(Reservation._meta.db_table)
+    visit_in = ', '.join(['%s'] * len(VISIT_STATUSES))
+    upcoming_in = ', '.join(['%s'] * len(UPCOMING_STATUSES))
+    # 顧客ごとの予約は customer_id のインデックスで引く
+    visits = (
+        f'FROM {reservation} r WHERE r.customer_id = {customer}.id '
+        f'AND r.status IN ({visit_in}) AND r.start_time <= %s'
+    )
+    return (
+        f'UPDATE {customer} SET '
+        f'visit_count = COALESCE((SELECT COUNT(*) {visits}), 0), '
+        f'last_visit_at = (SELECT MAX(r.start_time) {visits}), '
+        f'next_booking_at = (SELECT MIN(r.start_time) FROM {reservation} r WHERE r.customer_id = {customer}.id '
+        f'AND r.status IN ({upcoming_in}) AND r.start_time > %s), '
+        f'total_spend = COALESCE((SELECT SUM(r.price) FROM {reservation} r '
+        f'WHERE r.customer_id = {customer}.id AND r.status IN ({visit_in}) AND r.start_time <= %s), 0) '
+        'WHERE {where}'
+    )
+
+
+def _update(where, where_params, now=None):
+    """WHERE句に当てはまる顧客の集計を作り直し、更新した件数を返す"""
+    global _update_sql
+    if _update_sql is None:
+        _update_sql = _build_update_sql()
+    now = connection.ops.adapt_datetimefield_value(now or timezone.now())
+    params = [
+        *VISIT_STATUSES, now,
+        *VISIT_STATUSES, now,
+        *UPCOMING_STATUSES, now,
+        *VISIT_STATUSES, now,
+        *where_params,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(_update_sql.format(where=where), params)
+        return cursor.rowcount
+
+
+def refresh_customers(customer_ids, now=None):
+    """指定した顧客の集計を作り直す（呼び出し元のトランザクション内で実行される）"""
+    customer_ids = {customer_id for customer_id in customer_ids if customer_id is not None}
+    if not customer_ids:
+        return 0
+    updated = _update(f"id IN ({', '.join(['%s'] * len(customer_ids))})", sorted(customer_ids), now)
+    # シグナルが発生しないため、条件付きGET用のバージョンを進める
+    conditional.bump(Customer)
+    return updated
+
+
+def refresh_elapsed(now=None):
+    """次回予約の開始日時を過ぎた顧客（来店回数・最終来店日時も変わる）の集計を作り直す"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        updated = _update('next_booking_at <= %s', [connection.ops.adapt_datetimefield_value(now)], now)
+    if updated:
+        conditional.bump(Customer)
+    return updated
+
+
+def refresh_all(batch_size=5000, now=None, progress=None):
+    """全顧客の集計を主キーの範囲ごとに作り直す。更新した件数を返す"""
+    now = now or timezone.now()
+    last_id = 0
+    total = 0
+    while True:
+        ids = list(Customer.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            total += _update('id BETWEEN %s AND %s', [ids[0], ids[-1]], now)
+        last_id = ids[-1]
+        if progress:
+            progress(total)
+    conditional.bump(Customer)
+    return total
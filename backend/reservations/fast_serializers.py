@@ -0,0 +1,201 @@
+# backend/reservations/fast_serializers.py
+"""
+一覧APIの高速な読み取り経路。
+
+ModelSerializer は1行ごとに各フィールドの get_attribute / to_representation を呼び、
+ネストしたシリアライザーではモデルインスタンスの生成や関連の遅延読み込みも発生する。
+ここではシリアライザーの定義から「どの列を、どのキーに、どう変換して出力するか」の
+プラン（RowPlan）を1度だけ組み立て、queryset.values_list() の行タプルから直接dictを作る。
+関連先の列はJOINで同じクエリから取得するため、行数によらずクエリは1回になる。
+
+出力は元のシリアライザーと同じ（キーの順序・null・関連がない場合にキーを省く挙動まで含む）。
+プランにできないフィールド（SerializerMethodField、逆参照、プロパティなど）を含む
+シリアライザーは UnsupportedSerializer を送出するので、呼び出し側は通常のシリアライザーを使う。
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+
+
+class UnsupportedSerializer(Exception):
+    """values() の行から組み立てられないフィールドを含むシリアライザー"""
+
+
+class ProjectedRows(list):
+    """
+    プランから組み立てた行のリスト。
+    値はJSONの基本型（str・int・bool・None・dict・list）だけで、floatを含まない場合は
+    json_safe=True になり、FastJSONRenderer が orjson でそのまま出力できる。
+    """
+
+    def __init__(self, rows, json_safe=False):
+        super().__init__(rows)
+        self.json_safe = json_safe
+
+
+def _iso_datetime(value):
+    # DRFのDateTimeField（ISO 8601・USE_TZ=False）と同じ出力
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _identity(value):
+    return value
+
+
+class RowPlan:
+    """values_list() の1行を、シリアライザーと同じ形のdictに変換するプラン"""
+
+    def __init__(self, columns, steps, json_safe):
+        self.columns = columns
+        # (キー, 列の位置, 変換関数, nullなら出力を省く列の位置, ネストしたプラン)
+        self.steps = steps
+        self.json_safe = json_safe
+
+    def build(self, row):
+        data = {}
+        for name, index, convert, guards, nested in self.steps:
+            if guards and any(row[guard] is None for guard in guards):
+                continue
+            value = row[index]
+            if value is None:
+                data[name] = None
+            elif nested is not None:
+                data[name] = nested.build(row)
+            else:
+                data[name] = convert(value)
+        return data
+
+    def serialize(self, queryset):
+        """querysetを1回のクエリで取得し、ProjectedRows を返す"""
+        build = self.build
+        rows = queryset.values_list(*self.columns)
+        return ProjectedRows([build(row) for row in rows], json_safe=self.json_safe)
+
+
+class _PlanCompiler:
+    def __init__(self):
+        self.columns = []
+        self.json_safe = True
+
+    def column(self, path):
+        if path not in self.columns:
+            self.columns.append(path)
+        return self.columns.index(path)
+
+    def converter(self, field, model_field):
+        """DRFの to_representation と同じ結果を返す、より軽い変換関数を選ぶ"""
+        field_type = type(field)
+        if field_type in (serializers.CharField, serializers.EmailField, serializers.URLField, serializers.SlugField):
+            return str
+        if field_type is serializers.IntegerField:
+            return int
+        if field_type is serializers.BooleanField:
+            return bool
+        if field_type is serializers.UUIDField and field.uuid_format == 'hex_verbose':
+            return str
+        if field_type is PrimaryKeyRelatedField and field.pk_field is None:
+            return _identity
+        if (
+            field_type is serializers.DateTimeField
+            and getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601
+            and not settings.USE_TZ
+        ):
+            return _iso_datetime
+        if isinstance(field, serializers.FloatField) or (
+            model_field is not None and model_field.get_internal_type() == 'FloatField'
+        ):
+            # floatの書式は orjson と json で異なることがあるため、標準のJSONレンダラーに任せる
+            self.json_safe = False
+        return field.to_representation
+
+    def resolve(self, model, source_attrs):
+        """
+        source（例: customer.name）をたどり、(values()のパス, 途中の関連のパス一覧, 末尾のモデルフィールド) を返す。
+        途中は順方向のForeignKey/OneToOneFieldだけを許可する。
+        """
+        path, guards = [], []
+        model_field = None
+        for position, attr in enumerate(source_attrs):
+            try:
+                model_field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                raise UnsupportedSerializer(f'{model.__name__}.{attr} はモデルのフィールドではありません')
+            if not model_field.concrete or model_field.many_to_many:
+                raise UnsupportedSerializer(f'{model.__name__}.{attr} は values() で取得できません')
+            path.append(attr)
+            if position < len(source_attrs) - 1:
+                if not model_field.is_relation:
+                    raise UnsupportedSerializer(f'{model.__name__}.{attr} は関連フィールドではありません')
+                guards.append('__'.join(path))
+                model = model_field.related_model
+        return '__'.join(path), guards, model_field
+
+    def compile(self, serializer, model, prefix=''):
+        steps = []
+        for field in serializer._readable_fields:
+            if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+                raise UnsupportedSerializer(f'{field.field_name} はプランにできません')
+            path, guards, model_field = self.resolve(model, field.source_attrs)
+            guard_indices = tuple(self.column(prefix + guard) for guard in guards)
+            if isinstance(field, serializers.ListSerializer):
+                raise UnsupportedSerializer(f'{field.field_name} は複数の関連を含みます')
+            if isinstance(field, serializers.ModelSerializer):
+                if not (model_field.is_relation and (model_field.many_to_one or model_field.one_to_one)):
+                    raise UnsupportedSerializer(f'{field.field_name} は順方向の関連ではありません')
+                index = self.column(prefix + path)
+                nested = self.compile(field, model_field.related_model, prefix + path + '__')
+                steps.append((field.field_name, index, None, guard_indices, nested))
+                continue
+            if isinstance(field, serializers.Serializer):
+                raise UnsupportedSerializer(f'{field.field_name} はModelSerializerではありません')
+            index = self.column(prefix + path)
+            steps.append((field.field_name, index, self.converter(field, model_field), guard_indices, None))
+        return RowPlan(self.columns, steps, self.json_safe)
+
+
+_plans = {}
+# ?fields= の組み合わせごとにプランを作るため、件数が増えすぎたら作り直す
+PLAN_CACHE_SIZE = 256
+
+
+def get_plan(serializer_class, **options):
+    """
+    シリアライザークラス（と fields / expand の指定）に対応するプランを返す。
+    初回のみ組み立て、以降はキャッシュする。プランにできない場合は UnsupportedSerializer を送出する。
+    """
+    key = (serializer_class,) + tuple((name, tuple(value)) for name, value in sorted(options.items()))
+    plan = _plans.get(key)
+    if plan is None:
+        serializer = serializer_class(**options)
+        compiler = _PlanCompiler()
+        try:
+            plan = compiler.compile(serializer, serializer.Meta.model)
+        except UnsupportedSerializer as e:
+            plan = e
+        else:
+            # ネストしたフィールドを含めた全体で、floatを含むかどうかを確定させる
+            plan.json_safe = compiler.json_safe
+        if len(_plans) >= PLAN_CACHE_SIZE:
+            _plans.clear()
+        _plans[key] = plan
+    if isinstance(plan, UnsupportedSerializer):
+        raise plan
+    return plan
+
+
+def serialize_list(queryset, serializer_class, **options):
+    """
+    querysetを serializer_class(queryset, many=True, **options).data と同じ内容で返す。
+    options（fields / expand）で出力を絞り込むと、取得する列とJOINも同じだけ減る。
+    プランにできないシリアライザーの場合は通常のシリアライザーで処理する。
+    """
+    try:
+        plan = get_plan(serializer_class, **options)
+    except UnsupportedSerializer:
+        return serializer_class(queryset, many=True, **options).data
+    return plan.serialize(queryset)
@@ -0,0 +1,289 @@
+# backend/reservations/instrumentation.py
+"""
+リクエスト単位のパフォーマンス計測。
+
+- track(name) で囲んだ処理の所要時間を、実行中のリクエストのタイミング情報に加算する
+- DBクエリは RequestTimingMiddleware が execute_wrapper で自動的に計測する
+- 外部HTTP呼び出しは timed_request() を使うと送信先ホストごとに計測される
+- 集計結果は Server-Timing ヘッダーと、エンドポイント別のPrometheus形式ヒストグラムとして出力する
+
+ヒストグラムはプロセス内に溜め、METRICS_FLUSH_SECONDS ごとに METRICS_REDIS_URL のRedisへ差分を加算する。
+/api/metrics/ は全プロセス（gunicornの各ワーカー）の合計を返す（他のワーカーの直近の計測は最大で書き込み間隔だけ遅れる）。
+Redisが設定されていない場合はプロセス内の値だけを返すため、Webワーカーが1つの構成でのみ正しい値になる。
+"""
+import json
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 実行中のリクエストのタイミング情報（リクエスト外ではNone）
+_current_timings = ContextVar('request_timings', default=None)
+
+# ヒストグラムのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestTimings:
+    """1リクエスト内で計測した区分ごとの所要時間（秒）と回数"""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, name, seconds):
+        self.durations[name] += seconds
+        self.counts[name] += 1
+
+
+def start_request_timings():
+    """新しいリクエストの計測を開始し、(timings, 復元用トークン) を返す"""
+    timings = RequestTimings()
+    return timings, _current_timings.set(timings)
+
+
+def end_request_timings(token):
+    _current_timings.reset(token)
+
+
+def current_timings():
+    return _current_timings.get()
+
+
+@contextmanager
+def track(name):
+    """囲んだ処理の所要時間を、実行中のリクエストの区分nameに加算する"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def http_metric_name(url):
+    """外部HTTP呼び出しの計測区分名（送信先ホストごと）"""
+    return f"http-{urlsplit(url).hostname or 'unknown'}"
+
+
+def timed_request(method, url, **kwargs):
+    """requests.request() と同じだが、送信先ホストごとに所要時間を計測する"""
+    with track(http_metric_name(url)):
+        return requests.request(method, url, **kwargs)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper() 用のDBクエリ計測フック"""
+    with track('db'):
+        return execute(sql, params, many, context)
+
+
+# ==============================================================================
+# Prometheus形式のメトリクス
+# ==============================================================================
+
+def _empty_series(bucket_count):
+    return {'buckets': [0] * bucket_count, 'sum': 0.0, 'count': 0}
+
+
+class Histogram:
+    """
+    ラベルごとに累積バケットを持つ、スレッドセーフな簡易ヒストグラム。
+    共有ストアを使う場合は、前回の書き込み以降の差分だけを保持する。
+    """
+
+    def __init__(self, name, documentation, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _empty_series(len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def drain(self):
+        """溜まった値を取り出して空にする（共有ストアへの書き込み用）"""
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series):
+        """drain() で取り出した値を戻す（共有ストアへの書き込みに失敗した場合）"""
+        with self._lock:
+            for key, other in series.items():
+                target = self._series.setdefault(key, _empty_series(len(self.buckets)))
+                target['buckets'] = [a + b for a, b in zip(target['buckets'], other['buckets'])]
+                target['sum'] += other['sum']
+                target['count'] += other['count']
+
+    def render(self, series=None):
+        """series（共有ストアから読んだ値）を省略した場合はプロセス内の値を出力する"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((self._series if series is None else series).items())
+            for key, values in items:
+                labels = ','.join(f'{name}="{_escape_label(value)}"' for name, value in zip(self.label_names, key))
+                for bound, count in zip(self.buckets, values['buckets']):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {values["count"]}')
+                lines.append(f'{self.name}_sum{{{labels}}} {values["sum"]}')
+                lines.append(f'{self.name}_count{{{labels}}} {values["count"]}')
+        return "\n".join(lines)
+
+
+def percentile(values, pct):
+    """最近接順位法によるパーセンタイル（ベンチマーク・リプレイの集計用）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram(
+    'jello_request_duration_seconds',
+    'Total wall time per request by endpoint.',
+    ('endpoint', 'method', 'status'),
+)
+COMPONENT_DURATION = Histogram(
+    'jello_request_component_duration_seconds',
+    'Wall time per request attributed to DB, outbound HTTP per host, storage and serialization.',
+    ('endpoint', 'component'),
+)
+
+
+HISTOGRAMS = (REQUEST_DURATION, COMPONENT_DURATION)
+
+
+class RedisMetricsStore:
+    """全プロセスのヒストグラムの合計を、メトリクスごとに1つのRedisのハッシュに保存する"""
+
+    KEY_PREFIX = 'metrics:'
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    @staticmethod
+    def _field(key, part):
+        return json.dumps([list(key), part], ensure_ascii=False)
+
+    def add(self, histogram_series):
+        """[(メトリクス名, 差分), ...] を加算する"""
+        pipe = self.client.pipeline(transaction=False)
+        for name, series in histogram_series:
+            for key, values in series.items():
+                for index, count in enumerate(values['buckets']):
+                    if count:
+                        pipe.hincrby(self.KEY_PREFIX + name, self._field(key, index), count)
+                pipe.hincrbyfloat(self.KEY_PREFIX + name, self._field(key, 'sum'), values['sum'])
+                pipe.hincrby(self.KEY_PREFIX + name, self._field(key, 'count'), values['count'])
+        pipe.execute()
+
+    def load(self, name, bucket_count):
+        series = {}
+        for field, value in self.client.hgetall(self.KEY_PREFIX + name).items():
+            key, part = json.loads(field)
+            values = series.setdefault(tuple(key), _empty_series(bucket_count))
+            if part == 'sum':
+                values['sum'] = float(value)
+            elif part == 'count':
+                values['count'] = int(value)
+            else:
+                values['buckets'][part] = int(value)
+        return series
+
+
+_UNSET = object()
+_store = _UNSET
+_store_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def get_metrics_store():
+    """共有ストア（METRICS_REDIS_URL が未設定ならNone）"""
+    global _store
+    if _store is _UNSET:
+        with _store_lock:
+            if _store is _UNSET:
+                url = getattr(settings, 'METRICS_REDIS_URL', None)
+                _store = RedisMetricsStore(url) if url else None
+    return _store
+
+
+def flush_metrics(force=False):
+    """前回の書き込みから METRICS_FLUSH_SECONDS 経っていれば、このプロセスの計測値を共有ストアに加算する"""
+    global _last_flush
+    store = get_metrics_store()
+    if store is None:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_SECONDS', 5.0):
+        return
+    _last_flush = now
+    drained = [(histogram, histogram.drain()) for histogram in HISTOGRAMS]
+    try:
+        store.add([(histogram.name, series) for histogram, series in drained if series])
+    except Exception:
+        logger.exception("メトリクスの共有ストアへの書き込みに失敗しました")
+        for histogram, series in drained:
+            histogram.merge(series)
+
+
+def observe_request(endpoint, method, status_code, total, timings):
+    """1リクエスト分の計測結果をヒストグラムに記録する"""
+    REQUEST_DURATION.observe({'endpoint': endpoint, 'method': method, 'status': str(status_code)}, total)
+    for component, seconds in timings.durations.items():
+        COMPONENT_DURATION.observe({'endpoint': endpoint, 'component': component}, seconds)
+    flush_metrics()
+
+
+def render_metrics():
+    """Prometheusのテキスト形式でメトリクスを返す（共有ストアがあれば全プロセスの合計）"""
+    store = get_metrics_store()
+    if store is None:
+        return "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
+    flush_metrics(force=True)
+    return "\n".join(
+        histogram.render(store.load(histogram.name, len(histogram.buckets))) for histogram in HISTOGRAMS
+    ) + "\n"
+
+
+def server_timing_header(timings, total):
+    """計測結果をServer-Timingヘッダーの値に整形する"""
+    entries = []
+    for name, seconds in sorted(timings.durations.items()):
+        entry = f"{name};dur={seconds * 1000:.1f}"
+        if name == 'db':
+            entry += f';desc="{timings.counts[name]} queries"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -1,30 +1,120 @@
+import logging
 import os
+import time
+import jwt
 import requests
 from django.conf import settings
-import traceback # エラーの詳細を出力するためにインポート
+from django.core.cache import cache
+from .instrumentation import timed_request
+
+logger = logging.getLogger(__name__)
+
+# LINEログインのIDトークン（OpenID Connect）
+LINE_ISSUER = 'https://access.line.me'
+LINE_JWKS_URL = 'https://api.line.me/oauth2/v2.1/certs'
+LINE_VERIFY_URL = 'https://api.line.me/oauth2/v2.1/verify'
+# 公開鍵（JWKS）のキャッシュ。鍵のローテーションに備え、未知のkidが来たら取り直す
+JWKS_CACHE_KEY = 'line_login_jwks'
+JWKS_CACHE_SECONDS = 24 * 60 * 60
+# 未知のkidによるJWKSの再取得は、この秒数に1回まで（不正なトークンでLINEに負荷をかけないため）
+JWKS_REFETCH_INTERVAL_SECONDS = 60
+# サーバー間の時計のずれの許容（秒）
+ID_TOKEN_LEEWAY_SECONDS = 30
+
+
+class LineIdTokenError(ValueError):
+    """IDトークンが不正（署名・発行者・対象・有効期限のいずれかが不一致）"""
+
+
+class LocalVerificationUnavailable(Exception):
+    """この環境ではIDトークンをローカルで検証できない（LINEの検証APIを使う）"""
+
+
+def _fetch_jwks():
+    response = timed_request('GET', LINE_JWKS_URL, timeout=5)
+    response.raise_for_status()
+    jwks = {'keys': response.json().get('keys', []), 'fetched_at': time.time()}
+    cache.set(JWKS_CACHE_KEY, jwks, JWKS_CACHE_SECONDS)
+    return jwks
+
+
+def _find_jwk(kid):
+    """kidに対応する公開鍵（JWK）を返す。キャッシュになければJWKSを取り直す"""
+    jwks = cache.get(JWKS_CACHE_KEY)
+    if jwks is None:
+        jwks = _fetch_jwks()
+    for key in jwks['keys']:
+        if key.get('kid') == kid:
+            return key
+    if time.time() - jwks.get('fetched_at', 0) >= JWKS_REFETCH_INTERVAL_SECONDS:
+        # 鍵がローテーションされた可能性があるので取り直す
+        for key in _fetch_jwks()['keys']:
+            if key.get('kid') == kid:
+                return key
+    raise LineIdTokenError(f"IDトークンの署名鍵が見つかりません (kid: {kid})")
+
+
+def verify_id_token(id_token, channel_id, channel_secret, nonce=None):
+    """
+    LINEのIDトークンをローカルで検証し、クレーム（sub, name, picture など）を返す。
+    HS256はチャネルシークレットで、ES256はLINEの公開鍵（JWKS、キャッシュ付き）で署名を検証する。
+    ES256の検証に必要な cryptography がない場合は LocalVerificationUnavailable を送出する。
+    """
+    try:
+        header = jwt.get_unverified_header(id_token)
+    except jwt.InvalidTokenError as e:
+        raise LineIdTokenError(f"IDトークンの形式が不正です: {e}")
+
+    algorithm = header.get('alg')
+    if algorithm == 'HS256':
+        key = channel_secret
+    elif algorithm == 'ES256':
+        if not jwt.algorithms.has_crypto:
+            raise LocalVerificationUnavailable("ES256の検証には cryptography が必要です")
+        key = jwt.PyJWK(_find_jwk(header.get('kid'))).key
+    else:
+        raise LineIdTokenError(f"未対応の署名アルゴリズムです: {algorithm}")
+
+    try:
+        claims = jwt.decode(
+            id_token,
+            key,
+            algorithms=[algorithm],
+            audience=channel_id,
+            issuer=LINE_ISSUER,
+            leeway=ID_TOKEN_LEEWAY_SECONDS,
+            options={'require': ['exp', 'iat', 'sub']},
+        )
+    except jwt.InvalidTokenError as e:
+        raise LineIdTokenError(f"IDトークンの検証に失敗しました: {e}")
+    if nonce is not None and claims.get('nonce') != nonce:
+        raise LineIdTokenError("IDトークンのnonceが一致しません")
+    return claims
 
 def get_line_user_profile(code: str, flow_type: str = 'customer') -> dict:
     """
     認証コードを使い、LINEからユーザープロフィールを取得する。
     flow_typeに応じて正しいリダイレクトURIを使い分けます。
     """
-    print(f"--- get_line_user_profile 開始 (flow: {flow_type}) ---")
+    logger.debug(f"get_line_user_profile 開始 (flow: {flow_type})")
     try:
         # --- 1. 環境変数の読み込み ---
         channel_id = os.environ.get('LINE_CHANNEL_ID')
         channel_secret = os.environ.get('LINE_CHANNEL_SECRET')
         frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
         
-        print(f"  - 読み込み成功: LINE_CHANNEL_ID: {'設定済み' if channel_id else '未設定'}")
-        print(f"  - 読み込み成功: LINE_CHANNEL_SECRET: {'設定済み' if channel_secret else '未設定'}")
-        print(f"  - 読み込み成功: FRONTEND_URL: {frontend_url}")
+        logger.debug(
+            f"LINE_CHANNEL_ID: {'設定済み' if channel_id else '未設定'}, "
+            f"LINE_CHANNEL_SECRET: {'設定済み' if channel_secret else '未設定'}, "
+            f"FRONTEND_URL: {frontend_url}"
+        )
 
         if flow_type == 'admin':
             redirect_uri = f"{frontend_url}/admin/callback"
         else:
             redirect_uri = f"{frontend_url}/callback"
         
-        print(f"  - 生成された redirect_uri: {redirect_uri}")
+        logger.debug(f"redirect_uri: {redirect_uri}")
 
         if not all([channel_id, channel_secret, frontend_url]):
             raise ValueError("LINEの環境変数が設定されていません。(ID, SECRET, FRONTEND_URL)")
@@ -39,13 +129,12 @@ def get_line_user_profile(code: str, flow_type: str = 'customer') -> dict:
             'client_secret': channel_secret,
         }
         
-        print(f"  - LINEにトークンを要求します... URL: {token_url}")
-        token_response = requests.post(token_url, data=token_payload)
-        print(f"  - LINEからの応答ステータス: {token_response.status_code}")
+        logger.debug(f"LINEにトークンを要求します: {token_url}")
+        token_response = timed_request('POST', token_url, data=token_payload)
+        logger.debug(f"LINEからの応答ステータス: {token_response.status_code}")
         
         if token_response.status_code != 200:
-            print(f"【エラー】LINEトークン取得失敗: {token_response.status_code}")
-            print(f"【エラー詳細】応答内容: {token_response.text}")
+            logger.error(f"LINEトークン取得失敗: {token_response.status_code} 応答内容: {token_response.text}")
         
         token_response.raise_for_status() # エラーがあればここで例外が発生
         
@@ -54,34 +143,43 @@ def get_line_user_profile(code: str, flow_type: str = 'customer') -> dict:
         if not id_token:
             raise ValueError("LINEからの応答にIDトークンが含まれていません。")
         
-        print("  - IDトークンの取得に成功しました。")
+        logger.debug("IDトークンの取得に成功しました。")
 
         # --- 3. IDトークンの検証とプロフィール取得 ---
-        verify_url = 'https://api.line.me/oauth2/v2.1/verify'
+        # 通常はローカルで署名を検証し、LINEの検証APIへの往復を省く
+        try:
+            user_profile = verify_id_token(id_token, channel_id, channel_secret)
+            logger.debug("get_line_user_profile 正常終了 (IDトークンをローカルで検証)")
+            return user_profile
+        except LocalVerificationUnavailable as e:
+            logger.debug(f"IDトークンをローカルで検証できないため、LINEの検証APIを使います: {e}")
+
+        verify_url = LINE_VERIFY_URL
         verify_payload = {'id_token': id_token, 'client_id': channel_id}
         
-        print(f"  - IDトークンを検証します... URL: {verify_url}")
-        verify_response = requests.post(verify_url, data=verify_payload)
-        print(f"  - LINEからの検証応答ステータス: {verify_response.status_code}")
+        logger.debug(f"IDトークンを検証します: {verify_url}")
+        verify_response = timed_request('POST', verify_url, data=verify_payload)
+        logger.debug(f"LINEからの検証応答ステータス: {verify_response.status_code}")
         
         if verify_response.status_code != 200:
-            print(f"【エラー】LINE IDトークン検証失敗: {verify_response.status_code}")
-            print(f"【エラー詳細】応答内容: {verify_response.text}")
+            logger.error(f"LINE IDトークン検証失敗: {verify_response.status_code} 応答内容: {verify_response.text}")
         
         verify_response.raise_for_status()
 
         user_profile = verify_response.json()
-        print("  - プロフィールの取得に成功しました。")
-        print("--- get_line_user_profile 正常終了 ---")
+        logger.debug("get_line_user_profile 正常終了")
         return user_profile
 
+    except LineIdTokenError as e:
+        logger.warning(f"LINE IDトークンが不正です: {e}")
+        raise
     except requests.exceptions.RequestException as e:
-        print(f"【エラー】LINE APIとの通信に失敗しました: {e}")
         if e.response is not None:
-            print(f"【エラー詳細】ステータス: {e.response.status_code}, 応答: {e.response.text}")
+            logger.error(f"LINE APIとの通信に失敗しました: {e} (ステータス: {e.response.status_code}, 応答: {e.response.text})")
+        else:
+            logger.error(f"LINE APIとの通信に失敗しました: {e}")
         raise e
     except Exception as e:
         # 予期せぬその他のエラーをキャッチして詳細を出力
-        print(f"【予期せぬエラー】get_line_user_profile内でエラーが発生しました: {e}")
-        traceback.print_exc() # トレースバックを出力
+        logger.exception(f"get_line_user_profile内で予期せぬエラーが発生しました: {e}")
         raise e
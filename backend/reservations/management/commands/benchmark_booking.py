@@ -0,0 +1,278 @@
+import json
+import math
+import os
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from reservations.instrumentation import percentile
+from reservations.revocation import MemoryBackend, RevocationRegistry
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'booking_baseline.json'
+BENCH_CHANNEL_ID = 'bench-channel'
+BENCH_CHANNEL_SECRET = 'bench-secret'
+STEPS = ['line_login', 'line_login_again', 'bookable_dates', 'availability', 'create_reservation', 'admin_confirm']
+
+
+class FakeResponse:
+    """外部APIの代わりに返す最小限のレスポンス"""
+
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+        self.content = self.text.encode()
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        import requests
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+
+def fake_id_token(code):
+    """チャネルシークレットでHS256署名した、LINEログインと同じ形式のIDトークン"""
+    now = int(time.time())
+    return jwt.encode({
+        'iss': 'https://access.line.me',
+        'aud': BENCH_CHANNEL_ID,
+        'sub': f'U-bench-{code}',
+        'name': f'ベンチ {code}',
+        'picture': 'https://example.com/p.png',
+        'iat': now,
+        'exp': now + 3600,
+    }, BENCH_CHANNEL_SECRET, algorithm='HS256')
+
+
+def fake_line_api(method, url, **kwargs):
+    """LINE APIのローカル代替。token/verify/pushの各エンドポイントに応答する"""
+    data = kwargs.get('data') or {}
+    if url.endswith('/oauth2/v2.1/token'):
+        return FakeResponse({'id_token': fake_id_token(data.get('code')), 'access_token': 'bench'})
+    if url.endswith('/oauth2/v2.1/verify'):
+        return FakeResponse(jwt.decode(data.get('id_token'), options={'verify_signature': False}))
+    if url.endswith('/v2/bot/message/push'):
+        return FakeResponse({})
+    return FakeResponse({'message': 'not found'}, status_code=404)
+
+
+class Command(BaseCommand):
+    help = (
+        '予約フロー（LINEログイン→予約可能日→空き枠→予約作成→管理者確定）のレイテンシとクエリ数を計測し、'
+        'クエリ数がベースラインより増えたら失敗します（レイテンシは実行環境で変わるため参考値として表示のみ）'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='予約フローを繰り返す回数')
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='計測前に実行する回数（初回利用時に読み込まれるSDKなどの影響を除く）',
+        )
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='ベースラインJSONファイルのパス')
+        parser.add_argument('--save-baseline', action='store_true', help='今回のクエリ数をベースラインとして保存します')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        if iterations < 1:
+            raise CommandError('--iterations は1以上を指定してください')
+
+        # 本番・開発DBに触れないよう、テスト用DBを作って計測する
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        # スキーマはマイグレーションを通さずモデル定義から直接作成する
+        connection.settings_dict.setdefault('TEST', {})['MIGRATE'] = False
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with ExitStack() as stack:
+                self._install_stand_ins(stack)
+                results, elapsed = self._run(iterations, options['warmup'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        summary = self._summarize(results, elapsed)
+        self._report(summary)
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(baseline_from_summary(summary), ensure_ascii=False, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'ベースラインを保存しました: {baseline_path}'))
+            return
+
+        if baseline_path.exists():
+            failures = compare_queries(summary, json.loads(baseline_path.read_text()))
+            if failures:
+                for failure in failures:
+                    self.stdout.write(self.style.ERROR(failure))
+                raise CommandError('ベースラインに対してクエリ数が増えています')
+            self.stdout.write(self.style.SUCCESS('ベースラインとの比較: クエリ数の増加はありません'))
+        else:
+            self.stdout.write(self.style.WARNING(f'ベースラインがありません: {baseline_path}（--save-baseline で作成できます）'))
+
+    # ------------------------------------------------------------------
+    # 準備
+    # ------------------------------------------------------------------
+
+    def _install_stand_ins(self, stack):
+        """LINE・Googleカレンダー・GCS・SMTP・Redis（トークンの失効管理）をローカルの代替に差し替える"""
+        stack.enter_context(override_settings(
+            LINE_CHANNEL_ID=BENCH_CHANNEL_ID,
+            LINE_CHANNEL_SECRET=BENCH_CHANNEL_SECRET,
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            SERVER_TIMING_ENABLED=True,
+        ))
+        stack.enter_context(mock.patch.dict(os.environ, {
+            'LINE_CHANNEL_ID': BENCH_CHANNEL_ID,
+            'LINE_CHANNEL_SECRET': BENCH_CHANNEL_SECRET,
+            'GOOGLE_CALENDAR_ID': 'bench-calendar',
+        }))
+        # 外部HTTPは timed_request() 経由なので、その先の requests.request を差し替える
+        stack.enter_context(mock.patch('reservations.instrumentation.requests.request', side_effect=fake_line_api))
+        # Googleカレンダー・GCS・LINE Bot（いずれもadapters経由で生成されるクライアントを差し替える）
+        stack.enter_context(mock.patch('reservations.adapters.google_calendar.is_available', return_value=True))
+        stack.enter_context(mock.patch('reservations.adapters.google_calendar.get_service', return_value=mock.MagicMock()))
+        stack.enter_context(mock.patch('reservations.adapters.gcs.get_client', return_value=mock.MagicMock()))
+        stack.enter_context(mock.patch('reservations.adapters.line_bot.customer_api', return_value=mock.MagicMock()))
+        stack.enter_context(mock.patch('reservations.adapters.line_bot.admin_api', return_value=mock.MagicMock()))
+        # 計測は1プロセスで完結するため、失効管理はプロセス内のメモリで足りる
+        stack.enter_context(mock.patch('reservations.revocation._registry', RevocationRegistry(MemoryBackend())))
+
+    def _seed(self, iterations):
+        from reservations.models import AvailableTimeSlot, Salon, Service, User
+
+        salon = Salon.objects.create(name='ベンチサロン', address='東京都', phone_number='0300000000')
+        service = Service.objects.create(salon=salon, name='ジェルネイル', price=6000, duration_minutes=60)
+        admin = User.objects.create_user(
+            email='bench-admin@example.com', username='bench-admin', password='bench', is_staff=True, is_superuser=True
+        )
+
+        # 各イテレーションが別々の枠を予約できるだけの受付時間を用意する
+        slots_per_day = 24
+        days = math.ceil(iterations / slots_per_day) + 1
+        start_day = timezone.now().date() + timedelta(days=1)
+        slots = []
+        for day_offset in range(days):
+            day = start_day + timedelta(days=day_offset)
+            for index in range(slots_per_day):
+                minutes = 9 * 60 + index * 30
+                slots.append(AvailableTimeSlot(date=day, time=datetime.min.replace(hour=minutes // 60, minute=minutes % 60).time()))
+        AvailableTimeSlot.objects.bulk_create(slots)
+        return service, admin, [(slot.date, slot.time) for slot in slots]
+
+    # ------------------------------------------------------------------
+    # 計測
+    # ------------------------------------------------------------------
+
+    def _run(self, iterations, warmup=0):
+        from rest_framework.test import APIClient
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        service, admin, slots = self._seed(warmup + iterations)
+        admin_token = str(RefreshToken.for_user(admin).access_token)
+        results = {step: {'latencies': [], 'queries': []} for step in STEPS}
+
+        recording = False
+
+        def measure(step, func):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = func()
+                latency = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise CommandError(f'{step} が失敗しました: {response.status_code} {getattr(response, "data", "")}')
+            if recording:
+                results[step]['latencies'].append(latency * 1000)
+                results[step]['queries'].append(len(queries))
+            return response
+
+        started = time.perf_counter()
+        for i in range(warmup + iterations):
+            if i == warmup:
+                recording = True
+                started = time.perf_counter()
+            client = APIClient()
+            slot_date, slot_time = slots[i]
+
+            response = measure('line_login', lambda: client.post('/api/line/callback/', {'code': f'c{i}'}, format='json'))
+            # 再ログイン（プロフィールが変わっていない、最も多いケース）
+            response = measure('line_login_again', lambda: client.post('/api/line/callback/', {'code': f'c{i}'}, format='json'))
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+            measure('bookable_dates', lambda: client.get(
+                '/api/bookable-dates/', {'year': slot_date.year, 'month': slot_date.month}))
+            measure('availability', lambda: client.get(
+                '/api/availability/', {'date': slot_date.isoformat(), 'service_id': service.id}))
+
+            start_time = datetime.combine(slot_date, slot_time)
+            if settings.USE_TZ:
+                start_time = timezone.make_aware(start_time)
+            response = measure('create_reservation', lambda: client.post('/api/reservations/', {
+                'salon': service.salon_id,
+                'service': service.id,
+                'start_time': start_time.isoformat(),
+                'customer_name': f'ベンチ 太郎{i}',
+                'customer_furigana': 'ベンチ タロウ',
+                'customer_email': f'bench{i}@example.com',
+                'customer_phone': '09000000000',
+            }, format='json'))
+            reservation_number = response.data['reservation_number']
+
+            admin_client = APIClient()
+            admin_client.credentials(HTTP_AUTHORIZATION=f'Bearer {admin_token}')
+            measure('admin_confirm', lambda: admin_client.post(
+                f'/api/admin/reservations/{reservation_number}/confirm/'))
+        return results, time.perf_counter() - started
+
+    def _summarize(self, results, elapsed):
+        total_requests = sum(len(data['latencies']) for data in results.values())
+        steps = {}
+        for step, data in results.items():
+            steps[step] = {
+                'p50_ms': round(percentile(data['latencies'], 50), 3),
+                'p95_ms': round(percentile(data['latencies'], 95), 3),
+                'p99_ms': round(percentile(data['latencies'], 99), 3),
+                'queries_per_request': round(sum(data['queries']) / len(data['queries']), 2),
+                'max_queries': max(data['queries']),
+            }
+        return {
+            'iterations': len(results[STEPS[0]]['latencies']),
+            'requests_per_second': round(total_requests / elapsed, 2) if elapsed else 0.0,
+            'steps': steps,
+        }
+
+    def _report(self, summary):
+        self.stdout.write(f"{'step':<20}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'queries':>10}")
+        for step, data in summary['steps'].items():
+            self.stdout.write(
+                f"{step:<20}{data['p50_ms']:>10.2f}{data['p95_ms']:>10.2f}{data['p99_ms']:>10.2f}"
+                f"{data['queries_per_request']:>10.2f}"
+            )
+        self.stdout.write(f"iterations: {summary['iterations']}, requests/sec: {summary['requests_per_second']}")
+
+
+
+def baseline_from_summary(summary):
+    """ベースラインとして保存する内容（ステップごとのクエリ数だけ）"""
+    return {'steps': {step: {'max_queries': data['max_queries']} for step, data in summary['steps'].items()}}
+
+
+def compare_queries(summary, baseline):
+    """ステップごとのクエリ数をベースラインと比較し、増えている項目のメッセージを返す"""
+    failures = []
+    for step, data in summary['steps'].items():
+        base = baseline.get('steps', {}).get(step)
+        if base and data['max_queries'] > base['max_queries']:
+            failures.append(f"{step}: クエリ数 {data['max_queries']} > ベースライン {base['max_queries']}")
+    return failures
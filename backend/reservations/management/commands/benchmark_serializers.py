@@ -0,0 +1,114 @@
+import io
+import json
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+
+from reservations.fast_serializers import serialize_list
+from reservations.instrumentation import percentile
+from reservations.models import Customer, LineMessage, Reservation
+from reservations.renderers import FastJSONRenderer, orjson
+from reservations.serializers import CustomerSerializer, LineMessageSerializer, ReservationSerializer
+
+# (名前, 一覧APIと同じqueryset, シリアライザー)
+# 同じ日時の行があっても2つの経路で並び順が変わらないよう、主キーで順序を確定させる
+TARGETS = [
+    ('reservations', lambda: Reservation.objects.all().order_by('-start_time', '-pk'), ReservationSerializer),
+    ('customers', lambda: Customer.objects.all().order_by('-created_at', '-pk'), CustomerSerializer),
+    ('line_messages', lambda: LineMessage.objects.select_related('customer').order_by('-sent_at', '-pk'), LineMessageSerializer),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        '一覧APIのシリアライズ（DRFのModelSerializer＋JSONRenderer）と高速経路（fast_serializers＋FastJSONRenderer）を比較し、'
+        '1,000行あたりの時間とクエリ数を表示します。出力のJSONがバイト単位で一致しない場合は失敗します'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='1回に取得する行数')
+        parser.add_argument('--repeat', type=int, default=5, help='計測の繰り返し回数')
+        parser.add_argument('--seed', type=int, default=42, help='合成データの乱数シード')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        if rows < 1 or repeat < 1:
+            raise CommandError('--rows と --repeat は1以上を指定してください')
+
+        # 本番・開発DBに触れないよう、テスト用DBに合成データを作って計測する
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict.setdefault('TEST', {})['MIGRATE'] = False
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command(
+                'generate_synthetic_data', seed=options['seed'], anchor_date='2025-01-01',
+                customers=max(rows, 100), messages=rows, years=1, future_days=30, stdout=io.StringIO(),
+            )
+            self._add_edge_cases()
+            results = [self._measure(name, queryset, serializer_class, rows, repeat) for name, queryset, serializer_class in TARGETS]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"orjson: {'あり' if orjson is not None else 'なし（標準のjsonで出力）'}")
+        self.stdout.write(
+            f"{'target':<16}{'rows':>7}{'drf ms/1k':>12}{'fast ms/1k':>12}{'speedup':>9}{'drf q':>8}{'fast q':>8}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['name']:<16}{result['rows']:>7}{result['drf_ms']:>12.1f}{result['fast_ms']:>12.1f}"
+                f"{result['drf_ms'] / result['fast_ms']:>8.1f}x{result['drf_queries']:>8}{result['fast_queries']:>8}"
+            )
+
+    def _add_edge_cases(self):
+        """出力の一致を確認するため、顧客が削除された予約やエスケープが必要な文字を含む行を先頭に加える"""
+        reservation = Reservation.objects.order_by('-start_time').first()
+        customer = Customer.objects.create(name='行区切り\u2028段落区切り\u2029"引用"\\', email=None, line_user_id=None)
+        Reservation.objects.create(
+            customer=None, salon=reservation.salon, service=reservation.service,
+            start_time=reservation.start_time, end_time=reservation.end_time,
+        )
+        LineMessage.objects.create(customer=customer, sender_type='admin', message='改行\nタブ\t制御\x01', image_url=None)
+        LineMessage.objects.create(customer=None, sender_type='customer', message=None)
+
+    def _measure(self, name, queryset, serializer_class, rows, repeat):
+        drf_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+
+        def drf():
+            return drf_renderer.render(serializer_class(queryset()[:rows], many=True).data)
+
+        def fast():
+            return fast_renderer.render(serialize_list(queryset()[:rows], serializer_class))
+
+        drf_body, drf_queries = self._run_once(drf)
+        fast_body, fast_queries = self._run_once(fast)
+        if drf_body != fast_body:
+            raise CommandError(f'{name}: 高速経路の出力がDRFの出力と一致しません')
+        count = len(json.loads(drf_body))
+        if not count:
+            raise CommandError(f'{name}: 計測対象のデータがありません')
+
+        timings = {'drf': [], 'fast': []}
+        for _ in range(repeat):
+            for label, func in (('drf', drf), ('fast', fast)):
+                started = time.perf_counter()
+                func()
+                timings[label].append((time.perf_counter() - started) * 1000)
+        return {
+            'name': name,
+            'rows': count,
+            'drf_ms': percentile(timings['drf'], 50) * 1000 / count,
+            'fast_ms': percentile(timings['fast'], 50) * 1000 / count,
+            'drf_queries': drf_queries,
+            'fast_queries': fast_queries,
+        }
+
+    def _run_once(self, func):
+        with CaptureQueriesContext(connection) as ctx:
+            body = func()
+        return body, len(ctx.captured_queries)
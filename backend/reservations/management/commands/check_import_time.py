@@ -0,0 +1,70 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# 起動時（django.setup() とURL読み込み）にimportされてはいけない重いSDK。
+# これらは reservations.adapters 経由で初回利用時にimportする。
+LAZY_MODULES = ('linebot', 'googleapiclient', 'google.cloud.storage', 'google.auth')
+
+STARTUP_CODE = (
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+_IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_import_times(output):
+    """-X importtime の出力を (モジュール名, 自身のus, 累積us, 深さ) のリストにする"""
+    rows = []
+    for line in output.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'django.setup() とURL読み込みのimport時間を -X importtime で計測し、予算を超えたら失敗します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget-ms', type=float, default=getattr(settings, 'IMPORT_TIME_BUDGET_MS', 400),
+            help='import時間の合計の上限（ミリ秒）',
+        )
+        parser.add_argument('--top', type=int, default=15, help='表示する遅いモジュールの件数')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'jello_backend_project.settings'))
+        # 計測は別プロセスで行う（このプロセスでは既にimport済みのため）
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+            env=env, capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'起動処理の実行に失敗しました:\n{result.stderr[-2000:]}')
+
+        rows = parse_import_times(result.stderr)
+        total_ms = sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000
+
+        self.stdout.write(f"{'module':<60}{'self(ms)':>10}{'cumulative(ms)':>16}")
+        for name, self_us, cumulative_us, _ in sorted(rows, key=lambda row: row[1], reverse=True)[:options['top']]:
+            self.stdout.write(f'{name:<60}{self_us / 1000:>10.1f}{cumulative_us / 1000:>16.1f}')
+        self.stdout.write(f"合計: {total_ms:.1f}ms（予算 {options['budget_ms']:.0f}ms）")
+
+        imported = {name for name, *_ in rows}
+        eager = [module for module in LAZY_MODULES if module in imported]
+        failures = []
+        if eager:
+            failures.append(f"起動時に遅延importすべきSDKが読み込まれています: {', '.join(eager)}")
+        if total_ms > options['budget_ms']:
+            failures.append(f"import時間 {total_ms:.1f}ms が予算 {options['budget_ms']:.0f}ms を超えています")
+        if failures:
+            for failure in failures:
+                self.stdout.write(self.style.ERROR(failure))
+            raise CommandError('import時間のチェックに失敗しました')
+        self.stdout.write(self.style.SUCCESS('import時間は予算内です'))
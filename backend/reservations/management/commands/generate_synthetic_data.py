@@ -0,0 +1,355 @@
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from reservations.changelog import allocate, build_change, record_changes
+from reservations.models import AvailableTimeSlot, Customer, LineMessage, Reservation, ReservationChange, Salon, Service
+
+# 生成したデータを識別・削除するための目印
+SYNTHETIC_SALON_PREFIX = '合成データ'
+SYNTHETIC_EMAIL_DOMAIN = 'synthetic.example.com'
+
+# (漢字, フリガナ)
+FAMILY_NAMES = [
+    ('佐藤', 'サトウ'), ('鈴木', 'スズキ'), ('高橋', 'タカハシ'), ('田中', 'タナカ'), ('伊藤', 'イトウ'),
+    ('渡辺', 'ワタナベ'), ('山本', 'ヤマモト'), ('中村', 'ナカムラ'), ('小林', 'コバヤシ'), ('加藤', 'カトウ'),
+    ('吉田', 'ヨシダ'), ('山田', 'ヤマダ'), ('佐々木', 'ササキ'), ('山口', 'ヤマグチ'), ('松本', 'マツモト'),
+    ('井上', 'イノウエ'), ('木村', 'キムラ'), ('林', 'ハヤシ'), ('斎藤', 'サイトウ'), ('清水', 'シミズ'),
+    ('山崎', 'ヤマザキ'), ('森', 'モリ'), ('池田', 'イケダ'), ('橋本', 'ハシモト'), ('阿部', 'アベ'),
+    ('石川', 'イシカワ'), ('山下', 'ヤマシタ'), ('中島', 'ナカジマ'), ('石井', 'イシイ'), ('小川', 'オガワ'),
+]
+GIVEN_NAMES = [
+    ('陽菜', 'ヒナ'), ('結衣', 'ユイ'), ('葵', 'アオイ'), ('美咲', 'ミサキ'), ('さくら', 'サクラ'),
+    ('愛', 'アイ'), ('優花', 'ユウカ'), ('彩', 'アヤ'), ('真由', 'マユ'), ('理沙', 'リサ'),
+    ('奈々', 'ナナ'), ('千尋', 'チヒロ'), ('遥', 'ハルカ'), ('恵', 'メグミ'), ('舞', 'マイ'),
+    ('楓', 'カエデ'), ('莉子', 'リコ'), ('明美', 'アケミ'), ('裕子', 'ユウコ'), ('直美', 'ナオミ'),
+    ('翔太', 'ショウタ'), ('大輔', 'ダイスケ'), ('健太', 'ケンタ'), ('拓也', 'タクヤ'), ('蓮', 'レン'),
+]
+# (名前, 料金, 所要時間(分))
+SERVICE_CATALOG = [
+    ('ワンカラージェル', 5500, 60),
+    ('グラデーションジェル', 6600, 90),
+    ('フレンチジェル', 7150, 90),
+    ('定額デザインコース', 8800, 120),
+    ('アートし放題コース', 11000, 150),
+    ('ジェルオフのみ', 2200, 30),
+    ('フットワンカラー', 7700, 90),
+    ('ハンドケア', 3300, 60),
+]
+CUSTOMER_MESSAGES = [
+    'こんにちは。予約の変更は可能でしょうか？', '明日よろしくお願いします。', '少し遅れそうです。すみません。',
+    'デザインの参考画像を送ります。', 'ありがとうございました！', '来月も予約したいです。',
+    '駐車場はありますか？', '爪が欠けてしまったのですが、お直しできますか？',
+]
+ADMIN_MESSAGES = [
+    'ご連絡ありがとうございます。確認いたします。', 'ご予約を承りました。', 'お気をつけてお越しください。',
+    '本日はご来店ありがとうございました。', '変更を承りました。', 'またのご来店をお待ちしております。',
+]
+OPENING_TIME = time(10, 0)
+CLOSING_TIME = time(19, 0)
+SLOT_MINUTES = 30
+
+
+@contextmanager
+def historical_timestamps(*fields):
+    """auto_now / auto_now_add を一時的に無効にし、過去日時をそのまま保存できるようにする"""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = '性能検証用に、サロン・顧客・LINEメッセージ・予約・受付時間の合成データを大量に生成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='乱数シード（同じシードと基準日なら同じデータになります）')
+        parser.add_argument('--anchor-date', help='基準日 YYYY-MM-DD（省略時は今日）。過去の予約はこの日より前に作成されます')
+        parser.add_argument('--salons', type=int, default=1, help='作成するサロン数')
+        parser.add_argument('--customers', type=int, default=100_000, help='作成する顧客数')
+        parser.add_argument('--messages', type=int, default=1_000_000, help='作成するLINEメッセージ数')
+        parser.add_argument('--years', type=int, default=3, help='予約履歴を作成する年数')
+        parser.add_argument('--future-days', type=int, default=90, help='基準日以降に受付時間・予約を作成する日数')
+        parser.add_argument('--batch-size', type=int, default=5000, help='bulk_createの1回あたりの件数')
+        parser.add_argument('--clear', action='store_true', help='生成前に、以前このコマンドで作成したデータを削除します')
+
+    def handle(self, *args, **options):
+        if options['anchor_date']:
+            try:
+                self.anchor = date.fromisoformat(options['anchor_date'])
+            except ValueError:
+                raise CommandError('--anchor-date は YYYY-MM-DD 形式で指定してください')
+        else:
+            self.anchor = timezone.localdate() if settings.USE_TZ else date.today()
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        if self.has_real_data():
+            # 受付時間は合成データと区別できず、実データに混ざると本物の予約枠として公開されてしまうため
+            raise CommandError(
+                '合成データ以外の顧客・サロン・受付時間があるデータベースでは実行できません。'
+                '性能検証用の空のデータベースで実行してください'
+            )
+        if options['clear']:
+            self.clear()
+        elif self.has_synthetic_data():
+            # 顧客のメールアドレス・予約番号が重複し、サロンとサービスも二重にできてしまうため、追加では作成しない
+            raise CommandError(
+                '以前に生成した合成データが残っています。--clear を付けて削除してから作り直してください'
+                '（同じシードと基準日なら同じデータになります）'
+            )
+
+        started = timezone.now()
+        # バッチごとのコミットを避けるため、全体を1トランザクションで作成する
+        with transaction.atomic():
+            salons, services = self.create_catalog(options['salons'])
+            customer_ids = self.create_customers(options['customers'])
+            if not customer_ids:
+                raise CommandError('顧客が1件もないため、予約とメッセージを作成できません')
+            self.create_time_slots(options['years'], options['future_days'])
+            self.create_reservations(salons, services, customer_ids, options['years'], options['future_days'])
+            self.create_messages(customer_ids, options['messages'], options['years'])
+
+            # bulk_createではシグナルが飛ばないため、未確定リマインダーはまとめて補完する
+            from reservations.reminders import reschedule_all_reminders
+            reschedule_all_reminders()
+            # 顧客の来店集計も作り直す
+            from reservations.customer_stats import refresh_all
+            refresh_all(self.batch_size)
+            # 同じく条件付きGET用のテーブルのバージョンも進める
+            from reservations.conditional import TRACKED_MODELS, bump
+            bump(*TRACKED_MODELS)
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f'合成データの生成が完了しました（{elapsed:.1f}秒）'))
+
+    # ------------------------------------------------------------------
+
+    def has_synthetic_data(self):
+        return (
+            Customer.objects.filter(email__endswith=f'@{SYNTHETIC_EMAIL_DOMAIN}').exists()
+            or Salon.objects.filter(name__startswith=SYNTHETIC_SALON_PREFIX).exists()
+        )
+
+    def has_real_data(self):
+        if (
+            Customer.objects.exclude(email__endswith=f'@{SYNTHETIC_EMAIL_DOMAIN}').exists()
+            or Salon.objects.exclude(name__startswith=SYNTHETIC_SALON_PREFIX).exists()
+        ):
+            return True
+        # 受付時間には目印がないため、合成データがないのに存在するものは実データとみなす
+        return not self.has_synthetic_data() and AvailableTimeSlot.objects.exists()
+
+    def clear(self):
+        self.stdout.write('以前の合成データを削除しています...')
+        with transaction.atomic():
+            Customer.objects.filter(email__endswith=f'@{SYNTHETIC_EMAIL_DOMAIN}').delete()
+            Salon.objects.filter(name__startswith=SYNTHETIC_SALON_PREFIX).delete()
+            # 実データがないことは確認済みのため、受付時間はすべて合成データ
+            AvailableTimeSlot.objects.all().delete()
+
+    def _aware(self, value):
+        if settings.USE_TZ:
+            return timezone.make_aware(value)
+        return value
+
+    def _random_datetime(self, start_day, days):
+        day = start_day + timedelta(days=self.rng.randrange(days))
+        seconds = self.rng.randrange(9 * 3600, 22 * 3600)
+        return self._aware(datetime.combine(day, time()) + timedelta(seconds=seconds))
+
+    def create_catalog(self, salon_count):
+        salons = Salon.objects.bulk_create([
+            Salon(
+                name=f'{SYNTHETIC_SALON_PREFIX} サロン{i + 1}',
+                address=f'東京都渋谷区神南{i + 1}-{self.rng.randint(1, 30)}-{self.rng.randint(1, 20)}',
+                phone_number=f'03-{self.rng.randint(1000, 9999)}-{self.rng.randint(1000, 9999)}',
+            )
+            for i in range(salon_count)
+        ])
+        # bulk_createで主キーが返らないDBに備えて取り直す
+        salons = list(Salon.objects.filter(name__startswith=SYNTHETIC_SALON_PREFIX).order_by('id'))
+        Service.objects.bulk_create([
+            Service(salon=salon, name=name, price=price, duration_minutes=duration)
+            for salon in salons
+            for name, price, duration in SERVICE_CATALOG
+        ])
+        services = {}
+        for service in Service.objects.filter(salon__in=salons).order_by('id'):
+            services.setdefault(service.salon_id, []).append(service)
+        self.stdout.write(f'サロン {len(salons)} 件 / サービス {sum(len(v) for v in services.values())} 件を作成しました')
+        return salons, services
+
+    def create_customers(self, count):
+        created_field = Customer._meta.get_field('created_at')
+        updated_field = Customer._meta.get_field('updated_at')
+        history_days = 365 * 5
+
+        def rows():
+            for n in range(count):
+                family, family_kana = self.rng.choice(FAMILY_NAMES)
+                given, given_kana = self.rng.choice(GIVEN_NAMES)
+                created_at = self._random_datetime(self.anchor - timedelta(days=history_days), history_days)
+                # 約85%はLINE連携済み。うち一部はブロック等で送信不可
+                has_line = self.rng.random() < 0.85
+                reachable = not has_line or self.rng.random() > 0.05
+                yield Customer(
+                    line_user_id=f'Usynthetic{n:08d}' if has_line else None,
+                    name=f'{family} {given}',
+                    furigana=f'{family_kana} {given_kana}',
+                    email=f'c{n:07d}@{SYNTHETIC_EMAIL_DOMAIN}',
+                    phone_number=f'090-{self.rng.randint(1000, 9999)}-{self.rng.randint(1000, 9999)}',
+                    line_display_name=given if has_line else '',
+                    line_reachable=reachable,
+                    line_unreachable_at=None if reachable else created_at,
+                    created_at=created_at,
+                    updated_at=created_at,
+                )
+
+        with historical_timestamps(created_field, updated_field):
+            for batch in chunked(rows(), self.batch_size):
+                Customer.objects.bulk_create(batch)
+        customer_ids = list(
+            Customer.objects.filter(email__endswith=f'@{SYNTHETIC_EMAIL_DOMAIN}').order_by('id').values_list('id', flat=True)
+        )
+        self.stdout.write(f'顧客 {len(customer_ids)} 件を作成しました')
+        return customer_ids
+
+    def create_time_slots(self, years, future_days):
+        first_day = self.anchor - timedelta(days=365 * years)
+        total_days = 365 * years + future_days
+        slot_times = []
+        current = datetime.combine(self.anchor, OPENING_TIME)
+        while current.time() < CLOSING_TIME:
+            slot_times.append(current.time())
+            current += timedelta(minutes=SLOT_MINUTES)
+
+        def rows():
+            for offset in range(total_days):
+                day = first_day + timedelta(days=offset)
+                # 毎週火曜は定休日
+                if day.weekday() == 1:
+                    continue
+                for slot_time in slot_times:
+                    yield AvailableTimeSlot(date=day, time=slot_time)
+
+        created = 0
+        for batch in chunked(rows(), self.batch_size):
+            AvailableTimeSlot.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        self.stdout.write(f'受付時間 {created} 件を作成しました')
+
+    def _pick_customer(self, customer_ids):
+        # 常連ほど多く来店するよう、先頭側に偏らせて選ぶ
+        return customer_ids[int(len(customer_ids) * self.rng.random() ** 2.5)]
+
+    def _reservation_status(self, start_time, now):
+        roll = self.rng.random()
+        if start_time < now:
+            return 'cancelled' if roll < 0.08 else 'confirmed'
+        if roll < 0.05:
+            return 'cancelled'
+        return 'pending' if roll < 0.35 else 'confirmed'
+
+    def create_reservations(self, salons, services, customer_ids, years, future_days):
+        first_day = self.anchor - timedelta(days=365 * years)
+        total_days = 365 * years + future_days
+        now = self._aware(datetime.combine(self.anchor, time()))
+        # 1日あたりの営業時間（分）
+        open_minutes = (CLOSING_TIME.hour - OPENING_TIME.hour) * 60 + CLOSING_TIME.minute - OPENING_TIME.minute
+
+        def rows():
+            for offset in range(total_days):
+                day = first_day + timedelta(days=offset)
+                if day.weekday() == 1:
+                    continue
+                for salon in salons:
+                    # 1日の予約をネイリスト1人分として、重ならないように先頭から詰める
+                    cursor = 0
+                    while cursor < open_minutes:
+                        cursor += SLOT_MINUTES * self.rng.choice((0, 0, 1, 2, 4))
+                        service = self.rng.choice(services[salon.id])
+                        if cursor + service.duration_minutes > open_minutes:
+                            break
+                        start_time = self._aware(datetime.combine(day, OPENING_TIME) + timedelta(minutes=cursor))
+                        cursor += service.duration_minutes
+                        reservation = Reservation(
+                            reservation_number=uuid.UUID(int=self.rng.getrandbits(128), version=4),
+                            customer_id=self._pick_customer(customer_ids),
+                            salon=salon,
+                            service=service,
+                            start_time=start_time,
+                            end_time=start_time + timedelta(minutes=service.duration_minutes),
+                            status=self._reservation_status(start_time, now),
+                        )
+                        # bulk_create では save() が呼ばれないため、予約時点のサービス内容をここで写し取る
+                        reservation.snapshot_service()
+                        yield reservation
+
+        created = 0
+        for batch in chunked(rows(), self.batch_size):
+            Reservation.objects.bulk_create(batch)
+            # bulk_create ではシグナルが発生しないため、変更ログもまとめて書く
+            record_changes([build_change(reservation, ReservationChange.KIND_CREATED) for reservation in batch])
+            created += len(batch)
+        self.stdout.write(f'予約 {created} 件を作成しました')
+
+    def create_messages(self, customer_ids, count, years):
+        sent_at_field = LineMessage._meta.get_field('sent_at')
+        history_days = 365 * years
+        start_day = self.anchor - timedelta(days=history_days)
+
+        def sent_times():
+            # 同期用の連番（seq）が送信日時の順に並ぶよう、1日ずつ古い順に日時を作る
+            for index in range(history_days):
+                day_count = count * (index + 1) // history_days - count * index // history_days
+                day = datetime.combine(start_day + timedelta(days=index), time())
+                for seconds in sorted(self.rng.randrange(9 * 3600, 22 * 3600) for _ in range(day_count)):
+                    yield self._aware(day + timedelta(seconds=seconds))
+
+        def rows():
+            for sent_at in sent_times():
+                from_customer = self.rng.random() < 0.55
+                with_image = self.rng.random() < 0.05
+                yield LineMessage(
+                    id=uuid.UUID(int=self.rng.getrandbits(128), version=4),
+                    customer_id=self._pick_customer(customer_ids),
+                    sender_type='customer' if from_customer else 'admin',
+                    message=None if with_image else self.rng.choice(CUSTOMER_MESSAGES if from_customer else ADMIN_MESSAGES),
+                    image_url=f'https://storage.googleapis.com/synthetic/{self.rng.getrandbits(64):016x}.jpg' if with_image else None,
+                    sent_at=sent_at,
+                )
+
+        created = 0
+        with historical_timestamps(sent_at_field):
+            for batch in chunked(rows(), self.batch_size):
+                # bulk_create では save() が呼ばれないため、連番をまとめて採番する
+                with transaction.atomic():
+                    first_seq = allocate(len(batch), LineMessage.SEQUENCE_NAME)
+                    for offset, message in enumerate(batch):
+                        message.seq = first_seq + offset
+                    LineMessage.objects.bulk_create(batch)
+                created += len(batch)
+                if created % (self.batch_size * 40) == 0:
+                    self.stdout.write(f'  LINEメッセージ {created}/{count} 件...')
+        self.stdout.write(f'LINEメッセージ {created} 件を作成しました')
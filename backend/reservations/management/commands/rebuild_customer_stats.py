@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations.customer_stats import refresh_all
+
+
+class Command(BaseCommand):
+    help = '全顧客の来店集計（来店回数・最終来店日時・次回予約日時・累計利用金額）を予約から作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='1回のUPDATEで更新する顧客数')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size は1以上を指定してください')
+        total = refresh_all(batch_size, progress=lambda count: self.stdout.write(f'  {count} 件...'))
+        self.stdout.write(self.style.SUCCESS(f'顧客 {total} 件の来店集計を更新しました'))
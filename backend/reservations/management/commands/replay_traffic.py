@@ -0,0 +1,114 @@
+import json
+from statistics import mean
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations.instrumentation import percentile
+from reservations.traffic import read_traffic, replay
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Command(BaseCommand):
+    help = (
+        'TrafficCaptureMiddlewareで記録したリクエストを候補環境とベースライン環境に再生し、'
+        'エンドポイントごとのレイテンシ分布とクエリ数を比較します'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture_file', help='TRAFFIC_CAPTURE_PATH に記録されたJSONLファイル')
+        parser.add_argument('--candidate', required=True, help='候補環境のベースURL（例: http://localhost:8001）')
+        parser.add_argument('--baseline', required=True, help='ベースライン環境のベースURL（例: http://localhost:8000）')
+        parser.add_argument('--concurrency', type=int, default=4, help='同時に送信するリクエスト数')
+        parser.add_argument('--limit', type=int, help='再生する最大件数')
+        parser.add_argument('--admin-token', help='管理者として記録されたリクエストに付けるアクセストークン')
+        parser.add_argument('--customer-token', help='顧客として記録されたリクエストに付けるアクセストークン')
+        parser.add_argument(
+            '--include-writes', action='store_true',
+            help='POST/PUT/PATCH/DELETEも再生します（再生先のデータが変更されます）',
+        )
+        parser.add_argument('--output', help='比較結果をJSONで保存するファイル')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency は1以上を指定してください')
+        try:
+            records = read_traffic(options['capture_file'], limit=options['limit'])
+        except OSError as e:
+            raise CommandError(f'キャプチャファイルを読み込めません: {e}')
+
+        tokens = {'admin': options['admin_token'], 'customer': options['customer_token']}
+        replayable, skipped = [], 0
+        for record in records:
+            if record.get('body_omitted'):
+                skipped += 1
+            elif record['method'] not in READ_ONLY_METHODS and not options['include_writes']:
+                skipped += 1
+            elif record.get('auth') not in ('anonymous', None) and not tokens.get(record.get('auth')):
+                skipped += 1
+            else:
+                replayable.append(record)
+        self.stdout.write(f'再生対象: {len(replayable)} 件（スキップ: {skipped} 件）')
+        if not replayable:
+            raise CommandError('再生できるリクエストがありません')
+
+        # 互いの負荷が干渉しないよう、ベースライン→候補の順に同じ記録を順番に流す
+        results = {}
+        for label in ('baseline', 'candidate'):
+            self.stdout.write(f'{label} ({options[label]}) に再生しています...')
+            results[label] = replay(replayable, options[label], tokens, concurrency=options['concurrency'])
+
+        report = self._compare(results['baseline'], results['candidate'])
+        self._print(report, results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"比較結果を保存しました: {options['output']}"))
+
+    def _summarize(self, result, endpoint):
+        latencies = result.latencies.get(endpoint, [])
+        queries = result.queries.get(endpoint, [])
+        return {
+            'count': len(latencies),
+            'errors': result.errors.get(endpoint, 0),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'queries_mean': round(mean(queries), 2) if queries else None,
+            'statuses': {str(code): count for code, count in sorted(result.statuses.get(endpoint, {}).items())},
+        }
+
+    def _compare(self, baseline, candidate):
+        endpoints = sorted(set(baseline.latencies) | set(candidate.latencies) | set(baseline.errors) | set(candidate.errors))
+        report = {}
+        for endpoint in endpoints:
+            base = self._summarize(baseline, endpoint)
+            cand = self._summarize(candidate, endpoint)
+            delta = None
+            if base['p95_ms']:
+                delta = round((cand['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100, 1)
+            report[endpoint] = {'baseline': base, 'candidate': cand, 'p95_delta_percent': delta}
+        return report
+
+    def _print(self, report, results):
+        self.stdout.write(
+            f"{'endpoint':<40}{'n':>6}{'p50 base':>10}{'p50 cand':>10}{'p95 base':>10}{'p95 cand':>10}"
+            f"{'Δp95%':>8}{'q base':>8}{'q cand':>8}"
+        )
+        for endpoint, data in report.items():
+            base, cand = data['baseline'], data['candidate']
+            delta = data['p95_delta_percent']
+            line = (
+                f"{endpoint[:39]:<40}{cand['count']:>6}{base['p50_ms']:>10.1f}{cand['p50_ms']:>10.1f}"
+                f"{base['p95_ms']:>10.1f}{cand['p95_ms']:>10.1f}"
+                f"{'-' if delta is None else f'{delta:+.1f}':>8}"
+                f"{'-' if base['queries_mean'] is None else base['queries_mean']:>8}"
+                f"{'-' if cand['queries_mean'] is None else cand['queries_mean']:>8}"
+            )
+            if base['statuses'] != cand['statuses']:
+                line += f"  status {base['statuses']} -> {cand['statuses']}"
+            self.stdout.write(line)
+        for label, result in results.items():
+            total = sum(len(v) for v in result.latencies.values())
+            rps = total / result.elapsed if result.elapsed else 0.0
+            self.stdout.write(f'{label}: {total} リクエスト / {result.elapsed:.1f}秒 ({rps:.1f} req/s)')
@@ -0,0 +1,266 @@
+# backend/reservations/middleware.py
+import logging
+import random
+import time
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from . import instrumentation, profiling, structured_logging, traffic
+from .models import RequestProfile
+
+try:
+    import brotli
+except ImportError:  # requirements.txt で導入する。未インストールの環境ではgzipだけを使う
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class RequestIdMiddleware:
+    """
+    リクエストごとに相関IDを発行し、その間に出力されるログへ付与するミドルウェア。
+    クライアントやロードバランサーから X-Request-ID が渡された場合はそれを引き継ぎ、レスポンスにも返す。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id, token = structured_logging.bind_request_id(
+            request.headers.get(structured_logging.REQUEST_ID_HEADER)
+        )
+        request.request_id = request_id
+        try:
+            response = self.get_response(request)
+        finally:
+            structured_logging.reset_request_id(token)
+        response[structured_logging.REQUEST_ID_HEADER] = request_id
+        return response
+
+
+class RequestTimingMiddleware:
+    """
+    リクエストごとの所要時間をDB・外部HTTP（ホスト別）・ストレージ・シリアライズに分けて計測し、
+    Server-Timingヘッダーとエンドポイント別のヒストグラムとして出力するミドルウェア。
+    Server-Timingヘッダーは SERVER_TIMING_ENABLED のとき、それ以外は DEBUG 時と職員のリクエストにだけ付ける。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings, token = instrumentation.start_request_timings()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(instrumentation.db_execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            instrumentation.end_request_timings(token)
+        total = time.perf_counter() - start
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        endpoint = (resolver_match.view_name if resolver_match else None) or 'unmatched'
+        instrumentation.observe_request(endpoint, request.method, response.status_code, total, timings)
+
+        if self._exposes_timing(request):
+            response['Server-Timing'] = instrumentation.server_timing_header(timings, total)
+        return response
+
+    @staticmethod
+    def _exposes_timing(request):
+        if getattr(settings, 'SERVER_TIMING_ENABLED', False) or settings.DEBUG:
+            return True
+        # DRFの認証結果（JWT）はビューの中で request.user に設定される
+        return getattr(getattr(request, 'user', None), 'is_staff', False)
+
+
+class RequestProfilingMiddleware:
+    """
+    管理者が X-Profile: 1 ヘッダーまたは ?_profile=1 を付けたリクエストについて、
+    reservations/views.py のビューの実行中のスタックとSQLを記録して RequestProfile に保存する。
+    フラグのないリクエストではヘッダーを1つ確認するだけで何もしない。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        session = getattr(request, '_profiling_session', None)
+        if session is not None:
+            profile = self._finish(request, session, response)
+            if profile is not None:
+                response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not profiling.is_profile_requested(request):
+            return None
+        view_class = getattr(view_func, 'cls', None)
+        if getattr(view_class, '__module__', None) != 'reservations.views':
+            return None
+        if random.random() >= getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0):
+            return None
+        user = self._authenticate_admin(request)
+        if user is None:
+            return None
+
+        recorder = profiling.QueryRecorder()
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        profiler = profiling.SamplingProfiler()
+        profiler.start()
+        request._profiling_session = {
+            'user': user,
+            'recorder': recorder,
+            'profiler': profiler,
+            'exit_stack': stack,
+            'started': time.perf_counter(),
+        }
+        return None
+
+    def _authenticate_admin(self, request):
+        """プロファイルは管理者（is_staff）のみ取得できる"""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and getattr(user, 'is_staff', False):
+            return user
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except (AuthenticationFailed, InvalidToken):
+            return None
+        if result and getattr(result[0], 'is_staff', False):
+            return result[0]
+        return None
+
+    def _finish(self, request, session, response):
+        duration_ms = (time.perf_counter() - session['started']) * 1000
+        session['profiler'].stop()
+        session['exit_stack'].close()
+        recorder = session['recorder']
+        resolver_match = getattr(request, 'resolver_match', None)
+        try:
+            return RequestProfile.objects.create(
+                user=session['user'],
+                method=request.method,
+                path=request.get_full_path()[:2048],
+                view_name=(resolver_match.view_name if resolver_match else '') or '',
+                status_code=response.status_code,
+                duration_ms=duration_ms,
+                sample_count=session['profiler'].sample_count,
+                stacks=session['profiler'].collapsed(),
+                queries=recorder.queries,
+                query_count=len(recorder.queries) + recorder.truncated,
+            )
+        except Exception:
+            logger.exception("リクエストプロファイルの保存に失敗しました")
+            return None
+
+
+class TrafficCaptureMiddleware:
+    """
+    /api/ へのリクエストを、認証トークンと個人情報を取り除いた上でJSONLファイルに記録する。
+    TRAFFIC_CAPTURE_PATH が設定されているときだけ有効になる。記録は replay_traffic コマンドで再生できる。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        path = getattr(settings, 'TRAFFIC_CAPTURE_PATH', '')
+        self.log = traffic.TrafficLog(path) if path else None
+
+    def __call__(self, request):
+        if self.log is None or not traffic.should_capture(request.path):
+            return self.get_response(request)
+        if random.random() >= getattr(settings, 'TRAFFIC_CAPTURE_SAMPLE_RATE', 1.0):
+            return self.get_response(request)
+
+        body, body_omitted = traffic.capture_body(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        timings = instrumentation.current_timings()
+        resolver_match = getattr(request, 'resolver_match', None)
+        try:
+            self.log.append({
+                'captured_at': datetime.now().isoformat(),
+                'method': request.method,
+                'path': request.path,
+                'query': traffic.sanitize_query_string(request.META.get('QUERY_STRING', '')),
+                'body': body,
+                'body_omitted': body_omitted,
+                'auth': traffic.auth_kind(request),
+                'endpoint': (resolver_match.view_name if resolver_match else None) or 'unmatched',
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 3),
+                'queries': timings.counts.get('db', 0) if timings else None,
+            })
+        except Exception:
+            logger.exception("トラフィックの記録に失敗しました")
+        return response
+
+
+def _accepted_encodings(header):
+    """Accept-Encoding を {エンコーディング: q値} にする（q=0 は受け付けないという意味）"""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    レスポンスをクライアントの Accept-Encoding に合わせて圧縮するミドルウェア。
+    brotli がインストールされていて br を受け付けるクライアントにはbrotli、それ以外はgzip（GZipMiddlewareの処理）で圧縮する。
+    JWTを返すレスポンスは、圧縮後のサイズから秘密の値を推測される（BREACH）のを防ぐため圧縮しない。
+    brotliにはGZipMiddlewareのようなランダム長のパディングを入れられないため、対象のURLで除外する。
+    """
+    BROTLI_QUALITY = 5
+    # レスポンスにアクセストークン・リフレッシュトークンを含むURL名
+    TOKEN_URL_NAMES = frozenset({'token_obtain_pair', 'token_refresh', 'line-callback', 'admin-login-line'})
+
+    def process_response(self, request, response):
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is not None and resolver_match.url_name in self.TOKEN_URL_NAMES:
+            return response
+        if response.streaming or len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return super().process_response(request, response)
+
+        accepted = _accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is None or accepted.get('br', 0) <= 0:
+            if accepted.get('gzip', 0) <= 0:
+                # GZipMiddlewareは q=0 を考慮しないため、gzipを受け付けない場合はここで返す
+                patch_vary_headers(response, ('Accept-Encoding',))
+                return response
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content, quality=self.BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
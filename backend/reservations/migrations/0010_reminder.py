@@ -0,0 +1,49 @@
+# Generated by Django 4.2.22 on 2026-10-19 13:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0009_remove_userprofile_full_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('unconfirmed', '【管理者向け】予約未確定リマインダー'), ('schedule', '【管理者向け】スケジュールリマインダー'), ('customer_day_before', '【顧客向け】前日リマインダー')], max_length=30, verbose_name='種類')),
+                ('remind_at', models.DateTimeField(verbose_name='送信予定日時')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='送信日時')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+            ],
+            options={
+                'verbose_name': 'リマインダー',
+                'verbose_name_plural': 'リマインダー',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['status', 'start_time'], name='reservation_status_start_idx'),
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='reservation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='reservations.reservation'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['remind_at'], name='reminder_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reminder',
+            constraint=models.UniqueConstraint(fields=('reservation', 'kind'), name='unique_reminder_per_reservation'),
+        ),
+        migrations.AddConstraint(
+            model_name='reminder',
+            constraint=models.UniqueConstraint(condition=models.Q(('reservation__isnull', True)), fields=('kind', 'remind_at'), name='unique_schedule_reminder_per_time'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.22 on 2026-10-19 13:42
+
+import django.core.validators
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0011_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationsetting',
+            name='staff_alert_digest_minutes',
+            field=models.IntegerField(default=5, help_text='職員向けの通知をこの分数だけ溜めてから1通にまとめて送信します。0を指定すると即時送信します（0〜60分）。', validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(60)], verbose_name='【管理者向け】通知のまとめ送信間隔（分）'),
+        ),
+        migrations.CreateModel(
+            name='StaffAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient_line_user_id', models.CharField(max_length=255, verbose_name='送信先LINEユーザーID')),
+                ('alert_type', models.CharField(max_length=30, verbose_name='通知種別')),
+                ('message', models.TextField(verbose_name='メッセージ')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='作成日時')),
+                ('deliver_after', models.DateTimeField(verbose_name='送信予定日時')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='送信日時')),
+            ],
+            options={
+                'verbose_name': '職員向け通知（まとめ送信待ち）',
+                'verbose_name_plural': '職員向け通知（まとめ送信待ち）',
+                'indexes': [models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['deliver_after'], name='staff_alert_due_idx'), models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['recipient_line_user_id'], name='staff_alert_pending_idx')],
+            },
+        ),
+    ]
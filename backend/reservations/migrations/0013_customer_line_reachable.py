@@ -0,0 +1,27 @@
+# Generated by Django 4.2.22 on 2026-10-19 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0012_staff_alert_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='line_reachable',
+            field=models.BooleanField(default=True, help_text='ブロック・友だち解除されている場合はFalseになり、LINE送信の対象外になります。', verbose_name='LINE送信可能'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='line_unreachable_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='LINE送信不可になった日時'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('line_reachable', True), ('line_user_id__isnull', False)), fields=['line_user_id'], name='customer_line_reachable_idx'),
+        ),
+    ]
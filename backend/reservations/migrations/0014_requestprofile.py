@@ -0,0 +1,37 @@
+# Generated by Django 4.2.22 on 2026-10-19 13:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0013_customer_line_reachable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10, verbose_name='HTTPメソッド')),
+                ('path', models.CharField(max_length=2048, verbose_name='パス')),
+                ('view_name', models.CharField(blank=True, max_length=255, verbose_name='ビュー名')),
+                ('status_code', models.PositiveIntegerField(null=True, verbose_name='ステータスコード')),
+                ('duration_ms', models.FloatField(verbose_name='所要時間（ミリ秒）')),
+                ('sample_count', models.PositiveIntegerField(default=0, verbose_name='サンプル数')),
+                ('stacks', models.TextField(blank=True, verbose_name='スタック（collapsed形式）')),
+                ('queries', models.JSONField(default=list, verbose_name='SQL一覧')),
+                ('query_count', models.PositiveIntegerField(default=0, verbose_name='SQL件数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='作成日時')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'リクエストプロファイル',
+                'verbose_name_plural': 'リクエストプロファイル',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.22 on 2026-10-19 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0014_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='linemessage',
+            index=models.Index(fields=['customer', 'sent_at', 'id'], name='linemessage_customer_sync_idx'),
+        ),
+    ]
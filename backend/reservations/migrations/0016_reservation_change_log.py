@@ -0,0 +1,54 @@
+# Generated by Django 4.2.22 on 2026-10-19 14:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def create_sequence_counter(apps, schema_editor):
+    """変更ログの採番用の行を作っておく（採番時の行ロックで順序を保証するため）"""
+    SequenceCounter = apps.get_model('reservations', 'SequenceCounter')
+    SequenceCounter.objects.get_or_create(name='reservation_change')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0015_linemessage_sync_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='名前')),
+                ('value', models.PositiveBigIntegerField(default=0, verbose_name='最後に採番した値')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新日時'),
+        ),
+        migrations.CreateModel(
+            name='ReservationChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField(unique=True, verbose_name='シーケンス番号')),
+                ('reservation_number', models.UUIDField(verbose_name='予約番号')),
+                ('kind', models.CharField(choices=[('created', '作成'), ('status_changed', 'ステータス変更'), ('rescheduled', '日時変更'), ('deleted', '削除')], max_length=20, verbose_name='種別')),
+                ('old_status', models.CharField(blank=True, max_length=20, verbose_name='変更前のステータス')),
+                ('status', models.CharField(max_length=20, verbose_name='ステータス')),
+                ('start_time', models.DateTimeField(null=True, verbose_name='開始日時')),
+                ('end_time', models.DateTimeField(null=True, verbose_name='終了日時')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='変更日時')),
+                ('reservation', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='changes', to='reservations.reservation', verbose_name='予約')),
+            ],
+            options={
+                'verbose_name': '予約の変更ログ',
+                'verbose_name_plural': '予約の変更ログ',
+                'ordering': ['seq'],
+            },
+        ),
+        migrations.RunPython(create_sequence_counter, migrations.RunPython.noop),
+    ]
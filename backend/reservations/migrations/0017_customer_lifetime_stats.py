@@ -0,0 +1,87 @@
+# Generated by Django 4.2.22 on 2026-10-19 14:21
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_customer_stats(apps, schema_editor):
+    """
+    既存の顧客の集計列を予約から埋める（この時点では確定済みが来店、料金はサービスの現在の料金）。
+    大きなテーブルで1つのUPDATEが長くならないよう、主キーの範囲ごとに更新する。
+    マイグレーションを atomic = False にしているため、バッチごとにコミットされ行ロックを持ち続けない。
+    """
+    Customer = apps.get_model('reservations', 'Customer')
+    Reservation = apps.get_model('reservations', 'Reservation')
+    now = timezone.now()
+    reservations = Reservation.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    visits = reservations.filter(status='confirmed', start_time__lte=now)
+    upcoming = reservations.filter(status__in=('pending', 'confirmed'), start_time__gt=now)
+    last_id = 0
+    while True:
+        ids = list(Customer.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:BACKFILL_BATCH_SIZE])
+        if not ids:
+            break
+        Customer.objects.filter(pk__gte=ids[0], pk__lte=ids[-1]).update(
+            visit_count=Coalesce(Subquery(visits.annotate(value=Count('pk')).values('value')), Value(0)),
+            last_visit_at=Subquery(visits.annotate(value=Max('start_time')).values('value')),
+            next_booking_at=Subquery(upcoming.annotate(value=Min('start_time')).values('value')),
+            total_spend=Coalesce(
+                Subquery(visits.annotate(value=Sum('service__price')).values('value')), Value(0),
+                output_field=models.DecimalField(max_digits=12, decimal_places=0),
+            ),
+        )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # バックフィルをバッチごとにコミットするため、全体を1つのトランザクションにしない
+    # （途中で失敗した場合は、適用済みの操作を確認してから再実行すること）
+    atomic = False
+
+    dependencies = [
+        ('reservations', '0016_reservation_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_visit_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='最終来店日時'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='next_booking_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='次回予約日時'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='total_spend',
+            field=models.DecimalField(decimal_places=0, default=0, editable=False, max_digits=12, verbose_name='累計利用金額'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='visit_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='来店回数'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['visit_count'], name='customer_visit_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['last_visit_at'], name='customer_last_visit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['next_booking_at'], name='customer_next_booking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['total_spend'], name='customer_total_spend_idx'),
+        ),
+        migrations.RunPython(backfill_customer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.22 on 2026-10-19 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0017_customer_lifetime_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='セグメント名')),
+                ('criteria', models.JSONField(default=dict, verbose_name='絞り込み条件')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '顧客セグメント',
+                'verbose_name_plural': '顧客セグメント',
+                'ordering': ['name', 'pk'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['customer', 'start_time'], name='reservation_customer_start_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.22 on 2026-10-19 14:26
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_service_snapshot(apps, schema_editor):
+    """
+    既存の予約に現在のサービスの名前・料金・所要時間を写す（過去の価格は残っていないため、今の値で埋める）。
+    大きなテーブルで1つのUPDATEが長くならないよう、主キーの範囲ごとに更新する。
+    マイグレーションを atomic = False にしているため、バッチごとにコミットされ行ロックを持ち続けない。
+    """
+    Reservation = apps.get_model('reservations', 'Reservation')
+    Service = apps.get_model('reservations', 'Service')
+    service = Service.objects.filter(pk=OuterRef('service_id'))
+    last_id = 0
+    while True:
+        ids = list(Reservation.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:BACKFILL_BATCH_SIZE])
+        if not ids:
+            break
+        Reservation.objects.filter(pk__gte=ids[0], pk__lte=ids[-1]).update(
+            service_name=Subquery(service.values('name')[:1]),
+            price=Subquery(service.values('price')[:1]),
+            duration_minutes=Subquery(service.values('duration_minutes')[:1]),
+        )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # バックフィルをバッチごとにコミットするため、全体を1つのトランザクションにしない
+    # （途中で失敗した場合は、適用済みの操作を確認してから再実行すること）
+    atomic = False
+
+    dependencies = [
+        ('reservations', '0018_customer_segments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='所要時間(分)（予約時点）'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='price',
+            field=models.DecimalField(decimal_places=0, default=0, editable=False, max_digits=8, verbose_name='料金（予約時点）'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='service_name',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='サービス名（予約時点）'),
+        ),
+        migrations.RunPython(backfill_service_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.22 on 2026-10-19 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0019_reservation_service_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='バージョン'),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='status',
+            field=models.CharField(choices=[('pending', '保留中'), ('confirmed', '確定済み'), ('cancelled', 'キャンセル済み'), ('completed', '完了済み')], default='pending', max_length=20),
+        ),
+    ]
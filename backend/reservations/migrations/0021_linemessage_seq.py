@@ -0,0 +1,59 @@
+# Generated by Django 4.2.22 on 2026-10-19 20:10
+
+from django.db import migrations, models
+from django.db.models import Q
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_line_message_seq(apps, schema_editor):
+    """
+    既存のメッセージに (sent_at, id) の順で連番を振り、採番用の行を最後の番号にする。
+    大きなテーブルで1つのUPDATEが長くならないよう、一定件数ごとに更新する。
+    マイグレーションを atomic = False にしているため、バッチごとにコミットされ行ロックを持ち続けない。
+    """
+    LineMessage = apps.get_model('reservations', 'LineMessage')
+    SequenceCounter = apps.get_model('reservations', 'SequenceCounter')
+    seq = 0
+    last = None
+    while True:
+        queryset = LineMessage.objects.order_by('sent_at', 'id').only('id', 'sent_at')
+        if last is not None:
+            queryset = queryset.filter(Q(sent_at__gt=last.sent_at) | Q(sent_at=last.sent_at, id__gt=last.id))
+        batch = list(queryset[:BACKFILL_BATCH_SIZE])
+        if not batch:
+            break
+        for message in batch:
+            seq += 1
+            message.seq = seq
+        LineMessage.objects.bulk_update(batch, ['seq'])
+        last = batch[-1]
+    SequenceCounter.objects.update_or_create(name='line_message', defaults={'value': seq})
+
+
+class Migration(migrations.Migration):
+    # バックフィルをバッチごとにコミットするため、全体を1つのトランザクションにしない
+    # （途中で失敗した場合は、適用済みの操作を確認してから再実行すること）
+    atomic = False
+
+    dependencies = [
+        ('reservations', '0020_reservation_state_machine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linemessage',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False, null=True, verbose_name='同期用の連番'),
+        ),
+        migrations.RunPython(backfill_line_message_seq, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='linemessage',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False, verbose_name='同期用の連番'),
+        ),
+        migrations.AddIndex(
+            model_name='linemessage',
+            index=models.Index(fields=['customer', 'seq'], name='linemessage_customer_seq_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.22 on 2026-10-19 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0021_linemessage_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='送信失敗回数'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.22 on 2026-10-19 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0022_reminder_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staffalert',
+            name='image_url',
+            field=models.URLField(blank=True, max_length=2048, null=True, verbose_name='画像URL'),
+        ),
+    ]
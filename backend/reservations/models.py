@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -101,10 +101,36 @@ class Customer(models.Model):
     phone_number = models.CharField("電話番号", max_length=20, blank=True)
     line_display_name = models.CharField("LINE表示名", max_length=100, blank=True, help_text="LINEプロフィールの表示名です。")
     line_picture_url = models.URLField("LINEプロフィール画像URL", max_length=2048, blank=True)
+    line_reachable = models.BooleanField(
+        "LINE送信可能", default=True,
+        help_text="ブロック・友だち解除されている場合はFalseになり、LINE送信の対象外になります。"
+    )
+    line_unreachable_at = models.DateTimeField("LINE送信不可になった日時", null=True, blank=True)
     notes = models.TextField("備考", blank=True, help_text="顧客に関するメモなどを記載します。")
     created_at = models.DateTimeField("作成日時", auto_now_add=True)
     updated_at = models.DateTimeField("更新日時", auto_now=True)
 
+    # 来店集計（customer_stats.py が予約の変更と同じトランザクションで更新する。直接編集しない）
+    visit_count = models.PositiveIntegerField("来店回数", default=0, editable=False)
+    last_visit_at = models.DateTimeField("最終来店日時", null=True, blank=True, editable=False)
+    next_booking_at = models.DateTimeField("次回予約日時", null=True, blank=True, editable=False)
+    total_spend = models.DecimalField("累計利用金額", max_digits=12, decimal_places=0, default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # LINE送信先の絞り込み（連携済みかつ送信可能な顧客）用の部分インデックス
+            models.Index(
+                fields=['line_user_id'],
+                condition=models.Q(line_reachable=True, line_user_id__isnull=False),
+                name='customer_line_reachable_idx',
+            ),
+            # 顧客一覧の並べ替え・絞り込み用
+            models.Index(fields=['visit_count'], name='customer_visit_count_idx'),
+            models.Index(fields=['last_visit_at'], name='customer_last_visit_idx'),
+            models.Index(fields=['next_booking_at'], name='customer_next_booking_idx'),
+            models.Index(fields=['total_spend'], name='customer_total_spend_idx'),
+        ]
+
     @property
     def is_authenticated(self):
         return True
@@ -124,11 +150,115 @@ class Reservation(models.Model):
     service = models.ForeignKey(Service, on_delete=models.CASCADE)
     start_time = models.DateTimeField(null=True)
     end_time = models.DateTimeField(null=True)
-    status = models.CharField(max_length=20, choices=[('pending', '保留中'), ('confirmed', '確定済み'), ('cancelled', 'キャンセル済み')], default='pending')
+    # ステータスの遷移は state_machine.py で定義する
+    status = models.CharField(max_length=20, choices=[('pending', '保留中'), ('confirmed', '確定済み'), ('cancelled', 'キャンセル済み'), ('completed', '完了済み')], default='pending')
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+    # 楽観的排他制御用。更新のたびに1ずつ増える
+    version = models.PositiveIntegerField("バージョン", default=1, editable=False)
+
+    # 予約時点のサービス内容。メニューの価格・名前を変えても過去の予約・売上が変わらないよう、save() で写し取る
+    service_name = models.CharField("サービス名（予約時点）", max_length=100, blank=True, editable=False)
+    price = models.DecimalField("料金（予約時点）", max_digits=8, decimal_places=0, default=0, editable=False)
+    duration_minutes = models.PositiveIntegerField("所要時間(分)（予約時点）", default=0, editable=False)
+
+    SERVICE_SNAPSHOT_FIELDS = ('service_name', 'price', 'duration_minutes')
+
+    class Meta:
+        indexes = [
+            # リマインダーや空き枠計算で「ステータス＋日時」の絞り込みが多いため
+            models.Index(fields=['status', 'start_time'], name='reservation_status_start_idx'),
+            # 顧客ごとの予約を日時で絞り込む（来店集計・顧客セグメントの相関サブクエリ）ため
+            models.Index(fields=['customer', 'start_time'], name='reservation_customer_start_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 変更ログ（ReservationChange）で何が変わったかを判定するため、読み込んだ時点の値を覚えておく
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def snapshot_service(self):
+        """現在のサービスの名前・料金・所要時間を予約に写し取る（bulk_create の前にも呼ぶこと）"""
+        self.service_name = self.service.name
+        self.price = self.service.price
+        self.duration_minutes = self.service.duration_minutes
+
+    def save(self, *args, **kwargs):
+        # 新規作成時と、サービスが変更された時だけ写し取る（メニューの変更は既存の予約に反映しない）
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or (loaded is not None and loaded.get('service_id') != self.service_id):
+            self.snapshot_service()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], *self.SERVICE_SNAPSHOT_FIELDS}
+        updating = not self._state.adding
+        if updating:
+            # 同時に行われた状態遷移の加算を上書きしないよう、DB上の値に加算する
+            self.version = models.F('version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        # 変更ログは post_save（signals.record_reservation_change）で書くため、保存と同じトランザクションにする
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if updating:
+                self.refresh_from_db(fields=['version'])
+
     def __str__(self):
         customer_name = self.customer.name if self.customer else "N/A"
         return f"{customer_name} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
 
+
+class ReservationChange(models.Model):
+    """
+    予約の変更ログ（追記のみ）。
+    予約の作成・ステータス変更・日時変更・削除のたびに、同じトランザクションで1行追加する。
+    seq は SequenceCounter から採番するため、コミットされた順に欠番なく増える。
+    カレンダーや外部連携は、最後に読んだ seq 以降だけを読めば予約の変更を追える。
+    """
+    KIND_CREATED = 'created'
+    KIND_STATUS_CHANGED = 'status_changed'
+    KIND_RESCHEDULED = 'rescheduled'
+    KIND_DELETED = 'deleted'
+    KIND_CHOICES = (
+        (KIND_CREATED, '作成'),
+        (KIND_STATUS_CHANGED, 'ステータス変更'),
+        (KIND_RESCHEDULED, '日時変更'),
+        (KIND_DELETED, '削除'),
+    )
+
+    seq = models.PositiveBigIntegerField("シーケンス番号", unique=True)
+    # 予約が削除されてもログは残すため、外部キー制約は付けない
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.DO_NOTHING, db_constraint=False, related_name='changes', verbose_name="予約"
+    )
+    reservation_number = models.UUIDField("予約番号")
+    kind = models.CharField("種別", max_length=20, choices=KIND_CHOICES)
+    old_status = models.CharField("変更前のステータス", max_length=20, blank=True)
+    status = models.CharField("ステータス", max_length=20)
+    start_time = models.DateTimeField("開始日時", null=True)
+    end_time = models.DateTimeField("終了日時", null=True)
+    changed_at = models.DateTimeField("変更日時", default=timezone.now)
+
+    class Meta:
+        ordering = ['seq']
+        verbose_name = '予約の変更ログ'
+        verbose_name_plural = '予約の変更ログ'
+
+    def __str__(self):
+        return f"#{self.seq} {self.get_kind_display()} ({self.reservation_number})"
+
+
+class SequenceCounter(models.Model):
+    """
+    欠番・順序の逆転がない連番の採番用。
+    採番する行を UPDATE でロックするため、同じ name で採番するトランザクションはコミット順に番号が並ぶ。
+    """
+    name = models.CharField("名前", max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField("最後に採番した値", default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
 class NotificationSetting(models.Model):
     """
     管理者向け通知設定を管理するモデル。設定は全体で1つなので、常にid=1のレコードを更新する想定。
@@ -151,6 +281,14 @@ class NotificationSetting(models.Model):
         help_text='何日後までの予約状況をリマインドするか設定します（1〜7日）。'
     )
 
+    # 職員向け通知のまとめ送信
+    staff_alert_digest_minutes = models.IntegerField(
+        default=5,
+        validators=[MinValueValidator(0), MaxValueValidator(60)],
+        verbose_name='【管理者向け】通知のまとめ送信間隔（分）',
+        help_text='職員向けの通知をこの分数だけ溜めてから1通にまとめて送信します。0を指定すると即時送信します（0〜60分）。'
+    )
+
     class Meta:
         verbose_name = '通知設定'
         verbose_name_plural = '通知設定'
@@ -204,11 +342,197 @@ class LineMessage(models.Model):
     message = models.TextField(blank=True, null=True, verbose_name="テキストメッセージ")
     image_url = models.URLField(max_length=2048, blank=True, null=True, verbose_name="画像URL")
     sent_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="送信日時")
+    # 新着の差分同期（chat_sync.py の since）用の連番。SequenceCounter で採番するため、コミット順に並ぶ
+    seq = models.PositiveBigIntegerField("同期用の連番", editable=False)
+
+    SEQUENCE_NAME = 'line_message'
 
     class Meta:
         ordering = ['sent_at']
+        indexes = [
+            # チャットの差分同期で (sent_at, id) をカーソルに顧客ごとの範囲検索をするため
+            models.Index(fields=['customer', 'sent_at', 'id'], name='linemessage_customer_sync_idx'),
+            # 新着の取得で seq より後のメッセージを顧客ごとに範囲検索するため
+            models.Index(fields=['customer', 'seq'], name='linemessage_customer_seq_idx'),
+        ]
         verbose_name = "LINEメッセージ履歴"
         verbose_name_plural = "LINEメッセージ履歴"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding or self.seq is not None:
+            return super().save(*args, **kwargs)
+        # 採番した行のロックは保存のコミットまで保持される（bulk_create の前は changelog.allocate で採番すること）
+        from .changelog import allocate
+
+        with transaction.atomic():
+            self.seq = allocate(1, self.SEQUENCE_NAME)
+            super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"{self.customer.name}へのメッセージ ({self.sender_type}) at {self.sent_at.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"{self.customer.name}へのメッセージ ({self.sender_type}) at {self.sent_at.strftime('%Y-%m-%d %H:%M')}"
+
+class Reminder(models.Model):
+    """
+    送信予定・送信済みのリマインダーを管理するモデル。
+    予約ごと・種類ごとに1レコードを持ち、sent_atが入っていれば送信済みとみなして二重送信を防ぐ。
+    """
+    KIND_UNCONFIRMED = 'unconfirmed'
+    KIND_SCHEDULE = 'schedule'
+    KIND_CUSTOMER_DAY_BEFORE = 'customer_day_before'
+    KIND_CHOICES = (
+        (KIND_UNCONFIRMED, '【管理者向け】予約未確定リマインダー'),
+        (KIND_SCHEDULE, '【管理者向け】スケジュールリマインダー'),
+        (KIND_CUSTOMER_DAY_BEFORE, '【顧客向け】前日リマインダー'),
+    )
+
+    kind = models.CharField("種類", max_length=30, choices=KIND_CHOICES)
+    # スケジュールリマインダーは予約に紐づかないためnullを許可
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.CASCADE, related_name='reminders', null=True, blank=True
+    )
+    remind_at = models.DateTimeField("送信予定日時")
+    sent_at = models.DateTimeField("送信日時", null=True, blank=True)
+    # 送信に失敗して未送信に戻した回数（上限に達したら再送をあきらめる）
+    attempts = models.PositiveSmallIntegerField("送信失敗回数", default=0)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'リマインダー'
+        verbose_name_plural = 'リマインダー'
+        constraints = [
+            models.UniqueConstraint(fields=['reservation', 'kind'], name='unique_reminder_per_reservation'),
+            models.UniqueConstraint(
+                fields=['kind', 'remind_at'],
+                condition=models.Q(reservation__isnull=True),
+                name='unique_schedule_reminder_per_time',
+            ),
+        ]
+        indexes = [
+            # 未送信かつ送信予定を過ぎたものを1回のクエリで拾うための部分インデックス
+            models.Index(
+                fields=['remind_at'],
+                condition=models.Q(sent_at__isnull=True),
+                name='reminder_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} ({self.remind_at.strftime('%Y-%m-%d %H:%M')})"
+
+
+class EmailOutbox(models.Model):
+    """
+    送信待ちメールを保持するアウトボックス。
+    APIリクエスト内ではここに積むだけにし、ワーカーが1つのSMTP接続でまとめて送信する。
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_BOUNCED = 'bounced'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, '送信待ち'),
+        (STATUS_SENT, '送信済み'),
+        (STATUS_FAILED, '送信失敗'),
+        (STATUS_BOUNCED, '宛先エラー'),
+    )
+
+    to_email = models.EmailField("宛先")
+    from_email = models.CharField("差出人", max_length=255, blank=True)
+    subject = models.CharField("件名", max_length=255)
+    body = models.TextField("本文")
+    status = models.CharField("ステータス", max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField("送信試行回数", default=0)
+    next_attempt_at = models.DateTimeField("次回送信日時", default=timezone.now)
+    last_error = models.TextField("最後のエラー", blank=True)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+    sent_at = models.DateTimeField("送信日時", null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'メール送信キュー'
+        verbose_name_plural = 'メール送信キュー'
+        indexes = [
+            # 送信待ちのうち送信時刻を過ぎたものだけを拾うための部分インデックス
+            models.Index(
+                fields=['next_attempt_at'],
+                condition=models.Q(status='pending'),
+                name='email_outbox_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {self.to_email} ({self.get_status_display()})"
+
+
+class StaffAlert(models.Model):
+    """
+    まとめ送信待ちの職員向け通知。
+    受信者（職員のLINEユーザーID）ごとに溜めておき、deliver_afterを過ぎたら1通のダイジェストとして送信する。
+    """
+    recipient_line_user_id = models.CharField("送信先LINEユーザーID", max_length=255)
+    alert_type = models.CharField("通知種別", max_length=30)
+    message = models.TextField("メッセージ")
+    image_url = models.URLField(max_length=2048, blank=True, null=True, verbose_name="画像URL")
+    created_at = models.DateTimeField("作成日時", default=timezone.now)
+    deliver_after = models.DateTimeField("送信予定日時")
+    delivered_at = models.DateTimeField("送信日時", null=True, blank=True)
+
+    class Meta:
+        verbose_name = '職員向け通知（まとめ送信待ち）'
+        verbose_name_plural = '職員向け通知（まとめ送信待ち）'
+        indexes = [
+            models.Index(
+                fields=['deliver_after'],
+                condition=models.Q(delivered_at__isnull=True),
+                name='staff_alert_due_idx',
+            ),
+            models.Index(
+                fields=['recipient_line_user_id'],
+                condition=models.Q(delivered_at__isnull=True),
+                name='staff_alert_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.alert_type} → {self.recipient_line_user_id}"
+
+
+class RequestProfile(models.Model):
+    """管理者がオンデマンドで取得したリクエストのプロファイル（スタックのサンプリング結果とSQL一覧）"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField("HTTPメソッド", max_length=10)
+    path = models.CharField("パス", max_length=2048)
+    view_name = models.CharField("ビュー名", max_length=255, blank=True)
+    status_code = models.PositiveIntegerField("ステータスコード", null=True)
+    duration_ms = models.FloatField("所要時間（ミリ秒）")
+    sample_count = models.PositiveIntegerField("サンプル数", default=0)
+    stacks = models.TextField("スタック（collapsed形式）", blank=True)
+    queries = models.JSONField("SQL一覧", default=list)
+    query_count = models.PositiveIntegerField("SQL件数", default=0)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'リクエストプロファイル'
+        verbose_name_plural = 'リクエストプロファイル'
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f}ms)"
+
+
+class CustomerSegment(models.Model):
+    """
+    LINE一斉送信の対象を絞り込む顧客セグメント。
+    criteria の形式と絞り込みの組み立ては segments.py を参照。
+    """
+    name = models.CharField("セグメント名", max_length=100)
+    criteria = models.JSONField("絞り込み条件", default=dict)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    class Meta:
+        ordering = ['name', 'pk']
+        verbose_name = '顧客セグメント'
+        verbose_name_plural = '顧客セグメント'
+
+    def __str__(self):
+        return self.name
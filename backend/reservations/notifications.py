@@ -1,14 +1,22 @@
+import logging
 import os
 import requests
-from django.core.mail import send_mail
+from datetime import timedelta
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from .instrumentation import timed_request
 
-def send_line_push_message(user_id, messages, channel_access_token):
+logger = logging.getLogger(__name__)
+
+def send_line_push_message(user_id, messages, channel_access_token, mark_unreachable=False):
     """
     指定されたユーザーIDに、複数のメッセージ（テキスト、画像など）をリストで送信する汎用関数。
+    mark_unreachable=True（顧客への送信）の場合、送信先に届かないことを示すエラーなら顧客をLINE送信不可にする。
     """
     if not all([user_id, messages, channel_access_token]):
-        print("エラー: LINE送信に必要な情報（ユーザーID, メッセージ, トークン）が不足しています。")
+        logger.error("LINE送信に必要な情報（ユーザーID, メッセージ, トークン）が不足しています。")
         return False, "設定またはパラメータ不足"
 
     headers = {
@@ -25,13 +33,63 @@ def send_line_push_message(user_id, messages, channel_access_token):
     }
     
     try:
-        response = requests.post('https://api.line.me/v2/bot/message/push', headers=headers, json=payload)
+        response = timed_request('POST', 'https://api.line.me/v2/bot/message/push', headers=headers, json=payload)
         response.raise_for_status()
-        print(f"メッセージが正常に送信されました。To: {user_id}")
+        logger.debug(f"メッセージが正常に送信されました。To: {user_id}")
         return True, "成功"
     except requests.exceptions.RequestException as e:
-        print(f"LINEへのメッセージ送信に失敗しました: {e.response.text if e.response else e}")
-        return False, e.response.text if e.response else str(e)
+        logger.warning(f"LINEへのメッセージ送信に失敗しました: {e.response.text if e.response is not None else e}")
+        if mark_unreachable and e.response is not None \
+                and is_unreachable_line_error(e.response.status_code, e.response.text):
+            mark_customer_line_unreachable(user_id)
+        return False, e.response.text if e.response is not None else str(e)
+
+
+# 400のうち、送信先ユーザー（to）に起因することを示すLINE APIのエラーメッセージ
+LINE_UNREACHABLE_ERROR_MESSAGES = (
+    "the property, 'to'",
+    'not found',
+)
+
+
+def is_unreachable_line_error(status_code, body):
+    """
+    LINE APIの送信失敗レスポンスが「送信先に届かない（ブロック・友だち解除・存在しない）」
+    ことを示すものかどうかを判定する。
+    403はチャネルの権限・プランの問題でも返り、全顧客を送信不可にしてしまうため含めない。
+    """
+    if status_code == 404:
+        return True
+    if status_code == 400:
+        body = (body or '').lower()
+        return any(text in body for text in LINE_UNREACHABLE_ERROR_MESSAGES)
+    return False
+
+
+def mark_customer_line_unreachable(line_user_id):
+    """顧客をLINE送信不可にする（unfollowイベントや送信失敗時に呼び出す）"""
+    from .conditional import bump
+    from .models import Customer
+
+    updated = Customer.objects.filter(line_user_id=line_user_id, line_reachable=True).update(
+        line_reachable=False, line_unreachable_at=timezone.now()
+    )
+    if updated:
+        bump(Customer)
+    return updated
+
+
+def mark_customer_line_reachable(line_user_id):
+    """顧客をLINE送信可能に戻す（followイベント時に呼び出す）"""
+    from .conditional import bump
+    from .models import Customer
+
+    updated = Customer.objects.filter(line_user_id=line_user_id, line_reachable=False).update(
+        line_reachable=True, line_unreachable_at=None
+    )
+    if updated:
+        bump(Customer)
+    return updated
 
 
 def send_admin_line_notification(message):
@@ -47,7 +105,7 @@ def send_admin_line_notification(message):
     ).exclude(line_user_id='')
     
     if not staff_profiles.exists():
-        print("警告: LINE連携済みの職員が見つかりません。")
+        logger.warning("LINE連携済みの職員が見つかりません。")
         # フォールバック：環境変数の管理者に送信
         admin_user_id = os.environ.get('ADMIN_LINE_USER_ID')
         if admin_user_id:
@@ -72,13 +130,13 @@ def send_admin_line_notification(message):
             )
             if success:
                 success_count += 1
-                print(f"職員 {profile.user.username} への送信成功")
+                logger.debug(f"職員 {profile.user.username} への送信成功")
             else:
-                print(f"職員 {profile.user.username} への送信失敗: {result}")
+                logger.warning(f"職員 {profile.user.username} への送信失敗: {result}")
         except Exception as e:
-            print(f"職員 {profile.user.username} への送信中にエラー: {e}")
+            logger.error(f"職員 {profile.user.username} への送信中にエラー: {e}")
     
-    print(f"職員への一括通知完了: {success_count}/{total_count} 件成功")
+    logger.info(f"職員への一括通知完了: {success_count}/{total_count} 件成功")
     return success_count > 0, f"{success_count}/{total_count} 件送信成功"
 
 def send_admin_line_image(image_url):
@@ -94,7 +152,7 @@ def send_admin_line_image(image_url):
     ).exclude(line_user_id='')
     
     if not staff_profiles.exists():
-        print("警告: LINE連携済みの職員が見つかりません。")
+        logger.warning("LINE連携済みの職員が見つかりません。")
         # フォールバック：環境変数の管理者に送信
         admin_user_id = os.environ.get('ADMIN_LINE_USER_ID')
         if admin_user_id:
@@ -130,13 +188,13 @@ def send_admin_line_image(image_url):
             )
             if success:
                 success_count += 1
-                print(f"職員 {profile.user.username} への画像送信成功")
+                logger.debug(f"職員 {profile.user.username} への画像送信成功")
             else:
-                print(f"職員 {profile.user.username} への画像送信失敗: {result}")
+                logger.warning(f"職員 {profile.user.username} への画像送信失敗: {result}")
         except Exception as e:
-            print(f"職員 {profile.user.username} への画像送信中にエラー: {e}")
+            logger.error(f"職員 {profile.user.username} への画像送信中にエラー: {e}")
     
-    print(f"職員への一括画像通知完了: {success_count}/{total_count} 件成功")
+    logger.info(f"職員への一括画像通知完了: {success_count}/{total_count} 件成功")
     return success_count > 0, f"{success_count}/{total_count} 件送信成功"
 
 
@@ -162,10 +220,10 @@ def send_staff_line_notification(staff_user_id, message):
         )
         
     except UserProfile.DoesNotExist:
-        print(f"職員ID {staff_user_id} のLINE連携が見つかりません。")
+        logger.warning(f"職員ID {staff_user_id} のLINE連携が見つかりません。")
         return False, "LINE連携なし"
     except Exception as e:
-        print(f"職員への個別通知でエラー: {e}")
+        logger.error(f"職員への個別通知でエラー: {e}")
         return False, str(e)
 
 
@@ -197,8 +255,11 @@ def send_customer_line_notification(customer, message):
     顧客にLINEメッセージを送信する関数
     """
     if not customer.line_user_id:
-        print(f"顧客 {customer.name} にはLINE連携が設定されていません。")
+        logger.info(f"顧客 {customer.id} にはLINE連携が設定されていません。")
         return False, "LINE連携なし"
+    if not customer.line_reachable:
+        logger.info(f"顧客 {customer.id} はLINEをブロックまたは友だち解除しているため送信しません。")
+        return False, "LINE送信不可"
     
     # 顧客向けLINEチャンネルのアクセストークンを使用
     channel_access_token = os.environ.get('CUSTOMER_LINE_CHANNEL_ACCESS_TOKEN')
@@ -206,7 +267,8 @@ def send_customer_line_notification(customer, message):
     return send_line_push_message(
         user_id=customer.line_user_id,
         messages=message,
-        channel_access_token=channel_access_token
+        channel_access_token=channel_access_token,
+        mark_unreachable=True,
     )
 
 
@@ -215,7 +277,7 @@ def send_reservation_confirmation_email(customer, reservation, service):
     予約確定メールを送信する関数
     """
     if not customer.email:
-        print(f"顧客 {customer.name} にはメールアドレスが設定されていません。")
+        logger.info(f"顧客 {customer.id} にはメールアドレスが設定されていません。")
         return False, "メールアドレスなし"
     
     subject = '予約確定のお知らせ'
@@ -241,15 +303,175 @@ def send_reservation_confirmation_email(customer, reservation, service):
 """
     
     try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[customer.email],
-            fail_silently=False,
-        )
-        print(f"予約確定メールを送信しました: {customer.email}")
+        # SMTP送信はワーカーに任せ、ここでは送信キューに積むだけにする
+        from .outbox import enqueue_email
+        enqueue_email(subject, message, [customer.email], settings.DEFAULT_FROM_EMAIL)
+        logger.info(f"予約確定メールを送信キューに追加しました (顧客ID: {customer.id})")
         return True, "成功"
     except Exception as e:
-        print(f"メール送信に失敗しました: {e}")
-        return False, str(e)
\ No newline at end of file
+        logger.error(f"メールの送信キュー登録に失敗しました: {e}")
+        return False, str(e)
+
+# ==============================================================================
+# 職員向け通知のまとめ送信（ダイジェスト）
+# ==============================================================================
+
+# まとめ送信の対象にせず、常に即時送信する通知種別
+URGENT_STAFF_ALERT_TYPES = {'staff_notification', 'urgent'}
+# LINEのテキストメッセージ1件あたりの最大文字数と、1回のpushで送れる最大件数
+LINE_TEXT_MAX_LENGTH = 5000
+LINE_MESSAGES_PER_PUSH = 5
+# まとめ通知の送信に失敗したとき、再送を続ける期間（これより古い通知は再送をあきらめる）
+STAFF_ALERT_RETRY_WINDOW = timedelta(days=1)
+
+
+def _staff_alert_recipients():
+    """職員向け通知の送信先LINEユーザーIDの一覧を返す"""
+    from .models import UserProfile
+
+    recipients = list(
+        UserProfile.objects.filter(line_user_id__isnull=False, user__is_staff=True)
+        .exclude(line_user_id='')
+        .values_list('line_user_id', flat=True)
+    )
+    if not recipients and os.environ.get('ADMIN_LINE_USER_ID'):
+        # フォールバック：環境変数の管理者に送信
+        recipients = [os.environ.get('ADMIN_LINE_USER_ID')]
+    return recipients
+
+
+def queue_staff_alert(message, alert_type='general', image_url=None):
+    """
+    【管理者向け】職員向け通知を受信者ごとのバッファに追加する。
+    NotificationSettingのまとめ送信間隔が0、または緊急の通知種別の場合は即時送信する。
+    バッファ済みの通知はflush_staff_alerts()で1通のダイジェストにまとめて送信される。
+    """
+    from .models import NotificationSetting, StaffAlert
+
+    setting = NotificationSetting.objects.filter(pk=1).only('staff_alert_digest_minutes').first()
+    window = setting.staff_alert_digest_minutes if setting else NotificationSetting._meta.get_field(
+        'staff_alert_digest_minutes').get_default()
+
+    if window <= 0 or alert_type in URGENT_STAFF_ALERT_TYPES:
+        result = send_admin_line_notification(message)
+        if image_url:
+            send_admin_line_image(image_url)
+        return result
+
+    recipients = _staff_alert_recipients()
+    if not recipients:
+        logger.warning("LINE連携済みの職員が見つかりません。")
+        return False, "送信先の職員が見つかりません"
+
+    # 既に溜まっている通知がある受信者は、最初の通知の送信予定日時に揃える
+    now = timezone.now()
+    pending_deadlines = dict(
+        StaffAlert.objects.filter(recipient_line_user_id__in=recipients, delivered_at__isnull=True)
+        .values('recipient_line_user_id')
+        .annotate(deliver_after=Min('deliver_after'))
+        .values_list('recipient_line_user_id', 'deliver_after')
+    )
+    default_deadline = now + timedelta(minutes=window)
+    StaffAlert.objects.bulk_create([
+        StaffAlert(
+            recipient_line_user_id=recipient,
+            alert_type=alert_type,
+            message=message,
+            image_url=image_url,
+            created_at=now,
+            deliver_after=pending_deadlines.get(recipient, default_deadline),
+        )
+        for recipient in recipients
+    ])
+    return True, f"{len(recipients)} 件をまとめ送信に追加"
+
+
+def _build_staff_digest(alerts):
+    """
+    溜まった通知をLINEのメッセージ（1回のpushで送れる最大5件）にまとめる。
+    画像付きの通知は即時送信と同じく画像メッセージで送り、テキスト用に最低2件（本文と省略件数の案内）を残す。
+    枠に収まらない画像はテキストにURLを添える。
+    """
+    image_alerts = [alert for alert in alerts if alert.image_url]
+    image_slots = min(len(image_alerts), LINE_MESSAGES_PER_PUSH - 2)
+    attached = image_alerts[:image_slots]
+    attached_ids = {alert.pk for alert in attached}
+
+    entries = []
+    for alert in alerts:
+        entry = f"[{alert.created_at.strftime('%H:%M')}] {alert.message}"
+        if alert.image_url and alert.pk not in attached_ids:
+            entry = f"{entry}\n{alert.image_url}"
+        entries.append(entry)
+    texts = _pack_digest_texts(f"【まとめ通知】{len(alerts)}件の通知があります", entries,
+                               LINE_MESSAGES_PER_PUSH - image_slots)
+    return [{"type": "text", "text": text} for text in texts] + [
+        {"type": "image", "originalContentUrl": alert.image_url, "previewImageUrl": alert.image_url}
+        for alert in attached
+    ]
+
+
+def _pack_digest_texts(header, entries, max_messages):
+    """通知の一覧を、1件あたりの文字数上限に収まる最大 max_messages 件のテキストに詰める"""
+    messages = []
+    current = header
+    for index, entry in enumerate(entries):
+        candidate = f"{current}\n\n{entry}"
+        if len(candidate) <= LINE_TEXT_MAX_LENGTH:
+            current = candidate
+            continue
+        messages.append(current)
+        if len(messages) == max_messages - 1:
+            # これ以上は1回のpushに収まらないため件数だけ伝える
+            current = f"ほか{len(entries) - index}件の通知があります。管理画面をご確認ください。"
+            break
+        current = entry[:LINE_TEXT_MAX_LENGTH]
+    messages.append(current)
+    return messages
+
+
+def flush_staff_alerts(now=None):
+    """
+    送信予定日時を過ぎたバッファ済みの職員向け通知を、受信者ごとに1通にまとめて送信する。
+    二重送信を防ぐため送信前に送信済みとしてマークし、送信に失敗した受信者の分は未送信に戻して次回に再送する。
+    """
+    from .models import StaffAlert
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = list(
+            StaffAlert.objects.select_for_update()
+            .filter(delivered_at__isnull=True, deliver_after__lte=now)
+            .order_by('recipient_line_user_id', 'created_at')
+        )
+        if not due:
+            return {'recipients': 0, 'alerts': 0}
+        StaffAlert.objects.filter(pk__in=[alert.pk for alert in due]).update(delivered_at=now)
+
+    by_recipient = {}
+    for alert in due:
+        by_recipient.setdefault(alert.recipient_line_user_id, []).append(alert)
+
+    channel_access_token = os.environ.get('ADMIN_LINE_CHANNEL_ACCESS_TOKEN')
+    success_count = 0
+    for recipient, alerts in by_recipient.items():
+        try:
+            success, result = send_line_push_message(
+                user_id=recipient,
+                messages=_build_staff_digest(alerts),
+                channel_access_token=channel_access_token
+            )
+        except Exception as e:
+            success, result = False, str(e)
+        if success:
+            success_count += 1
+            continue
+        logger.warning(f"まとめ通知の送信失敗 To: {recipient}: {result}")
+        released = StaffAlert.objects.filter(
+            pk__in=[alert.pk for alert in alerts], created_at__gte=now - STAFF_ALERT_RETRY_WINDOW
+        ).update(delivered_at=None)
+        if released < len(alerts):
+            logger.error(f"まとめ通知 {len(alerts) - released} 件は送信できないまま期限を過ぎたため再送しません To: {recipient}")
+
+    logger.info(f"まとめ通知送信完了: {success_count}/{len(by_recipient)} 名, 通知 {len(due)} 件")
+    return {'recipients': success_count, 'alerts': len(due)}
@@ -0,0 +1,167 @@
+# backend/reservations/outbox.py
+"""
+メール送信アウトボックス。
+
+APIリクエストの中ではSMTPに接続せず enqueue_email() でEmailOutboxに積むだけにする。
+Celeryワーカーが drain_email_outbox() で送信待ちメールをまとめて取り出し、
+1バッチにつき1つのSMTP接続（get_connection()）を使い回して送信する。
+"""
+import logging
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# 1回のワーカー実行で処理する最大件数
+BATCH_SIZE = 100
+# この回数失敗したら送信失敗として諦める
+MAX_ATTEMPTS = 5
+# 取り出したメールを他のワーカーが拾わないよう確保しておく時間
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def enqueue_email(subject, body, to, from_email=None):
+    """
+    メールを送信キューに追加する。宛先ごとに1レコードを作成し、作成件数を返す。
+    toには文字列またはメールアドレスのリストを渡せる。
+    """
+    return enqueue_emails([(subject, body, to)], from_email)
+
+
+def enqueue_emails(messages, from_email=None):
+    """(件名, 本文, 宛先) のリストをまとめて送信キューに追加する（INSERT 1回）。作成件数を返す"""
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL or ''
+    created = EmailOutbox.objects.bulk_create([
+        EmailOutbox(to_email=address, from_email=from_email, subject=subject, body=body)
+        for subject, body, to in messages
+        for address in ([to] if isinstance(to, str) else list(to)) if address
+    ])
+    return len(created)
+
+
+def _retry_delay(attempts):
+    """失敗回数に応じた再送までの待ち時間（指数バックオフ）"""
+    return timedelta(minutes=2 ** min(attempts, 6))
+
+
+def _claim_batch(now, batch_size):
+    """送信時刻を過ぎた送信待ちメールを取り出し、一定時間他のワーカーから見えなくする"""
+    with transaction.atomic():
+        queryset = EmailOutbox.objects.filter(
+            status=EmailOutbox.STATUS_PENDING, next_attempt_at__lte=now
+        ).order_by('next_attempt_at')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        batch = list(queryset[:batch_size])
+        if batch:
+            EmailOutbox.objects.filter(pk__in=[m.pk for m in batch]).update(
+                next_attempt_at=now + CLAIM_LEASE
+            )
+    return batch
+
+
+def _is_bounce(error):
+    """
+    宛先起因の恒久的なエラー（再送しても成功しないもの）かどうか。
+    送信時に宛先が5xxで拒否された場合だけで、接続・認証・送信元のエラーは5xxでも再送する。
+    """
+    if not isinstance(error, smtplib.SMTPRecipientsRefused) or not error.recipients:
+        return False
+    return all(500 <= code < 600 for code, _ in error.recipients.values())
+
+
+def _is_connection_error(error):
+    """SMTP接続が切れた・使えないことを示すエラーかどうか（メール自体の失敗ではない）"""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    # SMTPException も OSError のサブクラスのため、それ以外のソケットのエラーだけを接続エラーとする
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _mark_failed_attempt(message, error, now):
+    """送信失敗を記録し、再送予約または失敗確定にする"""
+    message.attempts += 1
+    message.last_error = str(error)[:2000]
+    if _is_bounce(error):
+        message.status = EmailOutbox.STATUS_BOUNCED
+    elif message.attempts >= MAX_ATTEMPTS:
+        message.status = EmailOutbox.STATUS_FAILED
+    else:
+        message.next_attempt_at = now + _retry_delay(message.attempts)
+    message.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def _reschedule_batch(batch, error, now):
+    """
+    SMTPサーバーに接続・認証できなかったバッチを再送予約にする。
+    メール自体の失敗ではないため、送信失敗・宛先エラーにはせず、失敗回数も数えない。
+    """
+    for message in batch:
+        EmailOutbox.objects.filter(pk=message.pk).update(
+            last_error=str(error)[:2000],
+            next_attempt_at=now + _retry_delay(message.attempts + 1),
+        )
+
+
+def drain_email_outbox(batch_size=BATCH_SIZE):
+    """
+    送信待ちメールを1つのSMTP接続でまとめて送信する。
+    送信結果（送信済み/再送待ち/失敗/宛先エラー）はメールごとに記録する。
+    途中で接続が切れた場合は、未送信の残りを失敗回数に数えずに再送予約にする。
+    """
+    now = timezone.now()
+    batch = _claim_batch(now, batch_size)
+    if not batch:
+        return {'sent': 0, 'failed': 0}
+
+    sent = failed = 0
+    mail_connection = get_connection()
+    try:
+        mail_connection.open()
+    except Exception as e:
+        # SMTPサーバーに接続・認証できない場合はバッチ全体を再送予約にする
+        logger.error(f"SMTPサーバーへの接続に失敗しました: {e}")
+        _reschedule_batch(batch, e, now)
+        return {'sent': 0, 'failed': len(batch)}
+
+    try:
+        for index, message in enumerate(batch):
+            email = EmailMessage(
+                subject=message.subject,
+                body=message.body,
+                from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+                to=[message.to_email],
+                connection=mail_connection,
+            )
+            try:
+                email.send(fail_silently=False)
+            except Exception as e:
+                if _is_connection_error(e):
+                    # 接続が切れた後のメールは同じ接続では送れないため、残りをまとめて再送予約にする
+                    logger.error(f"SMTPサーバーとの接続が切れました (id={message.pk}): {e}")
+                    _reschedule_batch(batch[index:], e, now)
+                    failed += len(batch) - index
+                    break
+                logger.warning(f"メール送信に失敗しました (id={message.pk}): {e}")
+                _mark_failed_attempt(message, e, now)
+                failed += 1
+                continue
+            EmailOutbox.objects.filter(pk=message.pk).update(
+                status=EmailOutbox.STATUS_SENT,
+                sent_at=timezone.now(),
+                attempts=message.attempts + 1,
+                last_error='',
+            )
+            sent += 1
+    finally:
+        mail_connection.close()
+
+    logger.info(f"メール送信キュー処理完了: 送信 {sent} 件 / 失敗 {failed} 件")
+    return {'sent': sent, 'failed': failed}
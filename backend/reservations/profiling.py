@@ -0,0 +1,88 @@
+# backend/reservations/profiling.py
+"""
+管理者向けのオンデマンド・リクエストプロファイラ。
+
+X-Profile: 1 ヘッダーまたは ?_profile=1 を付けた管理者のリクエストだけを対象に、
+- 別スレッドから一定間隔でスタックをサンプリングした結果（collapsed形式。flamegraphで可視化できる）
+- 実行されたSQLの一覧（実行順、所要時間付き）
+を記録してRequestProfileに保存する。フラグがないリクエストでは何もしない。
+"""
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_PARAM = '_profile'
+# 記録するSQLの最大件数（巨大なN+1で保存データが膨らみすぎないように）
+MAX_RECORDED_QUERIES = 2000
+
+
+def is_profile_requested(request):
+    """リクエストにプロファイル取得のフラグが付いているか"""
+    return request.headers.get(PROFILE_HEADER) == '1' or request.GET.get(PROFILE_QUERY_PARAM) == '1'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """対象スレッドのスタックを一定間隔でサンプリングし、collapsed形式で集計する"""
+
+    def __init__(self, thread_id=None, interval=None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval or getattr(settings, 'PROFILING_INTERVAL_SECONDS', 0.005)
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def collapsed(self):
+        """flamegraph.pl / speedscope で読み込めるcollapsed形式のテキスト"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() 用。実行されたSQLを順番に記録する"""
+
+    def __init__(self):
+        self.queries = []
+        self.truncated = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < MAX_RECORDED_QUERIES:
+                self.queries.append({
+                    'sql': sql,
+                    'params': repr(params)[:500],
+                    'many': many,
+                    'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+                })
+            else:
+                self.truncated += 1
@@ -0,0 +1,332 @@
+# backend/reservations/reminders.py
+"""
+NotificationSettingに基づくリマインダーのスケジューリングと送信処理。
+
+- 予約の保存・通知設定の変更時に Reminder レコードを作成/更新（再スケジュール）する
+- Celery beat から定期的に send_due_reminders() を呼び出し、
+  送信予定を過ぎた未送信リマインダーを1回のクエリでまとめて取得して送信する
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, ExpressionWrapper, F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import NotificationSetting, Reminder, Reservation
+from .notifications import send_admin_line_notification, send_customer_line_notification
+from .outbox import enqueue_email
+
+logger = logging.getLogger(__name__)
+
+# 顧客向け前日リマインダーを予約開始の何時間前に送信するか
+CUSTOMER_REMINDER_HOURS_BEFORE = 24
+# 管理者向けスケジュールリマインダーを毎日送信する時刻
+SCHEDULE_REMINDER_TIME = time(9, 0)
+
+# 各リマインダーの対象となる予約ステータス
+UNCONFIRMED_TARGET_STATUSES = ('pending',)
+CUSTOMER_TARGET_STATUSES = ('pending', 'confirmed')
+
+# 送信に失敗したリマインダーを未送信に戻して再送する回数の上限
+MAX_SEND_ATTEMPTS = 3
+
+
+def get_notification_setting():
+    """通知設定（常にid=1）を取得する。存在しなければ作成する。"""
+    setting, _ = NotificationSetting.objects.get_or_create(pk=1)
+    return setting
+
+
+def _local_date(value):
+    """USE_TZの有無にかかわらず、日時をローカル日付に変換する"""
+    if timezone.is_aware(value):
+        return timezone.localtime(value).date()
+    return value.date()
+
+
+def _combine(day, at):
+    """日付と時刻からDBに保存できる日時を作る"""
+    value = datetime.combine(day, at)
+    if settings.USE_TZ:
+        return timezone.make_aware(value)
+    return value
+
+
+# ==============================================================================
+# スケジューリング
+# ==============================================================================
+
+def _desired_reminders(reservation, setting):
+    """予約の現在の状態から、あるべきリマインダーの {種類: 送信予定日時} を返す"""
+    if not reservation.start_time:
+        return {}
+
+    desired = {}
+    if setting.unconfirmed_reminder_enabled and reservation.status in UNCONFIRMED_TARGET_STATUSES:
+        desired[Reminder.KIND_UNCONFIRMED] = (
+            reservation.start_time - timedelta(days=setting.unconfirmed_reminder_days_before)
+        )
+    if reservation.customer_id and reservation.status in CUSTOMER_TARGET_STATUSES:
+        desired[Reminder.KIND_CUSTOMER_DAY_BEFORE] = (
+            reservation.start_time - timedelta(hours=CUSTOMER_REMINDER_HOURS_BEFORE)
+        )
+    return desired
+
+
+def schedule_reservation_reminders(reservation, setting=None):
+    """
+    予約に対するリマインダーを作成・再スケジュールする。
+    予約日時が変わった場合は送信予定日時を更新し、送信済みでも再送対象に戻す。
+    対象外になった（キャンセル等）未送信リマインダーは削除する。
+    """
+    schedule_reminders_for_reservations([reservation], setting)
+
+
+def schedule_reminders_for_reservations(reservations, setting=None):
+    """
+    複数の予約のリマインダーをまとめて作成・再スケジュールする（内容は schedule_reservation_reminders と同じ）。
+    シグナルが発生しない一括のステータス変更（state_machine.py）の後に呼ぶ。
+    """
+    reservations = list(reservations)
+    if not reservations:
+        return
+    setting = setting or get_notification_setting()
+    existing = defaultdict(dict)
+    for reminder in Reminder.objects.filter(reservation__in=[r.pk for r in reservations]):
+        existing[reminder.reservation_id][reminder.kind] = reminder
+
+    stale_ids = []
+    to_create = []
+    for reservation in reservations:
+        desired = _desired_reminders(reservation, setting)
+        current = existing.get(reservation.pk, {})
+        stale_ids.extend(r.pk for kind, r in current.items() if kind not in desired and r.sent_at is None)
+        for kind, remind_at in desired.items():
+            reminder = current.get(kind)
+            if reminder is None:
+                to_create.append(Reminder(kind=kind, reservation=reservation, remind_at=remind_at))
+            elif reminder.remind_at != remind_at:
+                # 予約日時が変更された → 新しい日時で再スケジュール
+                Reminder.objects.filter(pk=reminder.pk).update(remind_at=remind_at, sent_at=None, attempts=0)
+    if stale_ids:
+        Reminder.objects.filter(pk__in=stale_ids).delete()
+    if to_create:
+        Reminder.objects.bulk_create(to_create, ignore_conflicts=True)
+
+
+def reschedule_all_reminders(setting=None):
+    """
+    通知設定の変更に合わせて、未送信の管理者向けリマインダーをまとめて再スケジュールする。
+    予約1件ずつではなく、集合単位のUPDATE/INSERTで処理する。
+    """
+    setting = setting or get_notification_setting()
+    now = timezone.now()
+
+    unsent_unconfirmed = Reminder.objects.filter(kind=Reminder.KIND_UNCONFIRMED, sent_at__isnull=True)
+    if not setting.unconfirmed_reminder_enabled:
+        unsent_unconfirmed.delete()
+    else:
+        start_time = Subquery(
+            Reservation.objects.filter(pk=OuterRef('reservation_id')).values('start_time')[:1]
+        )
+        unsent_unconfirmed.update(remind_at=ExpressionWrapper(
+            start_time - timedelta(days=setting.unconfirmed_reminder_days_before),
+            output_field=DateTimeField(),
+        ))
+
+        # 有効化された場合など、まだリマインダーを持たない保留中の予約を補完する
+        missing = Reservation.objects.filter(
+            status__in=UNCONFIRMED_TARGET_STATUSES,
+            start_time__gt=now,
+        ).exclude(reminders__kind=Reminder.KIND_UNCONFIRMED).values_list('pk', 'start_time')
+        delta = timedelta(days=setting.unconfirmed_reminder_days_before)
+        Reminder.objects.bulk_create(
+            [
+                Reminder(kind=Reminder.KIND_UNCONFIRMED, reservation_id=pk, remind_at=start - delta)
+                for pk, start in missing
+            ],
+            ignore_conflicts=True,
+        )
+
+    if not setting.schedule_reminder_enabled:
+        Reminder.objects.filter(kind=Reminder.KIND_SCHEDULE, sent_at__isnull=True).delete()
+
+
+def _ensure_schedule_reminder(now):
+    """今日のスケジュールリマインダーのレコードを（なければ）作成する"""
+    remind_at = _combine(_local_date(now), SCHEDULE_REMINDER_TIME)
+    Reminder.objects.get_or_create(kind=Reminder.KIND_SCHEDULE, reservation=None, remind_at=remind_at)
+
+
+# ==============================================================================
+# 送信
+# ==============================================================================
+
+def _claim_due_reminders(now):
+    """
+    送信すべきリマインダーを1回のクエリで取得し、送信済みとしてマークする。
+    送信処理より先にマークすることで、ワーカーが重複起動しても二重送信しない。
+    送信に失敗したものは _release_failed_reminders() で未送信に戻す。
+    """
+    due_filter = (
+        Q(kind=Reminder.KIND_SCHEDULE)
+        | Q(
+            kind=Reminder.KIND_UNCONFIRMED,
+            reservation__status__in=UNCONFIRMED_TARGET_STATUSES,
+            reservation__start_time__gt=now,
+        )
+        | Q(
+            kind=Reminder.KIND_CUSTOMER_DAY_BEFORE,
+            reservation__status='confirmed',
+            reservation__start_time__gt=now,
+        )
+    )
+    with transaction.atomic():
+        due = list(
+            Reminder.objects.select_for_update(of=('self',))
+            .filter(sent_at__isnull=True, remind_at__lte=now)
+            .filter(due_filter)
+            .select_related('reservation__customer', 'reservation__service')
+            .order_by('remind_at')
+        )
+        if due:
+            Reminder.objects.filter(pk__in=[r.pk for r in due]).update(sent_at=now)
+    return due
+
+
+def _release_failed_reminders(reminders):
+    """
+    送信に失敗したリマインダーを未送信に戻し、次回の定期実行で再送させる。
+    失敗回数が上限に達したものは送信済みのまま残し、再送をあきらめる。
+    """
+    pks = [r.pk for r in reminders]
+    if not pks:
+        return
+    failed = Reminder.objects.filter(pk__in=pks)
+    released = failed.filter(attempts__lt=MAX_SEND_ATTEMPTS - 1).update(sent_at=None, attempts=F('attempts') + 1)
+    gave_up = failed.filter(sent_at__isnull=False).update(attempts=F('attempts') + 1)
+    if gave_up:
+        logger.error(f"リマインダー {gave_up} 件は {MAX_SEND_ATTEMPTS} 回送信に失敗したため再送しません")
+    elif released:
+        logger.info(f"送信に失敗したリマインダー {released} 件を再送対象に戻しました")
+
+
+def _build_staff_message(unconfirmed, schedule_reservations, schedule_days):
+    """管理者向けリマインダーを1通のメッセージにまとめる"""
+    sections = []
+    if unconfirmed:
+        lines = ["【予約未確定リマインダー】", "以下の予約がまだ確定されていません。"]
+        for reservation in sorted(unconfirmed, key=lambda r: r.start_time):
+            customer_name = reservation.customer.name if reservation.customer else "N/A"
+            lines.append(
+                f"・{reservation.start_time.strftime('%m/%d %H:%M')} {customer_name}様 ({reservation.service.name})"
+            )
+        sections.append("\n".join(lines))
+
+    if schedule_reservations is not None:
+        lines = [f"【スケジュールリマインダー】今後{schedule_days}日間の予約"]
+        if schedule_reservations:
+            for reservation in schedule_reservations:
+                customer_name = reservation.customer.name if reservation.customer else "N/A"
+                lines.append(
+                    f"・{reservation.start_time.strftime('%m/%d %H:%M')} {customer_name}様 "
+                    f"({reservation.service.name} / {reservation.get_status_display()})"
+                )
+        else:
+            lines.append("予約はありません。")
+        sections.append("\n".join(lines))
+
+    return "\n\n".join(sections)
+
+
+def _build_customer_message(customer, reservations):
+    """顧客向け前日リマインダーを顧客ごとに1通へまとめる"""
+    lines = [f"{customer.name}様", "", "ご予約の前日となりましたのでお知らせいたします。", ""]
+    for reservation in sorted(reservations, key=lambda r: r.start_time):
+        lines.append(f"・{reservation.start_time.strftime('%Y年%m月%d日 %H:%M')} {reservation.service.name}")
+    lines += ["", "ご来店を心よりお待ちしております。"]
+    return "\n".join(lines)
+
+
+def send_due_reminders(now=None):
+    """
+    送信予定を過ぎたリマインダーをまとめて送信する（Celery beatから定期実行）。
+    送信は受信者ごとにまとめ、管理者へは1通、顧客へは顧客ごとに1通だけ送る。
+    """
+    now = now or timezone.now()
+    setting = get_notification_setting()
+    if setting.schedule_reminder_enabled:
+        _ensure_schedule_reminder(now)
+
+    # 予約日時を過ぎて不要になった未送信リマインダーを掃除する
+    Reminder.objects.filter(
+        sent_at__isnull=True, reservation__isnull=False, reservation__start_time__lte=now
+    ).delete()
+
+    due = _claim_due_reminders(now)
+    if not due:
+        return {'staff': 0, 'customers': 0}
+
+    unconfirmed = []
+    send_schedule = False
+    staff_reminders = []
+    by_customer = defaultdict(list)
+    for reminder in due:
+        if reminder.kind == Reminder.KIND_UNCONFIRMED:
+            unconfirmed.append(reminder.reservation)
+            staff_reminders.append(reminder)
+        elif reminder.kind == Reminder.KIND_SCHEDULE:
+            send_schedule = True
+            staff_reminders.append(reminder)
+        elif reminder.kind == Reminder.KIND_CUSTOMER_DAY_BEFORE:
+            by_customer[reminder.reservation.customer].append(reminder)
+
+    # --- 管理者向け（1通にまとめて送信） ---
+    staff_sent = 0
+    schedule_reservations = None
+    schedule_days = setting.schedule_reminder_days_before
+    if send_schedule:
+        schedule_reservations = list(
+            Reservation.objects.filter(
+                status__in=('pending', 'confirmed'),
+                start_time__gte=now,
+                start_time__lt=now + timedelta(days=schedule_days),
+            ).select_related('customer', 'service').order_by('start_time')
+        )
+    if staff_reminders:
+        staff_message = _build_staff_message(unconfirmed, schedule_reservations, schedule_days)
+        try:
+            success, result = send_admin_line_notification(staff_message)
+            staff_sent = 1 if success else 0
+            if not success:
+                logger.warning(f"管理者向けリマインダーの送信に失敗しました: {result}")
+        except Exception as e:
+            logger.error(f"管理者向けリマインダーの送信中にエラー: {e}", exc_info=True)
+        if not staff_sent:
+            _release_failed_reminders(staff_reminders)
+
+    # --- 顧客向け（顧客ごとに1通。LINE未連携またはLINEの送信に失敗したらメール） ---
+    customers_sent = 0
+    for customer, reminders in by_customer.items():
+        message = _build_customer_message(customer, [r.reservation for r in reminders])
+        sent = False
+        if customer.line_user_id and customer.line_reachable:
+            try:
+                success, result = send_customer_line_notification(customer, message)
+                sent = bool(success)
+                if not success:
+                    logger.warning(f"顧客 {customer.id} への前日リマインダー送信に失敗しました: {result}")
+            except Exception as e:
+                logger.error(f"顧客 {customer.id} への前日リマインダー送信中にエラー: {e}", exc_info=True)
+        if not sent and customer.email:
+            # メールは送信キュー経由でまとめて送信される（再送はキュー側で行う）
+            sent = bool(enqueue_email("【JELLO】ご予約前日のお知らせ", message, [customer.email]))
+        if sent:
+            customers_sent += 1
+        elif customer.line_user_id and customer.line_reachable:
+            _release_failed_reminders(reminders)
+
+    return {'staff': staff_sent, 'customers': customers_sent}
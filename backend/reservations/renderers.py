@@ -0,0 +1,41 @@
+# backend/reservations/renderers.py
+from rest_framework.renderers import JSONRenderer
+
+from .fast_serializers import ProjectedRows
+from .instrumentation import track
+
+try:
+    import orjson
+except ImportError:  # orjsonは任意。未インストールなら標準のjsonで出力する
+    orjson = None
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """レスポンスのJSON化にかかった時間を 'serialize' として計測するレンダラー"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with track('serialize'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class FastJSONRenderer(TimedJSONRenderer):
+    """
+    fast_serializers で組み立てた一覧（ProjectedRows）を orjson で出力するレンダラー。
+    出力はJSONRendererと同じバイト列になる（区切り文字なし・非ASCIIはUTF-8のまま・U+2028/U+2029はエスケープ）。
+    floatの書式など orjson と json で差が出うるデータや、インデント指定がある場合は JSONRenderer で出力する。
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or not isinstance(data, ProjectedRows)
+            or not data.json_safe
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        with track('serialize'):
+            # list のサブクラスは orjson がそのまま扱えないため、要素だけを渡す
+            ret = orjson.dumps(list(data))
+            return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,182 @@
+# backend/reservations/revocation.py
+"""
+JWTの失効（リボケーション）管理。
+
+失効させたトークンの jti を、トークンの残り有効期間をTTLとしてRedisに保存する。
+認証のたびにRedisへ問い合わせないよう、失効済み jti の集合をプロセス内のBloomフィルタに
+定期的（TOKEN_REVOCATION_REFRESH_SECONDS ごと）に読み込み、
+「フィルタに含まれない jti は失効していない」と判定できる大半の認証ではRedisに触れない。
+フィルタに含まれる（偽陽性を含む）場合だけRedisで確認する。
+
+他プロセスで失効させたトークンは、次にフィルタを読み込み直すまで（最大で更新間隔の間）有効のまま扱われる。
+同じプロセスで失効させたトークンは即座にフィルタへ反映される。
+Redisが設定されていない開発環境（DEBUG）では、プロセス内のメモリに保存する。
+メモリでは他のプロセス（Webワーカー・Celery）で失効が見えないため、DEBUG以外では設定エラーにする。
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'jwt:revoked:'
+# 失効済み jti の一覧（スコア＝トークンの有効期限）。Bloomフィルタの再構築に使う
+INDEX_KEY = 'jwt:revoked:index'
+
+
+class BloomFilter:
+    """偽陽性率 error_rate で capacity 件を保持できるBloomフィルタ"""
+
+    def __init__(self, capacity=100_000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:], 'big') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class MemoryBackend:
+    """プロセス内のメモリに失効情報を保存する（開発環境用）"""
+
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def is_revoked(self, jti):
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def active_jtis(self):
+        now = time.time()
+        with self._lock:
+            self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+            return list(self._revoked)
+
+
+class RedisBackend:
+    """Redisに失効情報を保存する。キーはトークンの有効期限切れと同時に消える"""
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def revoke(self, jti, expires_at):
+        ttl = max(1, math.ceil(expires_at - time.time()))
+        pipe = self.client.pipeline()
+        pipe.set(KEY_PREFIX + jti, 1, ex=ttl)
+        pipe.zadd(INDEX_KEY, {jti: expires_at})
+        pipe.zremrangebyscore(INDEX_KEY, '-inf', time.time())
+        pipe.execute()
+
+    def is_revoked(self, jti):
+        return bool(self.client.exists(KEY_PREFIX + jti))
+
+    def active_jtis(self):
+        return [
+            jti.decode() if isinstance(jti, bytes) else jti
+            for jti in self.client.zrangebyscore(INDEX_KEY, time.time(), '+inf')
+        ]
+
+
+class RevocationRegistry:
+    """Bloomフィルタを前段に置いた失効判定"""
+
+    def __init__(self, backend, refresh_seconds=5.0, capacity=100_000):
+        self.backend = backend
+        self.refresh_seconds = refresh_seconds
+        self.capacity = capacity
+        self._bloom = BloomFilter(capacity)
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _refresh_if_stale(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < self.refresh_seconds:
+                return
+            # 失敗しても更新間隔ごとにしか再試行しない
+            self._loaded_at = now
+            try:
+                jtis = self.backend.active_jtis()
+            except Exception:
+                logger.exception("失効済みトークン一覧の読み込みに失敗しました（前回のフィルタを使います）")
+                return
+            bloom = BloomFilter(max(self.capacity, len(jtis) * 2))
+            for jti in jtis:
+                bloom.add(jti)
+            self._bloom = bloom
+
+    def revoke(self, jti, expires_at):
+        self.backend.revoke(jti, expires_at)
+        self._bloom.add(jti)
+
+    def is_revoked(self, jti):
+        if not jti:
+            return False
+        self._refresh_if_stale()
+        if jti not in self._bloom:
+            return False
+        try:
+            return self.backend.is_revoked(jti)
+        except Exception:
+            # Redisに接続できない間は、フィルタに含まれるトークンを失効扱いにする（安全側に倒す）
+            logger.exception("トークンの失効確認に失敗しました")
+            return True
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                url = getattr(settings, 'TOKEN_REVOCATION_REDIS_URL', None)
+                if url:
+                    backend = RedisBackend(url)
+                else:
+                    logger.warning("TOKEN_REVOCATION_REDIS_URL が未設定のため、失効したトークンはこのプロセス内でのみ拒否されます")
+                    if not settings.DEBUG:
+                        raise ImproperlyConfigured(
+                            'トークンの失効を全プロセスで共有するため、TOKEN_REVOCATION_REDIS_URL（または REDIS_URL）を設定してください'
+                        )
+                    backend = MemoryBackend()
+                _registry = RevocationRegistry(
+                    backend,
+                    refresh_seconds=getattr(settings, 'TOKEN_REVOCATION_REFRESH_SECONDS', 5.0),
+                    capacity=getattr(settings, 'TOKEN_REVOCATION_BLOOM_CAPACITY', 100_000),
+                )
+    return _registry
+
+
+def revoke_jti(jti, expires_at):
+    get_registry().revoke(jti, expires_at)
+
+
+def is_revoked(jti):
+    return get_registry().is_revoked(jti)
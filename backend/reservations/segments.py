@@ -0,0 +1,156 @@
+# backend/reservations/segments.py
+"""
+LINE一斉送信の対象を絞り込む顧客セグメント。
+
+条件（criteria）は次のキーを持つ辞書で、指定したものをすべて満たす顧客が対象になる。
+- last_visit_older_than_days: 最終来店がN日以上前（来店したことのない顧客は含まない）
+- used_service_ids:           指定したサービスのいずれかで来店したことがある
+- min_total_spend:            累計利用金額がこの金額を超える
+- booked_in_month:            'YYYY-MM' の月に予約（キャンセルを除く）がある
+どの場合も、LINE連携済みで送信可能な顧客に限る（条件が空なら従来の一斉送信と同じ対象）。
+
+最終来店・累計利用金額は Customer の集計列（customer_stats.py）のインデックスで絞り込み、
+予約に関する条件は (customer, start_time) のインデックスを使う EXISTS にするため、セグメントはSQL 1本になる。
+送信先は主キー順に一定件数ずつ読み出し、全件をメモリに載せない。
+件数のプレビューは顧客・予約テーブルのバージョンをキーにキャッシュする
+（「N日以上前」の基準時刻はキャッシュの有効期間だけずれることがある）。
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .conditional import get_versions
+from .customer_stats import VISIT_STATUSES
+from .models import Customer, CustomerSegment, Reservation
+
+CRITERIA_KEYS = ('last_visit_older_than_days', 'used_service_ids', 'min_total_spend', 'booked_in_month')
+COUNT_CACHE_TIMEOUT = 300
+RECIPIENT_CHUNK_SIZE = 1000
+
+
+def _non_negative_int(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    number = int(value)
+    if number < 0 or number != float(value):
+        raise ValueError(value)
+    return number
+
+
+def _service_ids(value):
+    if not isinstance(value, list):
+        raise ValueError(value)
+    return sorted({_non_negative_int(service_id) for service_id in value})
+
+
+def _month(value):
+    datetime.strptime(value, '%Y-%m')
+    return value
+
+
+_PARSERS = {
+    'last_visit_older_than_days': (_non_negative_int, '0以上の整数（日数）を指定してください。'),
+    'used_service_ids': (_service_ids, 'サービスIDの配列を指定してください。'),
+    'min_total_spend': (_non_negative_int, '0以上の整数（金額）を指定してください。'),
+    'booked_in_month': (_month, 'YYYY-MM 形式で指定してください。'),
+}
+
+
+def normalize_criteria(criteria):
+    """条件を検証し、指定されたキーだけを正規化した辞書を返す。不正な値は ValidationError（400）"""
+    if not isinstance(criteria, dict):
+        raise ValidationError('条件はオブジェクトで指定してください。')
+    errors = {key: '未対応の条件です。' for key in criteria if key not in _PARSERS}
+    normalized = {}
+    for key, (parse, message) in _PARSERS.items():
+        value = criteria.get(key)
+        if value is None or value == '' or value == []:
+            continue
+        try:
+            normalized[key] = parse(value)
+        except (TypeError, ValueError):
+            errors[key] = message
+    if errors:
+        raise ValidationError(errors)
+    return normalized
+
+
+def criteria_from_request(data):
+    """
+    リクエストの segment_id（登録済みのセグメント）または criteria（条件の直接指定）から条件を返す。
+    どちらも指定がなければ None。
+    """
+    segment_id = data.get('segment_id')
+    if segment_id not in (None, ''):
+        try:
+            segment = CustomerSegment.objects.filter(pk=_non_negative_int(segment_id)).first()
+        except (TypeError, ValueError):
+            segment = None
+        if segment is None:
+            raise ValidationError({'segment_id': 'セグメントが見つかりません。'})
+        return normalize_criteria(segment.criteria)
+    if data.get('criteria') is None:
+        return None
+    try:
+        return normalize_criteria(data['criteria'])
+    except ValidationError as e:
+        raise ValidationError({'criteria': e.detail})
+
+
+def _month_range(month):
+    start = datetime.strptime(month, '%Y-%m')
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+def compile_segment(criteria, now=None):
+    """条件に当てはまる顧客のQuerySet（SQL 1本）を返す"""
+    criteria = normalize_criteria(criteria)
+    now = now or timezone.now()
+    # ブロック・友だち解除された顧客は送信しても必ず失敗するため、常に除外する
+    queryset = Customer.objects.filter(line_reachable=True, line_user_id__isnull=False).exclude(line_user_id='')
+    if 'last_visit_older_than_days' in criteria:
+        queryset = queryset.filter(last_visit_at__lt=now - timedelta(days=criteria['last_visit_older_than_days']))
+    if 'min_total_spend' in criteria:
+        queryset = queryset.filter(total_spend__gt=criteria['min_total_spend'])
+    reservations = Reservation.objects.filter(customer=OuterRef('pk'))
+    if 'used_service_ids' in criteria:
+        queryset = queryset.filter(Exists(reservations.filter(
+            service_id__in=criteria['used_service_ids'], status__in=VISIT_STATUSES, start_time__lte=now,
+        )))
+    if 'booked_in_month' in criteria:
+        start, end = _month_range(criteria['booked_in_month'])
+        queryset = queryset.filter(Exists(
+            reservations.filter(start_time__gte=start, start_time__lt=end).exclude(status='cancelled')
+        ))
+    return queryset
+
+
+def count_preview(criteria):
+    """条件に当てはまる顧客数を返す。戻り値は (件数, キャッシュから返したか)"""
+    criteria = normalize_criteria(criteria)
+    digest = hashlib.sha256(json.dumps(criteria, sort_keys=True).encode()).hexdigest()[:32]
+    key = f'customer_segment_count:{digest}:' + ','.join(map(str, get_versions((Customer, Reservation))))
+    count = cache.get(key)
+    if count is not None:
+        return count, True
+    count = compile_segment(criteria).count()
+    cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count, False
+
+
+def iter_recipients(criteria, chunk_size=RECIPIENT_CHUNK_SIZE):
+    """条件に当てはまる顧客（id と line_user_id のみ）を、主キー順に chunk_size 件ずつ読み出しながら返す"""
+    queryset = compile_segment(criteria).only('id', 'line_user_id').order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
@@ -1,8 +1,70 @@
 # backend/reservations/serializers.py
 
 from rest_framework import serializers
-from .models import Salon, Service, Reservation, NotificationSetting, Customer, UserProfile, LineMessage
+from .models import Salon, Service, Reservation, ReservationChange, NotificationSetting, Customer, CustomerSegment, UserProfile, LineMessage, RequestProfile
 from reservations.models import User
+from .segments import normalize_criteria
+
+# --- 出力フィールドの絞り込み（?fields= / ?expand=） ---
+
+def parse_sparse_fields(query_params):
+    """
+    クエリパラメータの ?fields=id,start_time,customer.name と ?expand=customer を
+    SparseFieldsMixin に渡す引数（fields / expand）に変換する。指定がないものは含めない。
+    """
+    options = {}
+    for key in ('fields', 'expand'):
+        value = query_params.get(key)
+        if value is not None:
+            options[key] = [name.strip() for name in value.split(',') if name.strip()]
+    return options
+
+
+class SparseFieldsMixin:
+    """
+    fields（出力するフィールド）と expand（オブジェクトとして埋め込む関連）で出力を絞り込むミックスイン。
+
+    - Meta.expandable_fields に {フィールド名: シリアライザー} を、Meta.default_expand に
+      expand を指定しないときに埋め込む関連を定義する。
+    - 埋め込まない関連は主キーだけを返す（JOINも発生しない）。
+    - fields に customer.name のように書くと、その関連を埋め込み、関連先のフィールドも絞り込む。
+    - fields も expand も指定しなければ、これまでと同じ出力になる。
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None and expand is None:
+            return
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        expanded = set(getattr(self.Meta, 'default_expand', ()) if expand is None else expand)
+        unknown = expanded - set(expandable)
+        if unknown:
+            raise serializers.ValidationError({'expand': f"展開できない関連です: {', '.join(sorted(unknown))}"})
+
+        selected, nested_fields = None, {}
+        if fields is not None:
+            selected = []
+            for name in fields:
+                head, _, rest = name.partition('.')
+                selected.append(head)
+                if rest:
+                    nested_fields.setdefault(head, []).append(rest)
+            unknown = set(selected) - set(self.fields) | set(nested_fields) - set(expandable)
+            if unknown:
+                raise serializers.ValidationError({'fields': f"不明なフィールドです: {', '.join(sorted(unknown))}"})
+            expanded |= set(nested_fields)
+
+        for name, serializer_class in expandable.items():
+            if selected is not None and name not in selected:
+                continue
+            if name in expanded:
+                self.fields[name] = serializer_class(read_only=True, fields=nested_fields.get(name))
+            else:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+        if selected is not None:
+            for name in list(self.fields):
+                if name not in selected:
+                    self.fields.pop(name)
 
 # --- 基本的なモデルのシリアライザー ---
 
@@ -12,13 +74,13 @@ class SalonSerializer(serializers.ModelSerializer):
         model = Salon
         fields = '__all__'
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """サービスメニュー用のシリアライザー"""
     class Meta:
         model = Service
         fields = '__all__'
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """顧客情報用のシリアライザー"""
     class Meta:
         model = Customer
@@ -34,8 +96,22 @@ class CustomerSerializer(serializers.ModelSerializer):
             'line_picture_url',
             'notes',
             'created_at',
+            'visit_count',
+            'last_visit_at',
+            'next_booking_at',
+            'total_spend',
         ]
-        read_only_fields = ['created_at']
+        read_only_fields = ['created_at', 'visit_count', 'last_visit_at', 'next_booking_at', 'total_spend']
+
+class CustomerSegmentSerializer(serializers.ModelSerializer):
+    """LINE一斉送信用の顧客セグメントのシリアライザー（criteria は segments.py の形式）"""
+    class Meta:
+        model = CustomerSegment
+        fields = ['id', 'name', 'criteria', 'created_at', 'updated_at']
+
+    def validate_criteria(self, value):
+        return normalize_criteria(value)
+
 
 class UserSerializer(serializers.ModelSerializer):
     """DjangoのUserモデル用の基本的なシリアライザー"""
@@ -70,7 +146,7 @@ class AdminUserSerializer(serializers.ModelSerializer):
 
 # --- 予約関連のシリアライザー ---
 
-class ReservationSerializer(serializers.ModelSerializer):
+class ReservationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """予約情報（読み取り専用）のシリアライザー"""
     # 関連モデルの情報をネストして表示
     customer = CustomerSerializer(read_only=True)
@@ -79,11 +155,24 @@ class ReservationSerializer(serializers.ModelSerializer):
     # フラットなフィールドも追加（フロントエンド互換性のため）
     customer_name = serializers.CharField(source='customer.name', read_only=True)
     customer_id = serializers.IntegerField(source='customer.id', read_only=True)
-    service_name = serializers.CharField(source='service.name', read_only=True)
 
     class Meta:
         model = Reservation
         fields = '__all__' # 全てのフィールドを返す
+        # ステータスは状態遷移API（state_machine.py）でのみ変更する（version は editable=False のため読み取り専用）
+        read_only_fields = ['status']
+        expandable_fields = {'customer': CustomerSerializer, 'service': ServiceSerializer}
+        default_expand = ('customer', 'service')
+
+
+class ReservationChangeSerializer(serializers.ModelSerializer):
+    """予約の変更ログ（changes API）のシリアライザー"""
+    class Meta:
+        model = ReservationChange
+        fields = [
+            'seq', 'reservation', 'reservation_number', 'kind', 'old_status', 'status',
+            'start_time', 'end_time', 'changed_at',
+        ]
 
 
 class ReservationCreateSerializer(serializers.ModelSerializer):
@@ -120,7 +209,7 @@ class ReservationCreateSerializer(serializers.ModelSerializer):
 
 # --- LINEメッセージ関連のシリアライザー ---
 
-class LineMessageSerializer(serializers.ModelSerializer):
+class LineMessageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """LINEメッセージ履歴用のシリアライザー"""
     # 顧客情報をネストして表示
     customer_name = serializers.CharField(source='customer.name', read_only=True)
@@ -139,3 +228,20 @@ class LineMessageSerializer(serializers.ModelSerializer):
             'sent_at'
         ]
         read_only_fields = ['sent_at']
+        expandable_fields = {'customer': CustomerSerializer}
+        default_expand = ()
+
+# --- プロファイリング関連のシリアライザー ---
+
+class RequestProfileSerializer(serializers.ModelSerializer):
+    """リクエストプロファイル一覧用のシリアライザー（スタックとSQLは含めない）"""
+    class Meta:
+        model = RequestProfile
+        fields = ['id', 'user', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'sample_count', 'query_count', 'created_at']
+
+
+class RequestProfileDetailSerializer(serializers.ModelSerializer):
+    """リクエストプロファイル詳細用のシリアライザー"""
+    class Meta:
+        model = RequestProfile
+        fields = '__all__'
@@ -0,0 +1,72 @@
+# backend/reservations/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import changelog, conditional, customer_stats
+from .models import NotificationSetting, Reservation, ReservationChange
+from .reminders import reschedule_all_reminders, schedule_reservation_reminders
+
+
+@receiver(post_save, sender=Reservation)
+def reschedule_reservation_reminders(sender, instance, raw=False, **kwargs):
+    """予約の作成・日時変更・ステータス変更に合わせてリマインダーを再スケジュールする"""
+    if raw:
+        return
+    schedule_reservation_reminders(instance)
+
+
+@receiver(post_save, sender=Reservation)
+def record_reservation_change(sender, instance, created, raw=False, **kwargs):
+    """
+    予約の作成・ステータス変更・日時変更を変更ログに書き、顧客の来店集計を更新する
+    （Reservation.save() のトランザクション内で実行される）
+    """
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    change = changelog.detect_change(instance, created)
+    if change is not None:
+        changelog.record_change(instance, *change)
+    customer_ids = {instance.customer_id, loaded.get('customer_id', instance.customer_id)}
+    # サービスの変更で予約時点の料金が変わった場合も累計利用金額が変わる
+    repriced = loaded.get('price', instance.price) != instance.price
+    if change is not None or len(customer_ids) > 1 or repriced:
+        customer_stats.refresh_customers(customer_ids)
+    instance._loaded_values = {
+        'status': instance.status, 'start_time': instance.start_time, 'end_time': instance.end_time,
+        'customer_id': instance.customer_id, 'service_id': instance.service_id, 'price': instance.price,
+    }
+
+
+@receiver(post_delete, sender=Reservation)
+def record_reservation_deletion(sender, instance, **kwargs):
+    """予約の削除を変更ログに書き、顧客の来店集計を更新する（削除と同じトランザクション内で実行される）"""
+    changelog.record_change(instance, ReservationChange.KIND_DELETED, instance.status)
+    customer_stats.refresh_customers([instance.customer_id])
+
+
+@receiver(post_save, sender=NotificationSetting)
+def reschedule_reminders_on_setting_change(sender, instance, raw=False, **kwargs):
+    """通知設定の変更に合わせて未送信リマインダーを再スケジュールする"""
+    if raw:
+        return
+    reschedule_all_reminders(instance)
+
+
+def bump_table_version(sender, raw=False, **kwargs):
+    """条件付きGET用に、保存されたテーブルのバージョンを進める"""
+    if raw:
+        return
+    conditional.bump(sender)
+
+
+def bump_table_version_on_delete(sender, **kwargs):
+    """削除ではCASCADE / SET_NULLで参照元のテーブルも変わるため、それらのバージョンも進める"""
+    conditional.bump(sender, *conditional.related_models(sender))
+
+
+for model in conditional.TRACKED_MODELS:
+    post_save.connect(bump_table_version, sender=model, dispatch_uid=f'bump_table_version_{model._meta.label_lower}')
+    post_delete.connect(
+        bump_table_version_on_delete, sender=model, dispatch_uid=f'bump_table_version_on_delete_{model._meta.label_lower}'
+    )
@@ -0,0 +1,142 @@
+# backend/reservations/state_machine.py
+"""
+予約ステータスの状態遷移。
+
+遷移は TRANSITIONS で宣言し、ステータスを読んでから save() するのではなく、
+「遷移元のステータスである（と、指定があればバージョンが一致する）行だけを更新する」条件付きUPDATE 1回で行う。
+同時に別の職員が操作しても、先に更新された行は条件に合わなくなるため上書きされない。
+更新できなかった場合は TransitionError（見つからない: 404、ステータスやバージョンが合わない: 409）を送出する。
+完了（complete）は開始日時を過ぎた予約だけが対象で、来店集計（customer_stats.py）の「来店」の定義と揃えている。
+
+UPDATE ... RETURNING で遷移後の行と遷移前のステータスを受け取るため、再読み込みは不要。
+QuerySet.update() と同じくシグナルが発生しないため、変更ログ・来店集計・リマインダー・テーブルのバージョンは
+apply_transition() の中で同じトランザクションのうちにまとめて更新する。
+"""
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import changelog, conditional, customer_stats
+from .models import Reservation, ReservationChange
+from .reminders import schedule_reminders_for_reservations
+
+Transition = namedtuple('Transition', ['sources', 'target', 'label', 'started_only'], defaults=(False,))
+
+# 操作名: (遷移元のステータス, 遷移先のステータス, メッセージ用の操作名, 開始日時を過ぎた予約だけが対象か)
+TRANSITIONS = {
+    'confirm': Transition(('pending',), 'confirmed', '確定'),
+    'cancel': Transition(('pending', 'confirmed'), 'cancelled', 'キャンセル'),
+    'complete': Transition(('confirmed',), 'completed', '完了に', started_only=True),
+}
+
+
+VERSION_CONFLICT_MESSAGE = 'この予約は他の操作で更新されています。最新の内容を読み込んでからやり直してください。'
+
+
+class TransitionError(Exception):
+    """遷移できなかった（利用者に返すメッセージ・HTTPステータス・現在のステータスとバージョンを持つ）"""
+
+    def __init__(self, message, status_code, current=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.current = current or {}
+
+    def as_response_data(self):
+        return {'error': self.message, **self.current}
+
+
+def _update_returning(queryset, transition, expected_version, now):
+    """条件付きUPDATE 1回で遷移させ、遷移後の予約（old_status に遷移前のステータス）のリストを返す"""
+    qn = connection.ops.quote_name
+    table = qn(Reservation._meta.db_table)
+    # 対象の行をロックしながら遷移前のステータスを控え、RETURNING から参照する
+    scope_sql, scope_params = queryset.order_by().select_for_update(of=('self',)) \
+        .values_list('pk', 'status').query.sql_with_params()
+    conditions = f"{qn('status')} IN ({', '.join(['%s'] * len(transition.sources))})"
+    params = [*scope_params, transition.target, connection.ops.adapt_datetimefield_value(now), *transition.sources]
+    if transition.started_only:
+        conditions += f" AND {qn('start_time')} <= %s"
+        params.append(connection.ops.adapt_datetimefield_value(now))
+    if expected_version is not None:
+        conditions += f" AND {qn('version')} = %s"
+        params.append(expected_version)
+    columns = ', '.join(qn(field.column) for field in Reservation._meta.concrete_fields)
+    sql = (
+        f'WITH prev (id, old_status) AS MATERIALIZED ({scope_sql}) '
+        f"UPDATE {table} SET {qn('status')} = %s, {qn('version')} = {qn('version')} + 1, {qn('updated_at')} = %s "
+        f"WHERE {qn('id')} IN (SELECT id FROM prev) AND {conditions} "
+        f'RETURNING {columns}, (SELECT prev.old_status FROM prev WHERE prev.id = {table}.{qn("id")}) AS old_status'
+    )
+    return list(Reservation.objects.raw(sql, params))
+
+
+def _update_then_select(queryset, transition, expected_version, now):
+    """UPDATE ... RETURNING が使えないDB向け。行をロックしてから更新し、読み直す"""
+    targets = queryset.order_by().select_for_update().filter(status__in=transition.sources)
+    if transition.started_only:
+        targets = targets.filter(start_time__lte=now)
+    if expected_version is not None:
+        targets = targets.filter(version=expected_version)
+    previous = dict(targets.values_list('pk', 'status'))
+    Reservation.objects.filter(pk__in=previous).update(
+        status=transition.target, version=F('version') + 1, updated_at=now,
+    )
+    reservations = list(Reservation.objects.filter(pk__in=previous))
+    for reservation in reservations:
+        reservation.old_status = previous[reservation.pk]
+    return reservations
+
+
+def apply_transition(queryset, action, expected_version=None):
+    """
+    queryset で絞り込んだ予約のうち、遷移できるものをまとめて遷移させ、遷移後の予約のリストを返す。
+    遷移できない予約（ステータス・開始日時・バージョンが合わない）は結果に含まれない。
+    """
+    transition = TRANSITIONS[action]
+    now = timezone.now()
+    with transaction.atomic():
+        if changelog.supports_update_returning():
+            reservations = _update_returning(queryset, transition, expected_version, now)
+        else:
+            reservations = _update_then_select(queryset, transition, expected_version, now)
+        if reservations:
+            changelog.record_changes([
+                changelog.build_change(reservation, ReservationChange.KIND_STATUS_CHANGED, reservation.old_status)
+                for reservation in reservations
+            ])
+            customer_stats.refresh_customers({reservation.customer_id for reservation in reservations})
+            schedule_reminders_for_reservations(reservations)
+            conditional.bump(Reservation)
+    return reservations
+
+
+FAILURE_FIELDS = ('status', 'version', 'start_time')
+
+
+def describe_failure(current, action, now=None):
+    """
+    遷移できなかった予約の現在の {status, version, start_time}（FAILURE_FIELDS。見つからなければ None）から
+    TransitionError を作る。エラーに含める現在の値は status と version だけ。
+    """
+    transition = TRANSITIONS[action]
+    if current is None:
+        return TransitionError('予約が見つかりません。', 404)
+    current = dict(current)
+    start_time = current.pop('start_time', None)
+    if current['status'] not in transition.sources:
+        label = dict(Reservation._meta.get_field('status').choices).get(current['status'], current['status'])
+        return TransitionError(f'この予約は{label}のため、{transition.label}できません。', 409, current)
+    if transition.started_only and start_time is not None and start_time > (now or timezone.now()):
+        return TransitionError(f'開始日時前の予約は{transition.label}できません。', 409, current)
+    return TransitionError(VERSION_CONFLICT_MESSAGE, 409, current)
+
+
+def transition_reservation(queryset, action, expected_version=None):
+    """queryset で絞り込んだ1件の予約を遷移させ、遷移後の予約を返す。遷移できなければ TransitionError"""
+    reservations = apply_transition(queryset, action, expected_version)
+    if reservations:
+        return reservations[0]
+    raise describe_failure(queryset.values(*FAILURE_FIELDS).first(), action)
@@ -0,0 +1,156 @@
+# backend/reservations/structured_logging.py
+"""
+非同期・構造化ロギング。
+
+- AsyncQueueHandler はログをキューに積むだけにし、書き出しは別スレッドの QueueListener が行う。
+  キューがあふれた場合はリクエストを待たせず、そのレコードを捨てて件数だけ数える。
+- JSONFormatter は1レコードを1行のJSONに整形する。
+- RequestIdFilter はリクエストごとの相関ID（X-Request-ID）を各レコードに付ける。
+- DebugSamplingFilter は量の多いDEBUGレコードを一定割合だけ残す（INFO以上は常に残す）。
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+from logging.handlers import QueueHandler, QueueListener
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# 受け取った X-Request-ID をそのまま使ってよい形式（ログへの注入を防ぐ）
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_request_id = ContextVar('request_id', default=None)
+
+# LogRecordが標準で持つ属性（これ以外は extra として出力する）
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def bind_request_id(value=None):
+    """相関IDを設定し、復元用のトークンを返す。不正な値や未指定なら新しく発行する"""
+    if not value or not _VALID_REQUEST_ID.match(value):
+        value = uuid.uuid4().hex
+    return value, _request_id.set(value)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """レコードに現在のリクエストの相関IDを付ける（ログを出したスレッドで実行される）"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = _request_id.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """DEBUGレコードを sample_rate の割合だけ通す"""
+
+    def __init__(self, sample_rate=1.0):
+        super().__init__()
+        self.sample_rate = float(sample_rate)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+
+class JSONFormatter(logging.Formatter):
+    """1レコードを1行のJSONに整形する"""
+
+    def format(self, record):
+        payload = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=dt_timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'module': record.module,
+            'line': record.lineno,
+            'thread': record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exception'] = record.exc_text
+        if record.stack_info:
+            payload['stack'] = self.formatStack(record.stack_info)
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    ログをキューに積み、別スレッドで stream へJSONとして書き出すハンドラ。
+    LOGGING（dictConfig）からそのまま指定できるよう、書き出し先のハンドラは内部で作成する。
+
+    書き出しスレッドはプロセスごとに最初のログで起動する。fork した子プロセス（gunicorn・Celery の prefork）には
+    キューは引き継がれてもスレッドは引き継がれないため、プロセスIDが変わっていればキューを作り直して起動し直す。
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+        self.queue_size = queue_size
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.target.setFormatter(JSONFormatter())
+        self.listener = None
+        self._pid = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def _ensure_listener(self):
+        """このプロセスの書き出しスレッドがなければ起動する（handle() がハンドラのロックを取った状態で呼ばれる）"""
+        pid = os.getpid()
+        if self._pid == pid or self._closed:
+            return
+        if self._pid is not None:
+            # 親プロセスのキュー（とそのロック）は使わない。残っているレコードは親プロセスが書き出す
+            self.queue = queue.Queue(maxsize=self.queue_size)
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+        self._pid = pid
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def prepare(self, record):
+        # 別スレッドで整形しても結果が変わらないよう、引数と例外情報はここで文字列にしておく
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # ログのためにリクエストを待たせない
+            self.dropped += 1
+
+    def close(self):
+        self._closed = True
+        listener, self.listener = self.listener, None
+        # fork した子プロセスが親のスレッドを止めようとしないよう、このプロセスで起動したものだけ止める
+        if listener is not None and self._pid == os.getpid():
+            listener.stop()
+        super().close()
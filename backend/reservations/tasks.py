@@ -0,0 +1,34 @@
+# backend/reservations/tasks.py
+from celery import shared_task
+
+from . import calendar_events, customer_stats, notifications, outbox, reminders
+
+
+@shared_task
+def send_due_reminders():
+    """送信予定を過ぎたリマインダーを送信する（Celery beatから定期実行）"""
+    return reminders.send_due_reminders()
+
+
+@shared_task
+def drain_email_outbox():
+    """送信待ちメールを1つのSMTP接続でまとめて送信する"""
+    return outbox.drain_email_outbox()
+
+
+@shared_task
+def flush_staff_alerts():
+    """溜まった職員向け通知を受信者ごとに1通にまとめて送信する"""
+    return notifications.flush_staff_alerts()
+
+
+@shared_task
+def refresh_elapsed_customer_stats():
+    """次回予約の日時を過ぎた顧客の来店集計を更新する（予約が「次回予約」から「来店」に変わるため）"""
+    return customer_stats.refresh_elapsed()
+
+
+@shared_task
+def add_calendar_events(reservation_ids):
+    """一括確定した予約をGoogleカレンダーにまとめて登録する"""
+    return calendar_events.add_events(reservation_ids)
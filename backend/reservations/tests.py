@@ -1,3 +1,599 @@
-from django.test import TestCase
+import json
+import smtplib
+from contextlib import ExitStack
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import calendar_events, chat_sync, instrumentation, notifications, outbox, reminders, revocation, traffic, uploads
+from .adapters import gcs, google_calendar, module_available
+from .management.commands import benchmark_booking
+from .middleware import CompressionMiddleware
+from .models import AvailableTimeSlot, Customer, EmailOutbox, LineMessage, Reminder, Reservation, ReservationChange, Salon, Service, StaffAlert, User
+from .serializers import ReservationSerializer
+
+
+def make_reservation(start_time=None, status='pending', **kwargs):
+    """テスト用の店舗・サービス・顧客と、1時間の予約を作る"""
+    salon = Salon.objects.create(name='テスト店', address='東京都', phone_number='0300000000')
+    service = Service.objects.create(salon=salon, name='カット', price=5000, duration_minutes=60)
+    customer = Customer.objects.create(name='山田花子', email='hanako@example.jp')
+    start_time = start_time or timezone.now() + timedelta(days=3)
+    return Reservation.objects.create(
+        salon=salon, customer=customer, service=service, start_time=start_time, end_time=start_time + timedelta(hours=1),
+        status=status, **kwargs,
+    )
+
+
+class TrafficSanitizerTests(SimpleTestCase):
+    """管理画面の各APIへの代表的なリクエストを記録したとき、個人情報がそのまま残らないこと"""
+
+    NAME = '山田花子'
+    FURIGANA = 'ヤマダハナコ'
+    EMAIL = 'hanako@example.jp'
+    PHONE = '09012345678'
+    LINE_USER_ID = 'U0123456789abcdef0123456789abcdef'
+    TEXT = '明日のご予約の件でご連絡しました'
+
+    # (メソッド, パス, クエリ文字列, JSONボディ)
+    ADMIN_REQUESTS = [
+        ('GET', '/api/admin/customers/', f'name={NAME}&email={EMAIL}&phone_number={PHONE}', None),
+        ('POST', '/api/admin/customers/', '', {
+            'name': NAME, 'furigana': FURIGANA, 'email': EMAIL, 'phone_number': PHONE,
+            'line_user_id': LINE_USER_ID, 'notes': TEXT,
+        }),
+        ('PATCH', '/api/admin/customers/1/', '', {'name': NAME, 'notes': TEXT}),
+        ('POST', '/api/admin/customers/1/send-message/', '', {'text': TEXT, 'image_key': 'uploads/a.jpg'}),
+        ('POST', '/api/admin/send-bulk-message/', '', {'text': TEXT, 'criteria': {'min_total_spend': 10000}}),
+        ('POST', '/api/admin/send-staff-notification/', '', {'text': TEXT, 'target_staff_id': 2}),
+        ('GET', '/api/admin/line-history/', f'customer_id=1&query={NAME}', None),
+        ('POST', '/api/admin/reservations/create-with-new-customer/', '', {
+            'name': NAME, 'phone_number': PHONE, 'email': EMAIL, 'service_id': 1, 'start_time': '2026-01-01T10:00',
+        }),
+        ('POST', '/api/admin/users/', '', {
+            'username': NAME, 'full_name': NAME, 'email': EMAIL, 'password': 'secret-pass',
+        }),
+        ('PATCH', '/api/admin/staff/2/', '', {'first_name': NAME, 'last_name': FURIGANA, 'email': EMAIL}),
+    ]
+
+    def test_admin_requests_do_not_keep_personal_data(self):
+        factory = RequestFactory()
+        secrets = (self.NAME, self.FURIGANA, self.EMAIL, self.PHONE, self.LINE_USER_ID, self.TEXT, 'secret-pass')
+        for method, path, query, body in self.ADMIN_REQUESTS:
+            with self.subTest(method=method, path=path):
+                request = factory.generic(
+                    method, f'{path}?{query}' if query else path,
+                    json.dumps(body) if body is not None else '', content_type='application/json',
+                )
+                captured, omitted = traffic.capture_body(request)
+                record = json.dumps({
+                    'query': traffic.sanitize_query_string(request.META.get('QUERY_STRING', '')),
+                    'body': captured,
+                }, ensure_ascii=False)
+                self.assertFalse(omitted)
+                for value in secrets:
+                    self.assertNotIn(value, record)
+                self.assertNotIn(self.EMAIL.replace('@', '%40'), record)
+
+    def test_pseudonyms_are_stable_and_keep_other_fields(self):
+        first = traffic.sanitize({'text': self.TEXT, 'service_id': 3, 'version': 2})
+        second = traffic.sanitize({'text': self.TEXT})
+        self.assertEqual(first['text'], second['text'])
+        self.assertEqual((first['service_id'], first['version']), (3, 2))
+
+
+class EmailOutboxBounceTests(TestCase):
+    """SMTPのエラーのうち、宛先の5xx拒否だけを宛先エラー（BOUNCED）にすること"""
+
+    def setUp(self):
+        outbox.enqueue_emails([('件名', '本文', ['a@example.com', 'b@example.com'])])
+
+    def _statuses(self):
+        return set(EmailOutbox.objects.values_list('status', flat=True))
+
+    def test_auth_failure_reschedules_whole_batch(self):
+        connection = mock.Mock()
+        connection.open.side_effect = smtplib.SMTPAuthenticationError(535, b'authentication failed')
+        with mock.patch.object(outbox, 'get_connection', return_value=connection):
+            result = outbox.drain_email_outbox()
+        self.assertEqual(result, {'sent': 0, 'failed': 2})
+        self.assertEqual(self._statuses(), {EmailOutbox.STATUS_PENDING})
+        self.assertEqual(set(EmailOutbox.objects.values_list('attempts', flat=True)), {0})
+
+    def test_disconnect_mid_batch_reschedules_remainder(self):
+        outbox.enqueue_emails([('件名', '本文', ['c@example.com'])])
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [1, smtplib.SMTPServerDisconnected('Connection unexpectedly closed')]
+        with mock.patch.object(outbox, 'get_connection', return_value=connection):
+            result = outbox.drain_email_outbox()
+        self.assertEqual(result, {'sent': 1, 'failed': 2})
+        self.assertEqual(connection.send_messages.call_count, 2)
+        rows = sorted(EmailOutbox.objects.values_list('status', 'attempts'))
+        self.assertEqual(rows, [(EmailOutbox.STATUS_PENDING, 0), (EmailOutbox.STATUS_PENDING, 0), (EmailOutbox.STATUS_SENT, 1)])
+
+    def test_recipient_refused_is_bounce(self):
+        refused = smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'no such user')})
+        self.assertTrue(outbox._is_bounce(refused))
+        temporary = smtplib.SMTPRecipientsRefused({'a@example.com': (450, b'mailbox busy')})
+        self.assertFalse(outbox._is_bounce(temporary))
+        self.assertFalse(outbox._is_bounce(smtplib.SMTPSenderRefused(553, b'sender rejected', 'x@example.com')))
+        self.assertFalse(outbox._is_bounce(smtplib.SMTPAuthenticationError(535, b'authentication failed')))
+
+
+class AdapterAvailabilityTests(SimpleTestCase):
+    """SDKが入っていない環境でも、アダプタの利用可否の判定が例外にならないこと"""
+
+    def test_missing_parent_package_is_unavailable(self):
+        self.assertFalse(module_available('jello_missing_package.cloud.storage'))
+        self.assertTrue(module_available('django.db'))
+
+    def test_callers_degrade_without_google_package(self):
+        missing = {'google': None, 'googleapiclient': None}
+        gcs.is_available.cache_clear()
+        google_calendar.is_available.cache_clear()
+        try:
+            with mock.patch.dict('sys.modules', missing):
+                self.assertFalse(gcs.is_available())
+                self.assertFalse(google_calendar.is_available())
+                self.assertIsNone(calendar_events.get_calendar_id())
+                with self.settings(UPLOAD_STORAGE=None):
+                    self.assertIsInstance(uploads.get_storage(), uploads.LocalUploadStorage)
+        finally:
+            gcs.is_available.cache_clear()
+            google_calendar.is_available.cache_clear()
+
+
+class ImportTimeTests(SimpleTestCase):
+    """django.setup() とURL読み込みが import時間の予算内で、重いSDKを読み込まないこと（check_import_time）"""
+
+    def test_startup_imports_within_budget(self):
+        call_command('check_import_time', stdout=StringIO())
+
+
+class ServiceSnapshotTests(TestCase):
+    """予約はサービス名・料金・所要時間を予約時点のまま返すこと"""
+
+    def test_renamed_service_keeps_snapshot(self):
+        reservation = make_reservation()
+        Service.objects.filter(pk=reservation.service_id).update(name='カット（新）', price=6000)
+        data = ReservationSerializer(Reservation.objects.get(pk=reservation.pk)).data
+        self.assertEqual(data['service_name'], 'カット')
+        self.assertEqual(str(data['price']), '5000')
+        self.assertEqual(data['service']['name'], 'カット（新）')
+
+
+class CompleteTransitionTests(TestCase):
+    """完了にできるのは開始日時を過ぎた確定済みの予約だけで、完了した予約は来店として集計されること"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'pw'))
+
+    def _bulk_complete(self, reservation):
+        return self.client.post('/api/admin/reservations/bulk/', {
+            'action': 'complete', 'reservation_numbers': [str(reservation.reservation_number)],
+        }, format='json')
+
+    def test_future_reservation_cannot_be_completed(self):
+        reservation = make_reservation(status='confirmed')
+        response = self._bulk_complete(reservation)
+        self.assertEqual(response.data['results'][0]['result'], 'conflict')
+        response = self.client.post(f'/api/admin/reservations/{reservation.reservation_number}/complete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Reservation.objects.get(pk=reservation.pk).status, 'confirmed')
+
+    def test_completed_visit_is_counted(self):
+        reservation = make_reservation(start_time=timezone.now() - timedelta(hours=2), status='confirmed')
+        response = self._bulk_complete(reservation)
+        self.assertEqual(response.data['results'][0]['result'], 'ok')
+        customer = Customer.objects.get(pk=reservation.customer_id)
+        self.assertEqual((customer.visit_count, customer.total_spend), (1, 5000))
+
+
+class LineUnreachableTests(TestCase):
+    """送信先に起因するエラーの顧客への送信だけで、顧客をLINE送信不可にすること"""
+
+    def _error_response(self, status_code, body):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = body.encode()
+        return response
+
+    def _push(self, response, **kwargs):
+        with mock.patch.object(notifications, 'timed_request', return_value=response):
+            return notifications.send_line_push_message('U1', 'こんにちは', 'token', **kwargs)
+
+    def test_only_recipient_errors_are_unreachable(self):
+        self.assertTrue(notifications.is_unreachable_line_error(404, '{"message":"Not found"}'))
+        self.assertTrue(notifications.is_unreachable_line_error(
+            400, '{"message":"The property, \'to\', in the request body is invalid (line: -, column: -)"}'))
+        self.assertFalse(notifications.is_unreachable_line_error(403, '{"message":"Access to this API is not available for your account"}'))
+        self.assertFalse(notifications.is_unreachable_line_error(400, '{"message":"Failed to send messages"}'))
+
+    def test_staff_push_does_not_mark_customer(self):
+        customer = Customer.objects.create(name='山田花子', line_user_id='U1')
+        self._push(self._error_response(404, '{"message":"Not found"}'))
+        self.assertTrue(Customer.objects.get(pk=customer.pk).line_reachable)
+        self._push(self._error_response(404, '{"message":"Not found"}'), mark_unreachable=True)
+        self.assertFalse(Customer.objects.get(pk=customer.pk).line_reachable)
+
+
+class ReminderDeliveryTests(TestCase):
+    """送信に失敗したリマインダーを失わないこと（再送またはメールへの切り替え）"""
+
+    def setUp(self):
+        now = timezone.now()
+        self.reservation = make_reservation(start_time=now + timedelta(hours=12), status='confirmed')
+        Customer.objects.filter(pk=self.reservation.customer_id).update(line_user_id='U1')
+        Reminder.objects.all().delete()
+        self.reminder = Reminder.objects.create(
+            kind=Reminder.KIND_CUSTOMER_DAY_BEFORE, reservation=self.reservation, remind_at=now - timedelta(minutes=1))
+
+    def _send(self, **patches):
+        with ExitStack() as stack:
+            for name, value in patches.items():
+                stack.enter_context(mock.patch.object(reminders, name, **value))
+            return reminders.send_due_reminders()
+
+    def test_line_failure_falls_back_to_email(self):
+        result = self._send(send_customer_line_notification={'return_value': (False, 'error')})
+        self.assertEqual(result['customers'], 1)
+        self.assertEqual(list(EmailOutbox.objects.values_list('to_email', flat=True)), ['hanako@example.jp'])
+        self.assertIsNotNone(Reminder.objects.get(pk=self.reminder.pk).sent_at)
+
+    def test_line_error_without_email_is_retried_until_cap(self):
+        Customer.objects.filter(pk=self.reservation.customer_id).update(email='')
+        for attempt in range(1, reminders.MAX_SEND_ATTEMPTS):
+            self._send(send_customer_line_notification={'side_effect': requests.ConnectionError('timeout')})
+            reminder = Reminder.objects.get(pk=self.reminder.pk)
+            self.assertIsNone(reminder.sent_at)
+            self.assertEqual(reminder.attempts, attempt)
+        self._send(send_customer_line_notification={'side_effect': requests.ConnectionError('timeout')})
+        reminder = Reminder.objects.get(pk=self.reminder.pk)
+        self.assertIsNotNone(reminder.sent_at)
+        self.assertEqual(reminder.attempts, reminders.MAX_SEND_ATTEMPTS)
+
+    def test_staff_failure_is_released(self):
+        Reservation.objects.filter(pk=self.reservation.pk).update(status='pending')
+        staff_reminder = Reminder.objects.create(
+            kind=Reminder.KIND_UNCONFIRMED, reservation=self.reservation, remind_at=timezone.now() - timedelta(minutes=1))
+        result = self._send(send_admin_line_notification={'return_value': (False, 'error')})
+        self.assertEqual(result['staff'], 0)
+        self.assertIsNone(Reminder.objects.get(pk=staff_reminder.pk).sent_at)
+        result = self._send(send_admin_line_notification={'return_value': (True, None)})
+        self.assertEqual(result['staff'], 1)
+        self.assertIsNotNone(Reminder.objects.get(pk=staff_reminder.pk).sent_at)
+
+
+class StaffAlertDigestTests(TestCase):
+    """まとめ通知の送信に失敗した受信者の通知を未送信に戻すこと"""
+
+    def setUp(self):
+        now = timezone.now()
+        for recipient in ('U1', 'U2'):
+            StaffAlert.objects.create(recipient_line_user_id=recipient, alert_type='general', message='新しい予約',
+                                      created_at=now - timedelta(minutes=10), deliver_after=now - timedelta(minutes=1))
+
+    def _flush(self, side_effect):
+        with mock.patch.object(notifications, 'send_line_push_message', side_effect=side_effect):
+            return notifications.flush_staff_alerts()
+
+    def test_failed_recipient_is_retried(self):
+        result = self._flush(lambda user_id, **kwargs: (user_id == 'U1', '成功' if user_id == 'U1' else 'error'))
+        self.assertEqual(result['recipients'], 1)
+        pending = StaffAlert.objects.filter(delivered_at__isnull=True)
+        self.assertEqual(list(pending.values_list('recipient_line_user_id', flat=True)), ['U2'])
+        result = self._flush(lambda user_id, **kwargs: (True, '成功'))
+        self.assertEqual(result, {'recipients': 1, 'alerts': 1})
+        self.assertFalse(StaffAlert.objects.filter(delivered_at__isnull=True).exists())
+
+    def test_digest_sends_images_within_push_limit(self):
+        now = timezone.now()
+        for index in range(5):
+            StaffAlert.objects.create(recipient_line_user_id='U1', alert_type='customer_image', message='画像が届きました',
+                                      image_url=f'https://example.com/{index}.jpg', deliver_after=now)
+        messages = notifications._build_staff_digest(list(StaffAlert.objects.filter(recipient_line_user_id='U1').order_by('pk')))
+        self.assertLessEqual(len(messages), notifications.LINE_MESSAGES_PER_PUSH)
+        images = [m['originalContentUrl'] for m in messages if m['type'] == 'image']
+        self.assertEqual(images, [f'https://example.com/{index}.jpg' for index in range(3)])
+        text = '\n'.join(m['text'] for m in messages if m['type'] == 'text')
+        self.assertIn('https://example.com/3.jpg', text)
+        self.assertNotIn('https://example.com/0.jpg', text)
+
+    def test_expired_alerts_are_not_retried(self):
+        StaffAlert.objects.update(created_at=timezone.now() - notifications.STAFF_ALERT_RETRY_WINDOW - timedelta(minutes=1))
+        self._flush(requests.ConnectionError('timeout'))
+        self.assertFalse(StaffAlert.objects.filter(delivered_at__isnull=True).exists())
+
+
+class CompressionTests(TestCase):
+    """トークンを返すレスポンスは圧縮せず、それ以外は圧縮すること"""
+
+    def test_token_response_is_not_compressed(self):
+        User.objects.create_user('staff@example.jp', 'pw', username='staff')
+        client = APIClient()
+        response = client.post('/api/token/', {'username': 'staff', 'password': 'pw'}, format='json',
+                               HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('access', response.json())
+
+    def test_other_response_is_compressed(self):
+        request = RequestFactory().get('/api/booking/bootstrap/', HTTP_ACCEPT_ENCODING='gzip')
+        request.resolver_match = resolve('/api/booking/bootstrap/')
+        middleware = CompressionMiddleware(lambda request: HttpResponse('予約' * 500))
+        self.assertEqual(middleware(request)['Content-Encoding'], 'gzip')
+
+
+class RevocationRegistryTests(SimpleTestCase):
+    """Redisが設定されていなければ、DEBUG以外では失効管理をメモリに切り替えず設定エラーにすること"""
+
+    def test_memory_backend_only_in_debug(self):
+        with mock.patch.object(revocation, '_registry', None), self.settings(TOKEN_REVOCATION_REDIS_URL=None):
+            with self.settings(DEBUG=False), self.assertRaises(ImproperlyConfigured):
+                revocation.get_registry()
+            with self.settings(DEBUG=True):
+                self.assertIsInstance(revocation.get_registry().backend, revocation.MemoryBackend)
+
+
+class ServerTimingTests(TestCase):
+    """Server-Timingヘッダー（DB・外部APIの内訳）は既定では職員のリクエストにだけ付くこと"""
+
+    def test_header_only_for_staff_by_default(self):
+        client = APIClient()
+        with self.settings(SERVER_TIMING_ENABLED=False, DEBUG=False):
+            self.assertNotIn('Server-Timing', client.get('/api/bookable-dates/'))
+            client.force_authenticate(User.objects.create_superuser('admin', 'pw'))
+            self.assertIn('Server-Timing', client.get('/api/admin/segments/'))
+        client.force_authenticate(None)
+        with self.settings(SERVER_TIMING_ENABLED=True, DEBUG=False):
+            self.assertIn('Server-Timing', client.get('/api/bookable-dates/'))
+
+
+class FakeRedis:
+    """RedisMetricsStore が使うハッシュ操作だけを持つテスト用のRedis"""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def hincrby(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = values.get(field, 0) + amount
+
+    hincrbyfloat = hincrby
+
+    def execute(self):
+        pass
+
+    def hgetall(self, key):
+        return {field.encode(): str(value).encode() for field, value in self.hashes.get(key, {}).items()}
+
+
+class SharedMetricsTests(SimpleTestCase):
+    """/api/metrics/ は共有ストアを通して全ワーカーの計測値の合計を返すこと"""
+
+    LABELS = {'endpoint': 'metrics-test', 'method': 'GET', 'status': '200'}
+    COUNT_LINE = 'jello_request_duration_seconds_count{endpoint="metrics-test",method="GET",status="200"}'
+
+    def setUp(self):
+        self.store = instrumentation.RedisMetricsStore('redis://localhost:6379/0')
+        self.store.client = FakeRedis()
+        patcher = mock.patch.object(instrumentation, '_store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_render_sums_all_workers(self):
+        other_worker = instrumentation.Histogram(
+            instrumentation.REQUEST_DURATION.name, '', instrumentation.REQUEST_DURATION.label_names)
+        other_worker.observe(self.LABELS, 0.3)
+        self.store.add([(other_worker.name, other_worker.drain())])
+        instrumentation.REQUEST_DURATION.observe(self.LABELS, 0.02)
+        text = instrumentation.render_metrics()
+        self.assertIn(f'{self.COUNT_LINE} 2', text)
+        self.assertIn('jello_request_duration_seconds_bucket{endpoint="metrics-test",method="GET",status="200",le="0.025"} 1', text)
+        self.assertIn(f'{self.COUNT_LINE} 2', instrumentation.render_metrics())
+
+    def test_failed_flush_keeps_local_values(self):
+        instrumentation.REQUEST_DURATION.observe(self.LABELS, 0.02)
+        with mock.patch.object(self.store, 'add', side_effect=ConnectionError('down')):
+            instrumentation.flush_metrics(force=True)
+        self.assertIn(f'{self.COUNT_LINE} 1', instrumentation.REQUEST_DURATION.render())
+        instrumentation.flush_metrics(force=True)
+        self.assertIn(f'{self.COUNT_LINE} 1', instrumentation.render_metrics())
+
+
+class BulkConfirmTests(TestCase):
+    """一括確定は確認メールと同じトランザクションで行い、メールを積めなければまとめてロールバックすること"""
+
+    def setUp(self):
+        self.client = APIClient(raise_request_exception=False)
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'pw'))
+        self.reservation = make_reservation()
+
+    def _bulk_confirm(self):
+        return self.client.post('/api/admin/reservations/bulk/', {
+            'action': 'confirm', 'reservation_numbers': [str(self.reservation.reservation_number)],
+        }, format='json')
+
+    def test_confirm_enqueues_email(self):
+        response = self._bulk_confirm()
+        self.assertEqual(response.data['succeeded'], 1)
+        self.assertEqual(EmailOutbox.objects.filter(to_email='hanako@example.jp').count(), 1)
+
+    def test_email_failure_rolls_back_confirmation(self):
+        with mock.patch('reservations.views.enqueue_emails', side_effect=RuntimeError('outbox unavailable')):
+            response = self._bulk_confirm()
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(Reservation.objects.get(pk=self.reservation.pk).status, 'pending')
+        self.assertFalse(EmailOutbox.objects.exists())
+
+
+class ChatSyncTests(TestCase):
+    """since のポーリングは、手元の最新より古い sent_at で後からコミットされたメッセージも取りこぼさないこと"""
+
+    def test_since_returns_late_committed_message(self):
+        customer = Customer.objects.create(name='山田花子')
+        LineMessage.objects.create(customer=customer, sender_type='customer', message='最初')
+        first = chat_sync.sync_messages(customer, {})
+        self.assertEqual(len(first['results']), 1)
+
+        # sent_at は保存前に決まるため、先に作られたメッセージが後からコミットされることがある
+        late = LineMessage.objects.create(customer=customer, sender_type='admin', message='遅れてコミット')
+        LineMessage.objects.filter(pk=late.pk).update(sent_at=timezone.now() - timedelta(minutes=5))
+
+        polled = chat_sync.sync_messages(customer, {'since': first['sync_cursor']})
+        self.assertEqual([message['message'] for message in polled['results']], ['遅れてコミット'])
+        empty = chat_sync.sync_messages(customer, {'since': polled['sync_cursor']})
+        self.assertEqual((empty['results'], empty['sync_cursor']), ([], polled['sync_cursor']))
+
+
+class BookingQueryBudgetTests(TransactionTestCase):
+    """予約フローの各ステップのクエリ数が benchmarks/booking_baseline.json を超えないこと（レイテンシは見ない）"""
+
+    def test_booking_flow_within_query_baseline(self):
+        command = benchmark_booking.Command()
+        with ExitStack() as stack:
+            command._install_stand_ins(stack)
+            results, elapsed = command._run(iterations=2, warmup=1)
+        summary = command._summarize(results, elapsed)
+        baseline = json.loads(benchmark_booking.DEFAULT_BASELINE.read_text())
+        self.assertEqual(benchmark_booking.compare_queries(summary, baseline), [])
+
+
+class ReservationTransitionTests(TestCase):
+    """状態遷移APIは遷移元のステータスとバージョンを確認し、変更ログを残すこと"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'pw'))
+        self.reservation = make_reservation()
+        self.url = f'/api/admin/reservations/{self.reservation.reservation_number}/'
+
+    def test_confirm_then_conflict(self):
+        response = self.client.post(self.url + 'confirm/', {'version': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Reservation.objects.values_list('status', 'version').get(), ('confirmed', 2))
+        response = self.client.post(self.url + 'confirm/', format='json')
+        self.assertEqual((response.status_code, response.data['status']), (409, 'confirmed'))
+        self.assertEqual(
+            list(ReservationChange.objects.filter(kind=ReservationChange.KIND_STATUS_CHANGED).values_list('old_status', flat=True)),
+            ['pending'],
+        )
+
+    def test_stale_version_is_rejected(self):
+        self.client.post(self.url + 'confirm/', format='json')
+        response = self.client.post(self.url + 'cancel/', {'version': 1}, format='json')
+        self.assertEqual((response.status_code, response.data['version']), (409, 2))
+        self.assertEqual(Reservation.objects.get().status, 'confirmed')
+
+    def test_update_cannot_change_status(self):
+        self.client.post(self.url + 'cancel/', format='json')
+        response = self.client.patch(self.url, {'status': 'pending', 'version': 1}, format='json')
+        self.assertEqual(response.status_code, 409)
+        end_time = self.reservation.end_time + timedelta(minutes=30)
+        response = self.client.patch(self.url, {'status': 'pending', 'end_time': end_time.isoformat()}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Reservation.objects.values_list('status', 'end_time').get(), ('cancelled', end_time))
+
+
+class ReservationChangeFeedTests(TestCase):
+    """変更ログは since より後の変更だけを古い順に返すこと"""
+
+    def test_changes_since(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', 'pw'))
+        reservation = make_reservation()
+        first = client.get('/api/admin/reservations/changes/').data
+        self.assertEqual([change['kind'] for change in first['results']], [ReservationChange.KIND_CREATED])
+        client.post(f'/api/admin/reservations/{reservation.reservation_number}/confirm/', format='json')
+        second = client.get('/api/admin/reservations/changes/', {'since': first['next_since']}).data
+        self.assertEqual([change['kind'] for change in second['results']], [ReservationChange.KIND_STATUS_CHANGED])
+        self.assertFalse(second['has_more'])
+
+
+@override_settings(CONDITIONAL_GET_ENABLED=True)
+class ConditionalGetTests(TestCase):
+    """一覧は ETag で304を返し、データが変われば新しい内容を返すこと。共有キャッシュがなければ無効にすること"""
+
+    def test_disabled_without_shared_cache(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', 'pw'))
+        with self.settings(CONDITIONAL_GET_ENABLED=False):
+            response = client.get('/api/admin/reservations/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_etag_revalidation(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', 'pw'))
+        reservation = make_reservation()
+        response = client.get('/api/admin/reservations/')
+        etag = response['ETag']
+        self.assertEqual(client.get('/api/admin/reservations/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        client.post(f'/api/admin/reservations/{reservation.reservation_number}/confirm/', format='json')
+        self.assertEqual(client.get('/api/admin/reservations/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SyntheticDataTests(TestCase):
+    """合成データは同じシードなら --clear で同じ内容に作り直せ、残っている場合や実データがある場合は作成しないこと"""
+
+    OPTIONS = {
+        'seed': 7, 'anchor_date': '2026-01-15', 'customers': 20, 'messages': 40, 'years': 1, 'future_days': 7,
+        'stdout': StringIO(),
+    }
+
+    def _snapshot(self):
+        return (
+            sorted(Customer.objects.values_list('email', 'name')),
+            sorted(Reservation.objects.values_list('reservation_number', 'start_time', 'status')),
+            LineMessage.objects.count(),
+            AvailableTimeSlot.objects.count(),
+        )
+
+    def test_rerun_requires_clear_and_reproduces_data(self):
+        call_command('generate_synthetic_data', **self.OPTIONS)
+        first = self._snapshot()
+        with self.assertRaises(CommandError):
+            call_command('generate_synthetic_data', **self.OPTIONS)
+        self.assertEqual(self._snapshot(), first)
+        call_command('generate_synthetic_data', clear=True, **self.OPTIONS)
+        self.assertEqual(self._snapshot(), first)
+        self.assertEqual(Salon.objects.count(), 1)
+
+    def test_refuses_database_with_real_data(self):
+        make_reservation()
+        with self.assertRaises(CommandError):
+            call_command('generate_synthetic_data', **self.OPTIONS)
+        self.assertFalse(AvailableTimeSlot.objects.exists())
+        self.assertEqual(Customer.objects.count(), 1)
+
+
+@override_settings(CONDITIONAL_GET_ENABLED=True)
+class BookingBootstrapTests(TestCase):
+    """予約画面の初期表示APIは、日付が変わると以前のETagで304を返さないこと"""
+
+    def test_etag_changes_with_date(self):
+        client = APIClient()
+        make_reservation()
+        response = client.get('/api/booking/bootstrap/')
+        etag = response['ETag']
+        self.assertEqual(client.get('/api/booking/bootstrap/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        tomorrow = date.today() + timedelta(days=1)
+        with mock.patch('reservations.views.date', wraps=date) as fake_date:
+            fake_date.today.return_value = tomorrow
+            response = client.get('/api/booking/bootstrap/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['month'], tomorrow.strftime('%Y-%m'))
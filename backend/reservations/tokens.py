@@ -0,0 +1,46 @@
+# backend/reservations/tokens.py
+"""
+失効（リボケーション）に対応したJWTトークンクラス。
+
+token_blacklist アプリの代わりに reservations.revocation で jti を失効管理する。
+SIMPLE_JWT の AUTH_TOKEN_CLASSES に指定しているため、管理者用の JWTAuthentication と
+顧客用の CustomerJWTAuthentication の両方で失効済みトークンが拒否される。
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import revocation
+
+
+class RevocableTokenMixin:
+    def verify(self):
+        super().verify()
+        if revocation.is_revoked(self.payload.get(api_settings.JTI_CLAIM)):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        """このトークンを有効期限まで失効させる（simplejwtのBlacklistMixinと同じ名前）"""
+        revocation.revoke_jti(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+
+    def outstand(self):
+        """発行済みトークンの一覧はDBに持たない（失効済みの jti だけを管理する）"""
+        return None
+
+
+class RevocableAccessToken(RevocableTokenMixin, AccessToken):
+    pass
+
+
+class RevocableRefreshToken(RevocableTokenMixin, RefreshToken):
+    access_token_class = RevocableAccessToken
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    リフレッシュ時に失効済みのリフレッシュトークンを拒否し、
+    ROTATE_REFRESH_TOKENS / BLACKLIST_AFTER_ROTATION の設定どおり使用済みのトークンを失効させる。
+    """
+    token_class = RevocableRefreshToken
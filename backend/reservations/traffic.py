@@ -0,0 +1,216 @@
+# backend/reservations/traffic.py
+"""
+本番トラフィックの記録（キャプチャ）と再生（リプレイ）。
+
+- TrafficCaptureMiddleware が /api/ へのリクエストを1行1件のJSONLで記録する。
+  認証トークン・Cookieは記録せず、氏名・メールアドレス・電話番号・メッセージ本文などの
+  個人情報は、同じ値が同じ仮名になる（プロセスごとにランダムな鍵の）HMACで置き換える。
+- replay_traffic コマンドが記録を候補環境とベースライン環境へ同じ順序・同時実行数で送り、
+  エンドポイントごとのレイテンシ分布とクエリ数（Server-Timingヘッダーのdb項目）を比較する。
+  再生先ではすべてのリクエストにヘッダーが付くよう SERVER_TIMING_ENABLED=True にしておく。
+"""
+import hashlib
+import hmac
+import json
+import re
+import secrets
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+
+import requests
+
+# 記録しないパス（単発のコードや署名付きのWebhookなど、再生しても意味がないもの）
+EXCLUDED_PATH_PREFIXES = (
+    '/api/line/callback/',
+    '/api/line/webhook/',
+    '/api/admin/login-line/',
+    '/api/admin/line/link/',
+    '/api/admin/link-line/',
+    '/api/token/',
+    '/api/metrics/',
+    '/api/admin/profiles/',
+)
+
+# 値を仮名に置き換えるキー（リクエストボディ・クエリ文字列の両方）
+EMAIL_KEYS = {'email', 'customer_email'}
+PHONE_KEYS = {'phone', 'phone_number', 'customer_phone'}
+SECRET_KEYS = {'password', 'token', 'refresh', 'access', 'code', 'id_token', 'line_registration_token'}
+TEXT_KEYS = {
+    'name', 'full_name', 'furigana', 'customer_name', 'customer_furigana', 'notes',
+    'username', 'first_name', 'last_name', 'line_user_id',
+    'message', 'text', 'line_display_name', 'line_picture_url', 'image_url', 'search', 'q', 'query', 'address',
+}
+
+# 仮名化の鍵。プロセスごとに作り直すので、記録から元の値は復元できない
+_PSEUDONYM_KEY = secrets.token_bytes(32)
+_SERVER_TIMING_QUERIES = re.compile(r'(?:^|,)\s*db;[^,]*desc="(\d+) queries"')
+
+
+def _pseudonym(value):
+    return hmac.new(_PSEUDONYM_KEY, str(value).encode(), hashlib.sha256).hexdigest()[:12]
+
+
+def _sanitize_value(key, value):
+    if isinstance(value, dict):
+        return sanitize(value)
+    if isinstance(value, list):
+        return [_sanitize_value(key, item) for item in value]
+    if value in (None, ''):
+        return value
+    key = (key or '').lower()
+    if key in SECRET_KEYS:
+        return 'redacted'
+    if key in EMAIL_KEYS:
+        return f'redacted-{_pseudonym(value)}@example.com'
+    if key in PHONE_KEYS:
+        return '000' + str(int(_pseudonym(value), 16))[:8]
+    if key in TEXT_KEYS:
+        return f'redacted-{_pseudonym(value)}'
+    return value
+
+
+def sanitize(data):
+    """辞書の個人情報・秘密情報を仮名に置き換えたコピーを返す"""
+    return {key: _sanitize_value(key, value) for key, value in data.items()}
+
+
+def sanitize_query_string(query_string):
+    pairs = parse_qsl(query_string, keep_blank_values=True)
+    return urlencode([(key, _sanitize_value(key, value)) for key, value in pairs])
+
+
+def should_capture(path):
+    return path.startswith('/api/') and not path.startswith(EXCLUDED_PATH_PREFIXES)
+
+
+def auth_kind(request):
+    """再生時にどのトークンを使うか判断するための、認証主体の種類"""
+    from .models import Customer
+
+    user = getattr(request, 'user', None)
+    if isinstance(user, Customer):
+        return 'customer'
+    if user is not None and getattr(user, 'is_authenticated', False):
+        return 'admin' if getattr(user, 'is_staff', False) else 'user'
+    return 'anonymous'
+
+
+def capture_body(request):
+    """JSONボディのみ記録する（マルチパートの画像などは記録しない）"""
+    if request.method in ('GET', 'HEAD', 'OPTIONS', 'DELETE'):
+        return None, False
+    if request.content_type != 'application/json':
+        return None, True
+    try:
+        data = json.loads(request.body or b'null')
+    except ValueError:
+        return None, True
+    if isinstance(data, dict):
+        return sanitize(data), False
+    if isinstance(data, list):
+        return [sanitize(item) if isinstance(item, dict) else item for item in data], False
+    return data, False
+
+
+class TrafficLog:
+    """キャプチャしたリクエストをJSONLファイルに追記する（スレッドセーフ）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def read_traffic(path, limit=None):
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            records.append(json.loads(line))
+            if limit and len(records) >= limit:
+                break
+    return records
+
+
+# ==============================================================================
+# 再生
+# ==============================================================================
+
+def queries_from_server_timing(header):
+    """Server-Timingヘッダーの db;desc="N queries" からクエリ数を取り出す"""
+    match = _SERVER_TIMING_QUERIES.search(header or '')
+    return int(match.group(1)) if match else None
+
+
+class ReplayResult:
+    """1つの再生先について、エンドポイントごとの結果を集計する"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, latency_ms, status_code, queries):
+        with self._lock:
+            self.latencies[endpoint].append(latency_ms)
+            self.statuses[endpoint][status_code] += 1
+            if queries is not None:
+                self.queries[endpoint].append(queries)
+
+    def add_error(self, endpoint):
+        with self._lock:
+            self.errors[endpoint] += 1
+
+
+def replay(records, base_url, tokens, concurrency=4, timeout=30):
+    """
+    記録を base_url へ concurrency 並列で再生する。
+    tokens は認証主体の種類（'admin' / 'customer' など）→ アクセストークン。
+    """
+    result = ReplayResult()
+    local = threading.local()
+
+    def send(record):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        headers = {}
+        token = tokens.get(record.get('auth'))
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        url = base_url.rstrip('/') + record['path']
+        if record.get('query'):
+            url += '?' + record['query']
+        kwargs = {'headers': headers, 'timeout': timeout}
+        if record.get('body') is not None:
+            kwargs['json'] = record['body']
+        start = time.perf_counter()
+        try:
+            response = session.request(record['method'], url, **kwargs)
+        except requests.exceptions.RequestException:
+            result.add_error(record['endpoint'])
+            return
+        latency_ms = (time.perf_counter() - start) * 1000
+        result.add(
+            record['endpoint'], latency_ms, response.status_code,
+            queries_from_server_timing(response.headers.get('Server-Timing')),
+        )
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, records))
+    result.elapsed = time.perf_counter() - started
+    return result
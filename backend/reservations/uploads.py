@@ -0,0 +1,139 @@
+# backend/reservations/uploads.py
+"""
+管理画面から送信する画像の、署名付きURLによる直接アップロード。
+
+1. 管理画面が POST /api/admin/uploads/ で用途とContent-Typeを送り、オブジェクトキーと
+   短時間だけ有効なアップロード用URLを受け取る。
+2. 管理画面はそのURLへ画像を直接PUTする（アプリサーバーは画像のバイト列を中継しない）。
+3. メッセージ送信APIにオブジェクトキー（image_key）を渡すと、ストレージ上のメタデータ
+   （存在・サイズ・Content-Type）だけを確認して公開URLに変換する。
+
+保存先は UPLOAD_STORAGE で切り替える。'gcs' はGoogle Cloud StorageのV4署名付きURLを使い、
+'local' はGCSの代わりに MEDIA_ROOT に保存する開発・テスト用の実装（署名付きトークンでPUTを受け付ける）。
+"""
+import re
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+
+from .adapters import gcs
+
+# 用途ごとの保存先プレフィックス（従来のアップロード先と同じ）
+UPLOAD_PURPOSES = ('admin_sent', 'admin_bulk', 'staff_notification')
+# LINEの画像メッセージが対応している形式
+ALLOWED_CONTENT_TYPES = {'image/jpeg': '.jpg', 'image/png': '.png'}
+_CONTENT_TYPES_BY_EXTENSION = {ext: content_type for content_type, ext in ALLOWED_CONTENT_TYPES.items()}
+_KEY_PATTERN = re.compile(r'^(?P<purpose>[a-z_]+)/[0-9a-f]{32}(?P<ext>\.jpg|\.png)$')
+_LOCAL_SIGNING_SALT = 'reservations.uploads.local'
+
+
+class UploadError(ValueError):
+    """アップロードの発行・確認に失敗した（利用者に返すメッセージを持つ）"""
+
+
+def _max_bytes():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+
+
+def _expires_seconds():
+    return getattr(settings, 'UPLOAD_URL_EXPIRES_SECONDS', 300)
+
+
+class GCSUploadStorage:
+    """Google Cloud Storage（LINE_IMAGE_BUCKET）に直接アップロードさせる"""
+
+    def create_upload(self, request, key, content_type):
+        return gcs.signed_upload_url(key, content_type, _expires_seconds(), _max_bytes())
+
+    def stat(self, key):
+        return gcs.object_metadata(key)
+
+    def public_url(self, request, key):
+        return gcs.public_url(key)
+
+
+class LocalUploadStorage:
+    """MEDIA_ROOT/uploads に保存する開発・テスト用の代替"""
+
+    def __init__(self):
+        self.root = Path(settings.MEDIA_ROOT) / 'uploads'
+
+    def create_upload(self, request, key, content_type):
+        token = signing.dumps({'key': key, 'content_type': content_type}, salt=_LOCAL_SIGNING_SALT)
+        url = request.build_absolute_uri(reverse('admin-upload-local', args=[token]))
+        return url, {'Content-Type': content_type}
+
+    def receive(self, token, content_type, stream):
+        """署名付きトークンを検証し、PUTされた内容を保存する（GCSがPUTを受ける処理の代わり）"""
+        try:
+            claims = signing.loads(token, salt=_LOCAL_SIGNING_SALT, max_age=_expires_seconds())
+        except signing.BadSignature:
+            raise UploadError('アップロードURLが無効か、有効期限が切れています。')
+        if content_type != claims['content_type']:
+            raise UploadError('Content-Typeがアップロード時の指定と一致しません。')
+        path = self.root / claims['key']
+        path.parent.mkdir(parents=True, exist_ok=True)
+        written = 0
+        with open(path, 'wb') as f:
+            while chunk := stream.read(64 * 1024):
+                written += len(chunk)
+                if written > _max_bytes():
+                    break
+                f.write(chunk)
+        if written > _max_bytes():
+            path.unlink()
+            raise UploadError('ファイルサイズが上限を超えています。')
+
+    def stat(self, key):
+        path = self.root / key
+        if not path.is_file():
+            return None
+        return {'size': path.stat().st_size, 'content_type': _CONTENT_TYPES_BY_EXTENSION[path.suffix]}
+
+    def public_url(self, request, key):
+        return request.build_absolute_uri(f'{settings.MEDIA_URL}uploads/{key}')
+
+
+def get_storage():
+    backend = getattr(settings, 'UPLOAD_STORAGE', None) or ('gcs' if gcs.is_available() else 'local')
+    return GCSUploadStorage() if backend == 'gcs' else LocalUploadStorage()
+
+
+def issue_upload(request, purpose, content_type):
+    """アップロード先のオブジェクトキーと署名付きURLを発行する"""
+    if purpose not in UPLOAD_PURPOSES:
+        raise UploadError(f"purpose は {', '.join(UPLOAD_PURPOSES)} のいずれかを指定してください。")
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise UploadError('画像はJPEGまたはPNGを指定してください。')
+    key = f'{purpose}/{uuid.uuid4().hex}{ALLOWED_CONTENT_TYPES[content_type]}'
+    url, headers = get_storage().create_upload(request, key, content_type)
+    return {
+        'object_key': key,
+        'upload_url': url,
+        'method': 'PUT',
+        'headers': headers,
+        'expires_in': _expires_seconds(),
+        'max_bytes': _max_bytes(),
+    }
+
+
+def confirm_upload(request, key, purpose):
+    """
+    アップロード済みのオブジェクトキーを確認し、公開URLを返す。
+    発行した形式のキーか、用途が一致するか、実際にアップロードされているかをメタデータで確認する。
+    """
+    match = _KEY_PATTERN.match(key or '')
+    if not match or match.group('purpose') != purpose:
+        raise UploadError('画像のオブジェクトキーが不正です。')
+    storage = get_storage()
+    metadata = storage.stat(key)
+    if metadata is None:
+        raise UploadError('画像がアップロードされていません。')
+    if metadata['size'] > _max_bytes():
+        raise UploadError('ファイルサイズが上限を超えています。')
+    if metadata['content_type'] != _CONTENT_TYPES_BY_EXTENSION[match.group('ext')]:
+        raise UploadError('画像の形式がアップロード時の指定と一致しません。')
+    return storage.public_url(request, key)
@@ -16,6 +16,8 @@ router.register(r'admin/users', views.AdminUserManagementViewSet, basename='admi
 router.register(r'admin/staff', views.AdminUserViewSet, basename='admin-staff') # 別のパスで登録
 router.register(r'admin/reservations', views.AdminReservationViewSet, basename='admin-reservation')
 router.register(r'admin/customers', views.AdminCustomerViewSet, basename='admin-customer')
+router.register(r'admin/segments', views.AdminCustomerSegmentViewSet, basename='admin-segment')
+router.register(r'admin/profiles', views.RequestProfileViewSet, basename='admin-profile')
 """ print("--- DRF Router Registered URLs ---")
 for url in router.urls:
     print(url)
@@ -32,6 +34,7 @@ urlpatterns = [
     path('config/notifications/', views.NotificationSettingAPIView.as_view(), name='notification-setting'),
     path('availability/', views.AvailabilityCheckAPIView.as_view(), name='availability-check'),
     path('health-check/', views.HealthCheckAPIView.as_view(), name='health-check'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
     path('statistics/', views.StatisticsView.as_view(), name='statistics'),
     path('admin/time-slots/', views.TimeSlotAPIView.as_view(), name='admin-time-slots'),
     path('admin/available-slots/', views.AdminAvailableSlotView.as_view(), name='admin-available-slots'),
@@ -39,6 +42,7 @@ urlpatterns = [
     path('admin/detailed-time-slots/', views.AdminDetailedTimeSlotsView.as_view(), name='admin-detailed-time-slots'),
     path('admin/configured-dates/', views.ConfiguredDatesView.as_view(), name='admin-configured-dates'),
     path('bookable-dates/', views.BookableDatesView.as_view(), name='bookable-dates'),
+    path('booking/bootstrap/', views.BookingBootstrapView.as_view(), name='booking-bootstrap'),
     path('me/', views.me, name='me'),
     path('admin/me/', views.admin_me, name='admin-me'),
     path('line/callback/', views.LineLoginCallbackView.as_view(), name='line-callback'),
@@ -48,6 +52,8 @@ urlpatterns = [
     path('admin/login-line/', views.AdminLineLoginView.as_view(), name='admin-login-line'),
     path('admin/line-history/', views.LineMessageHistoryView.as_view(), name='admin-line-history'),
     path('admin/send-bulk-message/', views.send_bulk_message, name='admin-send-bulk-message'),
+    path('admin/uploads/', views.AdminUploadView.as_view(), name='admin-uploads'),
+    path('admin/uploads/local/<str:token>/', views.LocalUploadView.as_view(), name='admin-upload-local'),
     path('admin/send-staff-notification/', views.send_staff_notification, name='admin-send-staff-notification'),
     path('admin/staff-line-status/', views.get_staff_line_status, name='admin-staff-line-status'),
     path('confirm-reservation-and-notify/', views.confirm_reservation_and_notify, name='confirm-reservation-and-notify'),
@@ -16,88 +16,119 @@ from pathlib import Path
 # --- Django & DRF Core ---
 from django.conf import settings
 from reservations.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-from django.core.mail import send_mail
 from django.db import transaction
 from django.db.models import Q, Sum, Count, Max, OuterRef, Subquery
-from django.db.models.functions import TruncMonth, TruncDate
+from django.db.models.functions import TruncMonth
 from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status, viewsets, generics
 from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.decorators import action
 
-# --- Google Cloud & LINE SDK ---
-try:
-    from google.cloud import storage
-    from google.auth import default as google_auth_default
-    from google.auth.exceptions import GoogleAuthError
-    from google.oauth2 import service_account
-    from googleapiclient.discovery import build
-except ImportError:
-    # 開発環境ではGoogle Cloud関連のライブラリがないので無視
-    storage = None
-    google_auth_default = None
-
-try:
-    from linebot import LineBotApi
-    from linebot.models import TextSendMessage, ImageSendMessage
-except ImportError:
-    # 開発環境ではLINE Bot SDKがないので無視
-    LineBotApi = None
-    TextSendMessage = None
-    ImageSendMessage = None
-
 # --- Local App Imports ---
+# Google Cloud・LINE SDKは重いため、adapters経由で初回利用時にimportする
+from .adapters import gcs, google_calendar, line_bot
+from . import calendar_events
 from .authentication import CustomerJWTAuthentication
-from .line_utils import get_line_user_profile
+from .changelog import DEFAULT_LIMIT as CHANGES_DEFAULT_LIMIT, MAX_LIMIT as CHANGES_MAX_LIMIT, changes_since, parse_since
+from .chat_sync import sync_messages
+from .conditional import ADMIN_SCOPE_MODELS, ConditionalGetMixin, get_versions
+from .conditional import bump as bump_table_version
+from .fast_serializers import serialize_list
+from .instrumentation import render_metrics, track
+from .line_utils import LineIdTokenError, get_line_user_profile
 from .models import (
-    Salon, Service, Reservation, NotificationSetting, Customer, 
-    UserProfile, LineMessage, AvailableTimeSlot
+    Salon, Service, Reservation, NotificationSetting, Customer, CustomerSegment,
+    UserProfile, LineMessage, AvailableTimeSlot, RequestProfile, ReservationChange
+)
+from .notifications import (
+    send_line_push_message, send_admin_line_notification, send_admin_line_image, queue_staff_alert,
+    send_customer_line_notification, is_unreachable_line_error,
+    mark_customer_line_reachable, mark_customer_line_unreachable,
 )
-from .notifications import send_line_push_message, send_admin_line_notification, send_admin_line_image
+from .outbox import enqueue_email, enqueue_emails
+from .segments import count_preview, criteria_from_request, iter_recipients
+from .state_machine import (
+    FAILURE_FIELDS, TRANSITIONS, VERSION_CONFLICT_MESSAGE, TransitionError, apply_transition, describe_failure,
+    transition_reservation,
+)
+from .tokens import RevocableAccessToken, RevocableRefreshToken
+from .uploads import LocalUploadStorage, UploadError, confirm_upload, get_storage, issue_upload
 from .serializers import (
     SalonSerializer, ServiceSerializer, ReservationSerializer, NotificationSettingSerializer,
-    CustomerSerializer, UserSerializer, AdminUserSerializer, LineMessageSerializer,
-    ReservationCreateSerializer
+    CustomerSerializer, CustomerSegmentSerializer, UserSerializer, AdminUserSerializer, LineMessageSerializer,
+    ReservationCreateSerializer, ReservationChangeSerializer, RequestProfileSerializer, RequestProfileDetailSerializer,
+    SparseFieldsMixin, parse_sparse_fields,
 )
 
 # --- Global Initializations ---
 logger = logging.getLogger(__name__)
 
-# LINE Bot APIの初期化（開発環境では無効化）
-line_bot_api = None
-customer_ine_bot_api = None
-
-if LineBotApi:
+def push_to_customer(customer, message):
+    """
+    LINE Bot SDK経由で顧客にpushする。
+    ブロック・友だち解除を示すエラーが返った場合は顧客をLINE送信不可にしてから例外を再送出する。
+    """
     try:
-        line_bot_api = LineBotApi(settings.ADMIN_LINE_CHANNEL_ACCESS_TOKEN)
-        customer_ine_bot_api = LineBotApi(settings.CUSTOMER_LINE_CHANNEL_ACCESS_TOKEN)
-    except Exception:
-        # 設定値がない場合は無効化
-        pass
+        with track('http-api.line.me'):
+            line_bot.customer_api().push_message(customer.line_user_id, message)
+    except Exception as e:
+        if line_bot.is_api_error(e):
+            error_message = getattr(getattr(e, 'error', None), 'message', '')
+            if is_unreachable_line_error(e.status_code, error_message):
+                mark_customer_line_unreachable(customer.line_user_id)
+        raise
+
+class FastListMixin:
+    """
+    一覧（list）を fast_serializers のプランで返すミックスイン。
+    出力は serializer_class で返す場合と同じで、関連先もJOINした1回のクエリで取得する。
+    GETでは ?fields= / ?expand= で出力するフィールドと埋め込む関連を絞り込める（SparseFieldsMixin）。
+    """
+
+    def get_sparse_fields(self):
+        if self.request.method != 'GET' or not issubclass(self.get_serializer_class(), SparseFieldsMixin):
+            return {}
+        return parse_sparse_fields(self.request.query_params)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(self.get_sparse_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(serialize_list(queryset, self.get_serializer_class(), **self.get_sparse_fields()))
 
 # ==============================================================================
 # Public-Facing ViewSets (No Authentication Required)
 # ==============================================================================
 
-class SalonViewSet(viewsets.ModelViewSet):
+class SalonViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """サロン情報を取得するためのAPI"""
+    conditional_models = (Salon,)
     queryset = Salon.objects.all()
     serializer_class = SalonSerializer
     permission_classes = [AllowAny]
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """サービスメニューを取得するためのAPI"""
+    conditional_models = (Service,)
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
     permission_classes = [AllowAny]
@@ -107,8 +138,69 @@ class ServiceViewSet(viewsets.ModelViewSet):
 # ==============================================================================
 
 
-class ReservationViewSet(viewsets.ModelViewSet):
+def parse_expected_version(request):
+    """リクエストの version（読み込んだ時点のバージョン。省略可）を返す。戻り値は (バージョン, エラー時のResponse)"""
+    version = request.data.get('version')
+    try:
+        return (None if version in (None, '') else int(version)), None
+    except (TypeError, ValueError):
+        return None, Response({'error': 'version には整数を指定してください。'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def transition_by_number(queryset, request, reservation_number, action):
+    """
+    予約番号の予約を状態遷移させる（state_machine.py）。リクエストの version を指定すると、
+    読み込んだ時から他の操作で更新されていないことも確認する。戻り値は (遷移後の予約, エラー時のResponse)。
+    """
+    expected_version, error = parse_expected_version(request)
+    if error:
+        return None, error
+    try:
+        queryset = queryset.filter(reservation_number=reservation_number)
+    except DjangoValidationError:
+        return None, Response({'error': '予約が見つかりません。'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        return transition_reservation(queryset, action, expected_version), None
+    except TransitionError as e:
+        return None, Response(e.as_response_data(), status=e.status_code)
+
+
+class VersionCheckedUpdateMixin:
+    """
+    予約の更新（PUT / PATCH）で version を指定した場合、行をロックしてから現在のバージョンと比べ、
+    他の操作で更新されていれば409を返す。status は読み取り専用で、変更は状態遷移API（confirm / cancel / complete）で行う。
+    """
+
+    def update(self, request, *args, **kwargs):
+        expected_version, error = parse_expected_version(request)
+        if error:
+            return error
+        with transaction.atomic():
+            if expected_version is not None:
+                instance = self.get_object()
+                current = Reservation.objects.select_for_update().values('status', 'version').get(pk=instance.pk)
+                if current['version'] != expected_version:
+                    return Response({'error': VERSION_CONFLICT_MESSAGE, **current}, status=status.HTTP_409_CONFLICT)
+            return super().update(request, *args, **kwargs)
+
+
+def confirmation_email(reservation, customer):
+    """予約確定メールの (件名, 本文, 宛先)。サービス名は予約時点のもの"""
+    subject = "【JELLO】ご予約が確定いたしました"
+    message = (
+        f"{customer.name}様\n\n"
+        f"お申し込みいただいた内容でご予約が確定いたしました。\n"
+        f"ご来店を心よりお待ちしております。\n\n"
+        f"--- ご予約内容 ---\n"
+        f"日時: {reservation.start_time.strftime('%Y年%m月%d日 %H:%M')}\n"
+        f"サービス: {reservation.service_name}\n"
+    )
+    return subject, message, [customer.email]
+
+
+class ReservationViewSet(VersionCheckedUpdateMixin, ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     """顧客向けの予約APIビューセット"""
+    conditional_models = (Reservation, Customer, Service)
     authentication_classes = [CustomerJWTAuthentication]
     permission_classes = [IsAuthenticated]
     queryset = Reservation.objects.all()
@@ -158,7 +250,7 @@ class ReservationViewSet(viewsets.ModelViewSet):
                 f"日時: {reservation.start_time.strftime('%Y-%m-%d %H:%M')}\n"
                 f"サービス: {reservation.service.name}"
             )
-            send_admin_line_notification(admin_message)
+            queue_staff_alert(admin_message, alert_type='new_reservation')
         except Exception as e:
             logger.error(f"管理者へのLINE通知に失敗しました: {e}")
 
@@ -175,9 +267,9 @@ class ReservationViewSet(viewsets.ModelViewSet):
                     f"------------------"
                 )
                 from_email = os.environ.get("DEFAULT_FROM_EMAIL")
-                send_mail(subject, customer_message, from_email, [reservation.customer.email])
+                enqueue_email(subject, customer_message, [reservation.customer.email], from_email)
         except Exception as e:
-            logger.error(f"予約受付メールの送信に失敗しました: {e}")
+            logger.error(f"予約受付メールの送信キュー登録に失敗しました: {e}")
 
         response_serializer = ReservationSerializer(reservation)
         headers = self.get_success_headers(response_serializer.data)
@@ -186,34 +278,24 @@ class ReservationViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["post"])
     def cancel(self, request, reservation_number=None):
         """予約をキャンセル済みに更新する"""
-        reservation = self.get_object()
-        if reservation.status in ["completed", "cancelled"]:
-            return Response({"error": "この予約は完了またはキャンセル済みのため、変更できません。"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        reservation.status = "cancelled"
-        reservation.save()
-        return Response({"status": "reservation cancelled"})
+        reservation, error = transition_by_number(self.get_queryset(), request, reservation_number, 'cancel')
+        if error:
+            return error
+        return Response({"status": "reservation cancelled", "version": reservation.version})
     
     def add_event_to_google_calendar(self, reservation):
         """Googleカレンダーに予約イベントを追加するヘルパーメソッド"""
-        if not google_auth_default:
-            print("Google Cloud SDKが利用できません")
+        if not google_calendar.is_available():
+            logger.warning("Google Cloud SDKが利用できません")
             return
             
-        SCOPES = ['https://www.googleapis.com/auth/calendar']
         CALENDAR_ID = os.environ.get('GOOGLE_CALENDAR_ID')
 
         if not CALENDAR_ID:
-            print("エラー: 環境変数 GOOGLE_CALENDAR_ID が設定されていません。")
+            logger.error("環境変数 GOOGLE_CALENDAR_ID が設定されていません。")
             return
 
         try:
-            # ファイル名を直接指定するのではなく、環境変数から自動で認証情報を取得します。
-            # Render上では GOOGLE_APPLICATION_CREDENTIALS が参照されます。
-            credentials, project = google_auth_default(scopes=SCOPES)
-            
-            service = build('calendar', 'v3', credentials=credentials)
-            
             event = {
                 'summary': f"【予約】{reservation.customer.name}様",
                 'description': (
@@ -223,11 +305,11 @@ class ReservationViewSet(viewsets.ModelViewSet):
                 'start': {'dateTime': reservation.start_time.isoformat(), 'timeZone': 'Asia/Tokyo'},
                 'end': {'dateTime': reservation.end_time.isoformat(), 'timeZone': 'Asia/Tokyo'},
             }
-            service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
-            print(f"成功: Googleカレンダーにイベントを登録しました (予約番号: {reservation.reservation_number})")
+            google_calendar.insert_event(CALENDAR_ID, event)
+            logger.info(f"Googleカレンダーにイベントを登録しました (予約番号: {reservation.reservation_number})")
         
         except Exception as e:
-            print(f"エラー: Google認証またはAPI呼び出しに失敗しました。詳細: {e}")
+            logger.error(f"Google認証またはAPI呼び出しに失敗しました。詳細: {e}")
     
 class NotificationSettingAPIView(APIView):
     """
@@ -306,11 +388,11 @@ class StatisticsView(APIView):
 
     def get(self, request, *args, **kwargs):
         # --- 月別売上の集計 ---
-        # ステータスが 'confirmed' の予約のみを対象
-        sales_data = Reservation.objects.filter(status='confirmed') \
+        # 確定済み・完了済みの予約のみを対象。料金は予約時点の金額（Reservation.price）を使い、サービスはJOINしない
+        sales_data = Reservation.objects.filter(status__in=('confirmed', 'completed')) \
             .annotate(month=TruncMonth('start_time')) \
             .values('month') \
-            .annotate(total_sales=Sum('service__price')) \
+            .annotate(total_sales=Sum('price')) \
             .values('month', 'total_sales') \
             .order_by('month')
 
@@ -321,13 +403,13 @@ class StatisticsView(APIView):
         }
 
         # --- 人気サービスの集計 ---
-        service_ranking_data = Reservation.objects.filter(status='confirmed') \
-            .values('service__name') \
+        service_ranking_data = Reservation.objects.filter(status__in=('confirmed', 'completed')) \
+            .values('service_name') \
             .annotate(count=Count('id')) \
-            .order_by('-count')[:5] # 上位5件
+            .order_by('-count')[:5] # 上位5件（予約時点のサービス名で集計）
 
         service_ranking = {
-            "labels": [item['service__name'] for item in service_ranking_data],
+            "labels": [item['service_name'] for item in service_ranking_data],
             "data": [item['count'] for item in service_ranking_data]
         }
 
@@ -426,6 +508,8 @@ class AdminAvailableSlotView(APIView):
             for t in times
         ]
         AvailableTimeSlot.objects.bulk_create(slots_to_create)
+        # bulk_createではシグナルが飛ばないため、条件付きGET用のバージョンをここで進める
+        bump_table_version(AvailableTimeSlot)
 
         return Response({'status': 'success'}, status=status.HTTP_201_CREATED)
 
@@ -550,11 +634,7 @@ class ConfiguredDatesView(APIView):
         configured_dates = AvailableTimeSlot.objects.filter(
             date__year=year,
             date__month=month
-        ).annotate(
-            date_only=TruncDate('date')
-        ).values_list(
-            'date_only', flat=True
-        ).distinct()
+        ).order_by('date').values_list('date', flat=True).distinct()
 
         # フロントエンドで扱いやすいように日付を文字列に変換
         date_strings = [d.strftime('%Y-%m-%d') for d in configured_dates]
@@ -580,18 +660,113 @@ class BookableDatesView(APIView):
         bookable_dates = AvailableTimeSlot.objects.filter(
             date__year=year,
             date__month=month
-        ).annotate(
-            date_only=TruncDate('date')
-        ).values_list(
-            'date_only', flat=True
-        ).distinct()
+        ).order_by('date').values_list('date', flat=True).distinct()
 
         # 日付オブジェクトを 'YYYY-MM-DD' 形式の文字列に変換
         date_strings = [d.strftime('%Y-%m-%d') for d in bookable_dates]
 
         return Response(date_strings)
     
-class MyReservationsView(APIView):
+class BookingBootstrapView(ConditionalGetMixin, APIView):
+    """
+    予約画面の初期表示に必要な情報（サロン・メニュー、顧客情報、指定月の予約可能日と空き枠、今後の予約）を
+    1回のリクエストで返すAPI。?month=YYYY-MM（省略時は今月）。
+
+    顧客によらない部分（カタログと月ごとの空き枠）は、テーブルのバージョンをキーにキャッシュする。
+    クエリ数は、キャッシュがなくても件数によらず一定で、ログイン中の顧客なら5（カタログ2・空き枠2・今後の予約1）、
+    未ログインなら今後の予約がないため4。
+    month を省略した場合の月と「今後の予約」は今日の日付で変わるため、ETagには日付も含める。
+    """
+    authentication_classes = [CustomerJWTAuthentication]
+    permission_classes = [AllowAny]
+    conditional_models = (Salon, Service, AvailableTimeSlot, Reservation, Customer)
+    CACHE_TIMEOUT = 60 * 60
+
+    @staticmethod
+    def resolve_month(request):
+        """?month=YYYY-MM の月初日（省略時は今月）。不正な値は ValueError"""
+        month_param = request.query_params.get('month')
+        if month_param:
+            return datetime.strptime(month_param, '%Y-%m').date()
+        return date.today().replace(day=1)
+
+    def get_etag_context(self, request):
+        try:
+            month_start = self.resolve_month(request)
+        except ValueError:
+            return ''
+        return f'{month_start:%Y-%m}|{date.today().isoformat()}'
+
+    def get(self, request, *args, **kwargs):
+        try:
+            month_start = self.resolve_month(request)
+        except ValueError:
+            return Response({'error': 'month は YYYY-MM 形式で指定してください。'}, status=status.HTTP_400_BAD_REQUEST)
+
+        customer = request.user if isinstance(request.user, Customer) else None
+        upcoming = []
+        if customer is not None:
+            upcoming = serialize_list(
+                Reservation.objects.filter(customer=customer, start_time__gte=timezone.now())
+                .exclude(status='cancelled').order_by('start_time'),
+                ReservationSerializer,
+            )
+        catalog = self.get_catalog()
+        return Response({
+            'salons': catalog['salons'],
+            'services': catalog['services'],
+            'customer': CustomerSerializer(customer).data if customer is not None else None,
+            'month': month_start.strftime('%Y-%m'),
+            'bookable_dates': self.get_month_availability(month_start),
+            'upcoming_reservations': upcoming,
+        })
+
+    def get_catalog(self):
+        key = 'booking_bootstrap:catalog:' + ','.join(map(str, get_versions((Salon, Service))))
+        catalog = cache.get(key)
+        if catalog is None:
+            catalog = {
+                'salons': list(serialize_list(Salon.objects.order_by('id'), SalonSerializer)),
+                'services': list(serialize_list(Service.objects.order_by('id'), ServiceSerializer)),
+            }
+            cache.set(key, catalog, self.CACHE_TIMEOUT)
+        return catalog
+
+    def get_month_availability(self, month_start):
+        """
+        指定月の予約可能日ごとの空き枠。空きの判定は AvailabilityCheckAPIView と同じ
+        （その日時に開始する予約がない受付時間を空きとする）。
+        """
+        key = f'booking_bootstrap:availability:{month_start:%Y-%m}:' + ','.join(
+            map(str, get_versions((AvailableTimeSlot, Reservation)))
+        )
+        availability = cache.get(key)
+        if availability is not None:
+            return availability
+
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        booked = set(
+            Reservation.objects.filter(start_time__gte=month_start, start_time__lt=next_month)
+            .values_list('start_time', flat=True)
+        )
+        free_times = {}
+        for slot_date, slot_time in (
+            AvailableTimeSlot.objects.filter(date__gte=month_start, date__lt=next_month)
+            .order_by('date', 'time').values_list('date', 'time')
+        ):
+            times = free_times.setdefault(slot_date, [])
+            if datetime.combine(slot_date, slot_time) not in booked:
+                times.append(slot_time.strftime('%H:%M'))
+        availability = [
+            {'date': slot_date.strftime('%Y-%m-%d'), 'free_slots': len(times), 'available_times': times}
+            for slot_date, times in free_times.items()
+        ]
+        cache.set(key, availability, self.CACHE_TIMEOUT)
+        return availability
+
+
+class MyReservationsView(ConditionalGetMixin, APIView):
+    conditional_models = (Reservation, Customer, Service)
     # このViewに適用する認証クラスを指定
     authentication_classes = [CustomerJWTAuthentication]
     # 認証済み（この場合はCustomer）でなければアクセス不可
@@ -603,8 +778,7 @@ class MyReservationsView(APIView):
         
         # 顧客に紐づく予約情報を取得して返す
         reservations = Reservation.objects.filter(customer=customer)
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data)
+        return Response(serialize_list(reservations, ReservationSerializer, **parse_sparse_fields(request.query_params)))
 
 class LineLoginCallbackView(APIView):
     """顧客のLINEログインコールバックを処理する"""
@@ -628,17 +802,23 @@ class LineLoginCallbackView(APIView):
             
             line_profile = get_line_user_profile(code, flow_type='customer')
             line_user_id = line_profile.get('sub')
-            
-            customer, created = Customer.objects.update_or_create(
-                line_user_id=line_user_id,
-                defaults={
-                    'line_display_name': line_profile.get('name'),
-                    'line_picture_url': line_profile.get('picture'),
-                }
-            )
-            if created:
-                customer.name = Customer._meta.get_field('name').get_default()
-                customer.save()
+            profile_fields = {
+                'line_display_name': line_profile.get('name') or '',
+                'line_picture_url': line_profile.get('picture') or '',
+            }
+
+            # プロフィールが前回ログイン時から変わっていなければ書き込まない
+            customer = Customer.objects.filter(line_user_id=line_user_id).only(
+                'id', 'line_user_id', *profile_fields
+            ).first()
+            if customer is None:
+                customer, _ = Customer.objects.get_or_create(line_user_id=line_user_id, defaults=profile_fields)
+            else:
+                changed = [field for field, value in profile_fields.items() if getattr(customer, field) != value]
+                if changed:
+                    for field in changed:
+                        setattr(customer, field, profile_fields[field])
+                    customer.save(update_fields=[*changed, 'updated_at'])
             
             refresh = RefreshToken()
             refresh['line_user_id'] = customer.line_user_id
@@ -648,6 +828,11 @@ class LineLoginCallbackView(APIView):
                 'access': str(refresh.access_token),
             }, status=status.HTTP_200_OK)
             
+        except LineIdTokenError as e:
+            logger.warning(f"LINE IDトークンの検証に失敗しました: {e}")
+            return Response({
+                'error': 'LINE authentication failed. Please try again.'
+            }, status=status.HTTP_401_UNAUTHORIZED)
         except requests.exceptions.HTTPError as e:
             logger.error(f"LINE API HTTPエラー: {e.response.status_code if e.response else 'Unknown'} - {e}")
             if e.response:
@@ -692,14 +877,14 @@ def confirm_reservation_and_notify(request):
         latest_reservation = Reservation.objects.filter(customer=customer).order_by('-start_time').first()
     if latest_reservation:
         message = f"【ご予約内容の確認】\n\nお客様のお名前: {customer.name}様\nご予約日時: {latest_reservation.start_time.strftime('%Y年%m月%d日 %H:%M')}\nメニュー: {latest_reservation.service.name}\n\nご来店を心よりお待ちしております。"
-        success, result_message = send_line_push_message(customer.line_user_id, message)
+        success, result_message = send_customer_line_notification(customer, message)
         if success:
             return Response({"message": "予約情報をLINEに送信しました。"}, status=status.HTTP_200_OK)
         else:
             return Response({"error": f"LINEの送信に失敗しました: {result_message}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     else:
         message = "お客様の有効なご予約は見つかりませんでした。"
-        send_line_push_message(customer.line_user_id, message)
+        send_customer_line_notification(customer, message)
         return Response({"message": "予約が見つからなかったため、その旨をLINEで通知しました。"}, status=status.HTTP_404_NOT_FOUND)
     
 class AdminUserManagementViewSet(viewsets.ModelViewSet):
@@ -959,14 +1144,39 @@ class LineWebhookView(APIView):
             events = json.loads(body).get('events', [])
             
             for event in events:
-                if event.get('type') == 'message':
+                event_type = event.get('type')
+                if event_type == 'message':
                     self.handle_message_event(event)
+                elif event_type == 'follow':
+                    self.handle_follow_event(event)
+                elif event_type == 'unfollow':
+                    self.handle_unfollow_event(event)
 
         except Exception as e:
             logger.error(f"Webhook処理中にエラー: {e}", exc_info=True)
             return HttpResponseBadRequest()
         return HttpResponse(status=200)
 
+    def handle_follow_event(self, event):
+        """友だち追加・ブロック解除イベント: 顧客をLINE送信可能にする"""
+        line_user_id = event.get('source', {}).get('userId')
+        if not line_user_id:
+            return
+        customer, created = Customer.objects.get_or_create(
+            line_user_id=line_user_id,
+            defaults={'name': '新規のお客様'}
+        )
+        if created:
+            logger.info(f"新規顧客を作成しました: {line_user_id}")
+        elif not customer.line_reachable:
+            mark_customer_line_reachable(line_user_id)
+
+    def handle_unfollow_event(self, event):
+        """ブロック・友だち解除イベント: 顧客をLINE送信不可にする"""
+        line_user_id = event.get('source', {}).get('userId')
+        if line_user_id:
+            mark_customer_line_unreachable(line_user_id)
+
     def handle_message_event(self, event):
         """メッセージイベントを種類別に処理する"""
         source = event.get('source', {})
@@ -997,7 +1207,7 @@ class LineWebhookView(APIView):
                 f"{detail_url}\n\n"
                 f"{text}"
             )
-            send_admin_line_notification(admin_notification)
+            queue_staff_alert(admin_notification, alert_type='customer_message')
 
         elif message_type == 'image':
             message_id = message.get('id')
@@ -1006,41 +1216,39 @@ class LineWebhookView(APIView):
     def handle_image_message(self, customer, message_id):
         """画像メッセージをGCSに保存し、管理者に転送する"""
         try:
-            if not line_bot_api or not storage:
+            if not line_bot.is_available() or not gcs.is_available():
                 logger.warning("LINE Bot API または Google Cloud Storage が利用できません")
                 return
                 
             # LINEサーバーから画像コンテンツを取得
-            message_content = line_bot_api.get_message_content(message_id)
+            with track('http-api-data.line.me'):
+                message_content = line_bot.admin_api().get_message_content(message_id)
             
             # GCSにアップロード
-            storage_client = storage.Client()
-            bucket = storage_client.bucket('JELLO-line-images') # ★ご自身のGCSバケット名
-            file_name = f'customer_sent/{uuid.uuid4()}.jpg'
-            blob = bucket.blob(file_name)
-            
-            # ストリームから直接アップロード
-            blob.upload_from_string(message_content.content, content_type='image/jpeg')
-            image_url = blob.public_url
+            image_url = gcs.upload_bytes(
+                f'customer_sent/{uuid.uuid4()}.jpg', message_content.content, content_type='image/jpeg'
+            )
 
             # DBに保存
             LineMessage.objects.create(customer=customer, image_url=image_url, sender_type='customer')
             
             # 管理者に通知
             admin_text = f"【お客様からの画像】\n送信者: {customer.name}"
-            send_admin_line_notification(admin_text)
-            send_admin_line_image(image_url)
+            queue_staff_alert(admin_text, alert_type='customer_image', image_url=image_url)
 
         except Exception as e:
             logger.error(f"画像メッセージの処理に失敗: {e}", exc_info=True)
 
-class AdminReservationViewSet(viewsets.ModelViewSet):
+class AdminReservationViewSet(VersionCheckedUpdateMixin, ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     """管理者用の予約管理API"""
+    conditional_models = (Reservation, Customer, Service) + ADMIN_SCOPE_MODELS
     serializer_class = ReservationSerializer
     queryset = Reservation.objects.all().order_by('-start_time')
     lookup_field = 'reservation_number'
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
+    # 一括操作（bulk）で一度に指定できる予約の件数
+    BULK_ACTION_LIMIT = 500
 
     def get_queryset(self):
         """スーパーユーザー以外は自分に紐づく顧客の予約のみ返す"""
@@ -1068,78 +1276,159 @@ class AdminReservationViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(status__in=status_list)
         return queryset
 
+    @action(detail=False, methods=['get'], url_path='changes')
+    def changes(self, request):
+        """
+        予約の変更ログを ?since=<最後に読んだseq> より後から古い順に返す（?limit= で件数を指定）。
+        返された next_since を次回の since に渡せば、予約を読み直さずに変更だけを追える。
+        """
+        try:
+            since = parse_since(request.query_params.get('since'))
+            limit = int(request.query_params.get('limit', CHANGES_DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'error': 'since と limit には0以上の整数を指定してください。'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), CHANGES_MAX_LIMIT)
+
+        queryset = ReservationChange.objects.all()
+        user = request.user
+        if not user.is_superuser:
+            # 一覧と同じく、自分に紐づく顧客の予約の変更のみ
+            line_user_id = getattr(getattr(user, 'profile', None), 'line_user_id', None)
+            if line_user_id:
+                queryset = queryset.filter(reservation__customer__line_user_id=line_user_id)
+            else:
+                queryset = queryset.none()
+
+        changes, next_since, has_more = changes_since(since, limit, queryset)
+        return Response({
+            'results': ReservationChangeSerializer(changes, many=True).data,
+            'next_since': next_since,
+            'has_more': has_more,
+        })
+
     @action(detail=True, methods=['post'], url_path='confirm')
     def confirm(self, request, reservation_number=None):
         """予約を「確定済み」に更新し、通知を送信する"""
-        reservation = self.get_object()
-        if reservation.status != 'pending':
-            return Response({'error': 'この予約は保留中でないため、確定できません。'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        reservation.status = 'confirmed'
-        reservation.save()
+        reservation, error = transition_by_number(self.get_queryset(), request, reservation_number, 'confirm')
+        if error:
+            return error
 
         # --- 通知処理 ---
         try:
             if reservation.customer and reservation.customer.email:
-                subject = "【JELLO】ご予約が確定いたしました"
-                message = (
-                    f"{reservation.customer.name}様\n\n"
-                    f"お申し込みいただいた内容でご予約が確定いたしました。\n"
-                    f"ご来店を心よりお待ちしております。\n\n"
-                    f"--- ご予約内容 ---\n"
-                    f"日時: {reservation.start_time.strftime('%Y年%m月%d日 %H:%M')}\n"
-                    f"サービス: {reservation.service.name}\n"
-                )
                 from_email = os.environ.get("DEFAULT_FROM_EMAIL")
-                send_mail(subject, message, from_email, [reservation.customer.email])
+                enqueue_emails([confirmation_email(reservation, reservation.customer)], from_email)
         except Exception as e:
-            logger.error(f"予約確定メールの送信に失敗しました: {e}")
+            logger.error(f"予約確定メールの送信キュー登録に失敗しました: {e}")
 
         try:
             self.add_event_to_google_calendar(reservation)
         except Exception as e:
             logger.error(f"Googleカレンダーへの登録に失敗しました: {e}")
         
-        return Response({'status': 'reservation confirmed'})
+        return Response({'status': 'reservation confirmed', 'version': reservation.version})
 
     @action(detail=True, methods=['post'], url_path='cancel')
     def cancel(self, request, reservation_number=None):
         """予約をキャンセル済みに更新する"""
-        reservation = self.get_object()
-        if reservation.status in ['completed', 'cancelled']:
-            return Response({'error': 'この予約は完了またはキャンセル済みのため、変更できません。'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        reservation.status = 'cancelled'
-        reservation.save()
+        reservation, error = transition_by_number(self.get_queryset(), request, reservation_number, 'cancel')
+        if error:
+            return error
         # TODO: Google Calendar event deletion
-        return Response({'status': 'reservation cancelled'})
+        return Response({'status': 'reservation cancelled', 'version': reservation.version})
+
+    @action(detail=True, methods=['post'], url_path='complete')
+    def complete(self, request, reservation_number=None):
+        """来店が済んだ確定済みの予約を「完了済み」に更新する"""
+        reservation, error = transition_by_number(self.get_queryset(), request, reservation_number, 'complete')
+        if error:
+            return error
+        return Response({'status': 'reservation completed', 'version': reservation.version})
 
     def add_event_to_google_calendar(self, reservation):
         """Googleカレンダーに予約イベントを追加する"""
-        if not google_auth_default:
-            logger.warning("Google Cloud SDKが利用できません。")
-            return
-            
-        CALENDAR_ID = os.environ.get('GOOGLE_CALENDAR_ID')
-        if not CALENDAR_ID:
-            logger.warning("環境変数 GOOGLE_CALENDAR_ID が設定されていません。")
+        calendar_id = calendar_events.get_calendar_id()
+        if not calendar_id:
             return
 
         try:
-            credentials, _ = google_auth_default(scopes=['https://www.googleapis.com/auth/calendar'])
-            service = build('calendar', 'v3', credentials=credentials)
-            
-            event = {
-                'summary': f"【予約】{reservation.customer.name}様 ({reservation.service.name})",
-                'description': f"予約番号: {reservation.reservation_number}\n連絡先: {reservation.customer.email or 'N/A'}",
-                'start': {'dateTime': reservation.start_time.isoformat(), 'timeZone': 'Asia/Tokyo'},
-                'end': {'dateTime': reservation.end_time.isoformat(), 'timeZone': 'Asia/Tokyo'},
-            }
-            service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
+            google_calendar.insert_event(calendar_id, calendar_events.build_event(reservation, reservation.customer))
             logger.info(f"Googleカレンダーにイベントを登録しました (予約番号: {reservation.reservation_number})")
         except Exception as e:
             logger.error(f"Google認証またはAPI呼び出しに失敗しました。詳細: {e}", exc_info=True)
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        複数の予約をまとめて確定・キャンセル・完了にする。
+        {"action": "confirm" | "cancel" | "complete", "reservation_numbers": [...]} を受け取り、
+        1つのトランザクションの中で条件付きUPDATE 1回で遷移させて、予約ごとの結果を返す。
+        確定した予約の確認メールは1回でキューに積み、Googleカレンダーへの登録はコミット後に1つのタスクで行う。
+        """
+        action_name = request.data.get('action')
+        numbers = request.data.get('reservation_numbers')
+        if action_name not in TRANSITIONS:
+            return Response({'error': f"action は {', '.join(TRANSITIONS)} のいずれかを指定してください。"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(numbers, list) or not numbers:
+            return Response({'error': 'reservation_numbers に予約番号の配列を指定してください。'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(numbers) > self.BULK_ACTION_LIMIT:
+            return Response({'error': f'一度に操作できる予約は{self.BULK_ACTION_LIMIT}件までです。'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 重複を除き、指定された順に並べる（予約番号として不正な値は「見つからない」として返す）
+        parsed = {}
+        for raw in numbers:
+            try:
+                parsed.setdefault(str(raw), uuid.UUID(str(raw)))
+            except ValueError:
+                parsed.setdefault(str(raw), None)
+        valid_numbers = {number for number in parsed.values() if number is not None}
+
+        with transaction.atomic():
+            scope = self.get_queryset().filter(reservation_number__in=valid_numbers)
+            transitioned = {r.reservation_number: r for r in apply_transition(scope, action_name)} if valid_numbers else {}
+            remaining = valid_numbers - transitioned.keys()
+            current = {}
+            if remaining:
+                for row in scope.filter(reservation_number__in=remaining).values('reservation_number', *FAILURE_FIELDS):
+                    current[row.pop('reservation_number')] = row
+            if action_name == 'confirm' and transitioned:
+                self.notify_confirmed(list(transitioned.values()))
+
+        results = []
+        for raw, number in parsed.items():
+            reservation = transitioned.get(number)
+            if reservation is not None:
+                results.append({
+                    'reservation_number': raw, 'result': 'ok',
+                    'status': reservation.status, 'version': reservation.version,
+                })
+                continue
+            error = describe_failure(current.get(number), action_name)
+            results.append({
+                'reservation_number': raw, 'result': 'not_found' if error.status_code == 404 else 'conflict',
+                'error': error.message, **error.current,
+            })
+        return Response({
+            'action': action_name,
+            'succeeded': len(transitioned),
+            'failed': len(results) - len(transitioned),
+            'results': results,
+        })
+
+    def notify_confirmed(self, reservations):
+        """
+        一括確定した予約の確認メールをまとめてキューに積み、カレンダー登録をコミット後のタスクに回す。
+        メールは確定と同じトランザクションで積むため、積めなければ例外をそのまま送出して一括確定ごとロールバックする
+        （握りつぶすと壊れたトランザクションのまま後続のクエリが失敗する）。
+        """
+        customers = Customer.objects.only('id', 'name', 'email').in_bulk({r.customer_id for r in reservations if r.customer_id})
+        enqueue_emails([
+            confirmation_email(reservation, customers[reservation.customer_id])
+            for reservation in reservations
+            if reservation.customer_id in customers and customers[reservation.customer_id].email
+        ], os.environ.get("DEFAULT_FROM_EMAIL"))
+        calendar_events.enqueue_add_events([reservation.pk for reservation in reservations if reservation.customer_id])
+
     @action(detail=False, methods=['post'], url_path='create-with-new-customer')
     def create_with_new_customer(self, request):
         """新規顧客＋予約を同時に作成（管理画面の「新規作成」ボタン用）"""
@@ -1198,9 +1487,9 @@ class AdminReservationViewSet(viewsets.ModelViewSet):
                 try:
                     base_url = os.environ.get('FRONTEND_URL', 'https://your-frontend-url')
                     link_url = f"{base_url}/link-customer/{customer.id}"
-                    from .notifications import send_admin_line_notification
-                    send_admin_line_notification(
-                        f"新規顧客予約が確定済みで作成されました。\n顧客: {customer.name}\n予約: {reservation.reservation_number}\nステータス: 確定済み\nLINE連携: {link_url}"
+                    queue_staff_alert(
+                        f"新規顧客予約が確定済みで作成されました。\n顧客: {customer.name}\n予約: {reservation.reservation_number}\nステータス: 確定済み\nLINE連携: {link_url}",
+                        alert_type='new_reservation'
                     )
                 except Exception as e:
                     logger.warning(f"管理者LINE通知の送信に失敗しました: {e}")
@@ -1255,9 +1544,9 @@ class AdminReservationViewSet(viewsets.ModelViewSet):
 
                 # 管理LINE通知
                 try:
-                    from .notifications import send_admin_line_notification
-                    send_admin_line_notification(
-                        f"予約が確定済みで作成されました。\n顧客: {customer.name}\n予約: {reservation.reservation_number}\nサービス: {service.name}\nステータス: 確定済み"
+                    queue_staff_alert(
+                        f"予約が確定済みで作成されました。\n顧客: {customer.name}\n予約: {reservation.reservation_number}\nサービス: {service.name}\nステータス: 確定済み",
+                        alert_type='new_reservation'
                     )
                 except Exception as e:
                     logger.warning(f"管理者LINE通知の送信に失敗しました: {e}")
@@ -1293,7 +1582,7 @@ class AdminReservationViewSet(viewsets.ModelViewSet):
 
 logger = logging.getLogger(__name__)
 
-class AdminCustomerViewSet(viewsets.ModelViewSet):
+class AdminCustomerViewSet(ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     """管理者用の顧客管理API"""
     queryset = Customer.objects.all().order_by('-created_at')
     serializer_class = CustomerSerializer
@@ -1301,6 +1590,13 @@ class AdminCustomerViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsAdminUser]
     parser_classes = [MultiPartParser, JSONParser]
 
+    def get_conditional_models(self):
+        if self.action == 'reservations':
+            return (Customer, Reservation, Service) + ADMIN_SCOPE_MODELS
+        if self.action in ('history', 'messages'):
+            return (Customer, LineMessage) + ADMIN_SCOPE_MODELS
+        return (Customer,) + ADMIN_SCOPE_MODELS
+
     def get_queryset(self):
         """スーパーユーザー以外は自分に紐づく顧客のみ返す"""
         queryset = super().get_queryset()
@@ -1323,6 +1619,40 @@ class AdminCustomerViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(email__icontains=email)
         if phone:
             queryset = queryset.filter(phone_number__icontains=phone)
+        return self.filter_by_stats(queryset)
+
+    # 来店集計による絞り込み（クエリパラメータ → 検索条件）。いずれもインデックスのある列
+    STATS_FILTERS = {
+        'min_visits': 'visit_count__gte',
+        'max_visits': 'visit_count__lte',
+        'last_visit_before': 'last_visit_at__lt',
+        'last_visit_after': 'last_visit_at__gte',
+        'next_booking_before': 'next_booking_at__lt',
+        'next_booking_after': 'next_booking_at__gte',
+        'min_spend': 'total_spend__gte',
+        'max_spend': 'total_spend__lte',
+    }
+    STATS_ORDERING = ('visit_count', 'last_visit_at', 'next_booking_at', 'total_spend', 'created_at', 'name')
+
+    def filter_by_stats(self, queryset):
+        """?min_visits= などの来店集計の条件と ?ordering=-total_spend などの並べ替えを適用する"""
+        params = self.request.query_params
+        try:
+            for param, lookup in self.STATS_FILTERS.items():
+                value = params.get(param)
+                if value:
+                    queryset = queryset.filter(**{lookup: value})
+        except (ValueError, DjangoValidationError):
+            raise ValidationError({param: '値の形式が正しくありません。'})
+        has_next_booking = params.get('has_next_booking')
+        if has_next_booking in ('true', 'false'):
+            queryset = queryset.filter(next_booking_at__isnull=has_next_booking == 'false')
+
+        ordering = params.get('ordering')
+        if ordering:
+            if ordering.lstrip('-') not in self.STATS_ORDERING:
+                raise ValidationError({'ordering': f"{', '.join(self.STATS_ORDERING)} のいずれか（降順は先頭に-）を指定してください。"})
+            queryset = queryset.order_by(ordering, '-pk' if ordering.startswith('-') else 'pk')
         return queryset
 
     @action(detail=True, methods=['get'])
@@ -1330,16 +1660,23 @@ class AdminCustomerViewSet(viewsets.ModelViewSet):
         """特定の顧客の予約履歴を返す"""
         customer = self.get_object()
         reservations = Reservation.objects.filter(customer=customer).order_by('-start_time')
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data)
+        return Response(serialize_list(reservations, ReservationSerializer, **parse_sparse_fields(request.query_params)))
     
     @action(detail=True, methods=['get'])
     def history(self, request, pk=None):
         """特定の顧客のLINEメッセージ履歴を返す"""
         customer = self.get_object()
         messages = LineMessage.objects.filter(customer=customer).order_by('sent_at')
-        serializer = LineMessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        return Response(serialize_list(messages, LineMessageSerializer, **parse_sparse_fields(request.query_params)))
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        特定の顧客のLINEメッセージ履歴を差分同期する（詳細は chat_sync.py）。
+        ?before=<カーソル> で過去へスクロール、?since=<sync_cursor> で新着だけを取得する。
+        """
+        customer = self.get_object()
+        return Response(sync_messages(customer, request.query_params, **parse_sparse_fields(request.query_params)))
     
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
@@ -1349,42 +1686,40 @@ class AdminCustomerViewSet(viewsets.ModelViewSet):
         """特定の顧客にLINEでメッセージや画像を送信する"""
         customer = self.get_object()
         text = request.data.get('text')
-        image_file = request.FILES.get('image')
+        image_key = request.data.get('image_key')
 
-        if not text and not image_file:
+        if 'image' in request.FILES:
+            return Response({'error': MULTIPART_IMAGE_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+        if not text and not image_key:
             return Response({'error': '送信するテキストまたは画像を指定してください。'}, status=status.HTTP_400_BAD_REQUEST)
+        if customer.line_user_id and not customer.line_reachable:
+            return Response({'error': 'この顧客はLINEをブロックまたは友だち解除しているため送信できません。'}, status=status.HTTP_409_CONFLICT)
+        image_url = None
+        if image_key:
+            # テキストを送る前に画像を確認し、画像だけが失敗して中途半端に送信されるのを防ぐ
+            try:
+                image_url = confirm_upload(request, image_key, 'admin_sent')
+            except UploadError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             if text:
-                if customer_ine_bot_api and TextSendMessage:
-                    customer_ine_bot_api.push_message(customer.line_user_id, TextSendMessage(text=text))
+                if line_bot.is_available():
+                    push_to_customer(customer, line_bot.text_message(text))
                 LineMessage.objects.create(
                      customer=customer,
                      message=text,
                      sender_type='admin'
                 )
 
-            if image_file:
-                if storage:
-                    storage_client = storage.Client()
-                    bucket = storage_client.bucket('JELLO-line-images') # ★ご自身のGCSバケット名
-                    
-                    file_name = f'admin_sent/{uuid.uuid4()}_{image_file.name}'
-                    blob = bucket.blob(file_name)
-                    
-                    blob.upload_from_file(image_file)
-                    image_url = blob.public_url
-
-                    if customer_ine_bot_api and ImageSendMessage:
-                        customer_ine_bot_api.push_message(
-                            customer.line_user_id,
-                            ImageSendMessage(original_content_url=image_url, preview_image_url=image_url)
-                        )
-                    LineMessage.objects.create(
-                         customer=customer,
-                         image_url=image_url,
-                         sender_type='admin'
-                    )
+            if image_url:
+                if line_bot.is_available():
+                    push_to_customer(customer, line_bot.image_message(image_url))
+                LineMessage.objects.create(
+                     customer=customer,
+                     image_url=image_url,
+                     sender_type='admin'
+                )
 
             return Response({'status': 'メッセージを送信しました。'}, status=status.HTTP_200_OK)
 
@@ -1411,8 +1746,9 @@ class AdminCustomerViewSet(viewsets.ModelViewSet):
             
             # 管理者へのLINE通知
             try:
-                send_admin_line_notification(
-                    f"顧客LINE連携URLが生成されました。\n顧客: {customer.name}\n連携URL: {link_url}"
+                queue_staff_alert(
+                    f"顧客LINE連携URLが生成されました。\n顧客: {customer.name}\n連携URL: {link_url}",
+                    alert_type='line_link'
                 )
             except Exception as e:
                 logger.warning(f"管理者LINE通知の送信に失敗しました: {e}")
@@ -1441,8 +1777,9 @@ def admin_me(request):
 # Other Standalone APIViews
 # ==============================================================================
 
-class LineMessageHistoryView(generics.ListAPIView):
+class LineMessageHistoryView(ConditionalGetMixin, FastListMixin, generics.ListAPIView):
     """管理者向けのLINEメッセージ履歴API"""
+    conditional_models = (LineMessage, Customer) + ADMIN_SCOPE_MODELS
     serializer_class = LineMessageSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
@@ -1480,37 +1817,39 @@ class LineMessageHistoryView(generics.ListAPIView):
 @authentication_classes([JWTAuthentication])
 @permission_classes([IsAdminUser])
 def send_bulk_message(request):
+    """
+    LINE連携済みの顧客へ一斉送信する。
+    segment_id（登録済みのセグメント）または criteria（条件の直接指定）で送信先を絞り込める（segments.py）。
+    """
     text = request.data.get('text')
-    image_file = request.FILES.get('image')
-
-    customers = Customer.objects.exclude(line_user_id__isnull=True).exclude(line_user_id='')
+    image_key = request.data.get('image_key')
+    criteria = criteria_from_request(request.data) or {}
 
+    if 'image' in request.FILES:
+        return Response({'error': MULTIPART_IMAGE_ERROR}, status=status.HTTP_400_BAD_REQUEST)
     image_url = None
-    if image_file:
-        if storage:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket('JELLO-line-images')  # ご自身のGCSバケット名
-            file_name = f'admin_bulk/{uuid.uuid4()}_{image_file.name}'
-            blob = bucket.blob(file_name)
-            blob.upload_from_file(image_file)
-            image_url = blob.public_url
-
-    for customer in customers:
+    if image_key:
+        try:
+            image_url = confirm_upload(request, image_key, 'admin_bulk')
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # 送信先は一定件数ずつ読み出す（ブロック・友だち解除された顧客はクエリの段階で除外される）
+    recipients = 0
+    for customer in iter_recipients(criteria):
+        recipients += 1
         try:
             if text:
-                if customer_ine_bot_api and TextSendMessage:
-                    customer_ine_bot_api.push_message(customer.line_user_id, TextSendMessage(text=text))
+                if line_bot.is_available():
+                    push_to_customer(customer, line_bot.text_message(text))
                 LineMessage.objects.create(
                     customer=None,
                     message=text,
                     sender_type='admin'
                 )
             if image_url:
-                if customer_ine_bot_api and ImageSendMessage:
-                    customer_ine_bot_api.push_message(
-                        customer.line_user_id,
-                        ImageSendMessage(original_content_url=image_url, preview_image_url=image_url)
-                    )
+                if line_bot.is_available():
+                    push_to_customer(customer, line_bot.image_message(image_url))
                 LineMessage.objects.create(
                     customer=None,
                     image_url=image_url,
@@ -1518,7 +1857,7 @@ def send_bulk_message(request):
                 )
         except Exception as e:
             logger.error(f"顧客 {customer.id} への一括送信失敗: {e}")
-    return Response({'status': 'ok'}, status=status.HTTP_200_OK)
+    return Response({'status': 'ok', 'recipients': recipients}, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])
@@ -1528,11 +1867,19 @@ def send_staff_notification(request):
     LINE連携した全職員に通知を送信するAPI
     """
     text = request.data.get('text')
-    image_file = request.FILES.get('image')
+    image_key = request.data.get('image_key')
     target_staff_id = request.data.get('target_staff_id')  # 特定の職員に送信する場合
 
-    if not text and not image_file:
+    if 'image' in request.FILES:
+        return Response({'error': MULTIPART_IMAGE_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+    if not text and not image_key:
         return Response({'error': 'テキストまたは画像を指定してください。'}, status=status.HTTP_400_BAD_REQUEST)
+    image_url = None
+    if image_key:
+        try:
+            image_url = confirm_upload(request, image_key, 'staff_notification')
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
         if target_staff_id:
@@ -1550,20 +1897,11 @@ def send_staff_notification(request):
                 if not success:
                     return Response({'error': f'送信失敗: {result}'}, status=status.HTTP_400_BAD_REQUEST)
 
-            if image_file:
-                # 画像をGCSにアップロード
-                if storage:
-                    storage_client = storage.Client()
-                    bucket = storage_client.bucket('JELLO-line-images')
-                    file_name = f'staff_notification/{uuid.uuid4()}_{image_file.name}'
-                    blob = bucket.blob(file_name)
-                    blob.upload_from_file(image_file)
-                    image_url = blob.public_url
-
-                    from .notifications import send_admin_line_image
-                    success, result = send_admin_line_image(image_url)
-                    if not success:
-                        return Response({'error': f'画像送信失敗: {result}'}, status=status.HTTP_400_BAD_REQUEST)
+            if image_url:
+                from .notifications import send_admin_line_image
+                success, result = send_admin_line_image(image_url)
+                if not success:
+                    return Response({'error': f'画像送信失敗: {result}'}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({'status': '通知を送信しました。'}, status=status.HTTP_200_OK)
 
@@ -1585,4 +1923,149 @@ def get_staff_line_status(request):
     except Exception as e:
         logger.error(f"職員ステータス取得中にエラー: {e}", exc_info=True)
         return Response({'error': 'サーバー内部でエラーが発生しました。'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
+
+
+class AdminCustomerSegmentViewSet(viewsets.ModelViewSet):
+    """
+    LINE一斉送信の対象を絞り込む顧客セグメントの登録・編集と、対象件数のプレビュー。
+    登録したセグメントは send-bulk-message の segment_id に指定する。
+    """
+    queryset = CustomerSegment.objects.all()
+    serializer_class = CustomerSegmentSerializer
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        """登録済みセグメントの対象件数"""
+        count, cached = count_preview(self.get_object().criteria)
+        return Response({'count': count, 'cached': cached})
+
+    @action(detail=False, methods=['post'], url_path='preview', url_name='preview-criteria')
+    def preview_criteria(self, request):
+        """保存前の条件（criteria）の対象件数"""
+        criteria = criteria_from_request({'criteria': request.data.get('criteria', {})})
+        count, cached = count_preview(criteria)
+        return Response({'count': count, 'cached': cached})
+
+
+class RequestProfileViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    管理者がオンデマンドで取得したリクエストプロファイルを参照・ダウンロードするAPI。
+    プロファイルは X-Profile: 1 ヘッダーまたは ?_profile=1 を付けたリクエストで記録される。
+    """
+    queryset = RequestProfile.objects.all()
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return RequestProfileSerializer
+        return RequestProfileDetailSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # 一覧ではサイズの大きいスタックとSQLを読み込まない
+            queryset = queryset.defer('stacks', 'queries')
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """プロファイルをファイルとしてダウンロードする（?type=stacks でcollapsed形式のスタックのみ）"""
+        profile = self.get_object()
+        if request.query_params.get('type') == 'stacks':
+            response = HttpResponse(profile.stacks, content_type='text/plain; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="profile-{profile.pk}.collapsed.txt"'
+            return response
+        payload = json.dumps(RequestProfileDetailSerializer(profile).data, ensure_ascii=False, indent=2)
+        response = HttpResponse(payload, content_type='application/json; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile.pk}.json"'
+        return response
+
+
+MULTIPART_IMAGE_ERROR = (
+    '画像はリクエストに含めず、POST /api/admin/uploads/ で発行したURLへ直接アップロードし、'
+    'image_key にオブジェクトキーを指定してください。'
+)
+
+
+class AdminUploadView(APIView):
+    """
+    管理画面から送信する画像のアップロード先を発行するAPI。
+    POST {purpose, content_type} に対し、オブジェクトキーと短時間だけ有効なアップロード用URLを返す。
+    画像はそのURLへ直接PUTし、送信APIには image_key としてオブジェクトキーを渡す。
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def post(self, request):
+        try:
+            upload = issue_upload(request, request.data.get('purpose'), request.data.get('content_type'))
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+
+class LocalUploadView(APIView):
+    """
+    UPLOAD_STORAGE='local' のときに、署名付きURLへのPUTを受け付ける（GCSの代わり）。
+    URLに含まれる署名付きトークンで認可するため、JWT認証は行わない。
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    parser_classes = []
+
+    def put(self, request, token):
+        storage = get_storage()
+        if not isinstance(storage, LocalUploadStorage):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        try:
+            # request.body はサイズ上限（DATA_UPLOAD_MAX_MEMORY_SIZE）があるため、ストリームから読む
+            storage.receive(token, request.content_type, request._request)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_200_OK)
+
+
+class TokenRevokeView(APIView):
+    """
+    ログアウト用API。渡されたリフレッシュトークンと、Authorizationヘッダーのアクセストークンを失効させる。
+    管理者・顧客のどちらのトークンにも使える。
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        raw_refresh = request.data.get('refresh')
+        if not raw_refresh:
+            return Response({'error': 'refresh は必須です。'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            RevocableRefreshToken(raw_refresh).blacklist()
+        except TokenError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # アクセストークンも有効期限を待たずに失効させる
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            try:
+                RevocableAccessToken(header[len('Bearer '):]).blacklist()
+            except TokenError:
+                pass
+        return Response(status=status.HTTP_205_RESET_CONTENT)
+
+
+class MetricsView(APIView):
+    """
+    Prometheus形式のパフォーマンスメトリクスを返すAPI。
+    METRICS_TOKEN を Bearer トークンとして送った場合のみ応答する。
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        expected = settings.METRICS_TOKEN
+        provided = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not expected or not hmac.compare_digest(provided, expected):
+            return HttpResponseForbidden()
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,38 @@
+import api from "./axiosConfig";
+
+// 画像の用途（バックエンドの uploads.UPLOAD_PURPOSES と同じ）
+export type UploadPurpose = "admin_sent" | "admin_bulk" | "staff_notification";
+
+interface UploadTicket {
+  object_key: string;
+  upload_url: string;
+  method: string;
+  headers: Record<string, string>;
+  expires_in: number;
+  max_bytes: number;
+}
+
+/**
+ * 画像をストレージへ直接アップロードし、送信APIに渡すオブジェクトキー（image_key）を返す。
+ * 1. /api/admin/uploads/ で署名付きのアップロード用URLを発行してもらう
+ * 2. そのURLへ画像をPUTする（APIサーバーを経由しない）
+ */
+export async function uploadImage(file: File, purpose: UploadPurpose): Promise<string> {
+  const { data } = await api.post<UploadTicket>("/api/admin/uploads/", {
+    purpose,
+    content_type: file.type,
+  });
+  if (file.size > data.max_bytes) {
+    throw new Error(`画像のサイズは${Math.floor(data.max_bytes / 1024 / 1024)}MBまでです。`);
+  }
+  // 署名付きURLには認証ヘッダーやCSRFトークンを付けないため、axiosのインスタンスではなくfetchを使う
+  const response = await fetch(data.upload_url, {
+    method: data.method,
+    headers: data.headers,
+    body: file,
+  });
+  if (!response.ok) {
+    throw new Error("画像のアップロードに失敗しました。");
+  }
+  return data.object_key;
+}
@@ -16,6 +16,7 @@ interface ReservationDetail {
     end_time: string;
     status: string;
     service_name: string;
+    version: number;
 }
 
 const AdminReservationDetail: React.FC = () => {
@@ -63,10 +64,12 @@ const AdminReservationDetail: React.FC = () => {
       if (!reservation) return;
       if (!window.confirm("この予約を確定しますか？")) return;
       try {
-        await api.post(`/api/admin/reservations/${reservation.reservation_number}/confirm/`);
+        // 表示中のバージョンを送り、他の職員が先に更新していた場合は409で知らせてもらう
+        await api.post(`/api/admin/reservations/${reservation.reservation_number}/confirm/`, { version: reservation.version });
+        await fetchReservation();
+      } catch (err: any) {
+        alert(err.response?.data?.error || "予約の確定処理に失敗しました。");
         await fetchReservation();
-      } catch (err) {
-        alert("予約の確定処理に失敗しました。");
       }
     };
     
@@ -74,10 +77,11 @@ const AdminReservationDetail: React.FC = () => {
       if (!reservation) return;
       if (!window.confirm("この予約をキャンセルしますか？")) return;
       try {
-        await api.post(`/api/admin/reservations/${reservation.reservation_number}/cancel/`);
+        await api.post(`/api/admin/reservations/${reservation.reservation_number}/cancel/`, { version: reservation.version });
+        await fetchReservation();
+      } catch (err: any) {
+        alert(err.response?.data?.error || "予約のキャンセル処理に失敗しました。");
         await fetchReservation();
-      } catch (err) {
-        alert("予約のキャンセル処理に失敗しました。");
       }
     };
 
@@ -3,6 +3,7 @@
 import React, { useState, useEffect, useCallback, useRef } from "react";
 import { useSearchParams, useNavigate } from "react-router-dom";
 import api from "../../api/axiosConfig";
+import { uploadImage } from "../../api/uploads";
 import { useAdminAuth } from '../../context/AdminAuthContext';
 import { format } from "date-fns";
 import {
@@ -106,10 +107,10 @@ const LineHistoryPage: React.FC = () => {
     if (!bulkMessage && !bulkImage) return;
     setIsSending(true);
     try {
-      const formData = new FormData();
-      if (bulkMessage) formData.append("text", bulkMessage);
-      if (bulkImage) formData.append("image", bulkImage);
-      await api.post("/api/admin/send-bulk-message/", formData);
+      const payload: { text?: string; image_key?: string } = {};
+      if (bulkMessage) payload.text = bulkMessage;
+      if (bulkImage) payload.image_key = await uploadImage(bulkImage, "admin_bulk");
+      await api.post("/api/admin/send-bulk-message/", payload);
       alert("全顧客に送信しました");
       setBulkMessage("");
       setBulkImage(null);
@@ -326,7 +327,7 @@ const LineHistoryPage: React.FC = () => {
             />
             <input
               type="file"
-              accept="image/*"
+              accept="image/jpeg,image/png"
               className="mb-2"
               onChange={(e) => setBulkImage(e.target.files?.[0] || null)}
             />
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import api from '../../api/axiosConfig';
+import { uploadImage } from '../../api/uploads';
 import { ArrowLeft, Send, Image as ImageIcon, XCircle } from 'lucide-react';
 
 const SendLineMessage: React.FC = () => {
@@ -60,27 +61,21 @@ const SendLineMessage: React.FC = () => {
     
     setIsSending(true);
     
-    const formData = new FormData();
-    
-    // ▼▼▼【ここを修正】▼▼▼
-    // バックエンドの`request.data.get('text')`に合わせてキーを'text'に変更
-    if (message.trim()) {
-      formData.append('text', message);
-    }
-    // ▲▲▲【修正ここまで】▲▲▲
-    
-    if (imageFile) {
-      formData.append('image', imageFile);
-    }
-
     try {
-      // axiosConfigでContent-Typeは自動設定されるので、ここでは指定不要
-      await api.post(`/api/admin/customers/${customerId}/send-message/`, formData);
+      // 画像はストレージへ直接アップロードし、送信APIにはオブジェクトキーだけを渡す
+      const payload: { text?: string; image_key?: string } = {};
+      if (message.trim()) {
+        payload.text = message;
+      }
+      if (imageFile) {
+        payload.image_key = await uploadImage(imageFile, 'admin_sent');
+      }
+      await api.post(`/api/admin/customers/${customerId}/send-message/`, payload);
       alert('メッセージを送信しました。');
       navigate(`/admin/customers/${customerId}`);
     } catch (error: any) {
-      console.error("メッセージ送信エラー:", error.response);
-      alert(`メッセージの送信に失敗しました: ${error.response?.data?.error || 'サーバーエラー'}`);
+      console.error("メッセージ送信エラー:", error.response ?? error);
+      alert(`メッセージの送信に失敗しました: ${error.response?.data?.error || error.message || 'サーバーエラー'}`);
     } finally {
       setIsSending(false);
     }
@@ -110,7 +105,7 @@ const SendLineMessage: React.FC = () => {
           <ImageIcon size={20} />
           画像を添付する
         </label>
-        <input id="image-upload" type="file" accept="image/*" onChange={handleImageChange} className="hidden"/>
+        <input id="image-upload" type="file" accept="image/jpeg,image/png" onChange={handleImageChange} className="hidden"/>
       </div>
 
       {/* 画像プレビュー */}